@@ -0,0 +1,49 @@
+from asgiref.sync import sync_to_async
+
+from config.async_api import async_read_view, render
+from config.conditional import async_conditional
+from config.fieldsets import requested_fields, select_fields
+from blogs.models import BlogPost
+from blogs.serializer import BlogPostListSerializer, BlogPostSerializer
+from blogs.views import BlogPostDetailView, BlogPostListCreateView, post_validators
+
+"""
+
+Async versions of the public blog reads, used when ASYNC_READ_VIEWS is on.
+They return the same data as the DRF views; other methods go to those views.
+
+"""
+
+
+_sync_list = sync_to_async(BlogPostListCreateView.as_view())
+_sync_detail = sync_to_async(BlogPostDetailView.as_view())
+
+
+@async_read_view(BlogPostListCreateView.as_view())
+async def blog_post_list(request):
+    # Tag filters and keyset pages are served by the DRF view
+    if "tag" in request.GET or "cursor" in request.GET:
+        return await _sync_list(request)
+    fields = requested_fields(request.GET, BlogPostListSerializer)
+    posts = select_fields(
+        BlogPost.objects.published().order_by("-created_at"),
+        BlogPostListSerializer,
+        fields,
+    )
+    posts = [post async for post in posts]
+    serializer = BlogPostListSerializer(posts, many=True, context={"fields": fields})
+    return render(serializer.data)
+
+
+@async_conditional(post_validators)
+@async_read_view(BlogPostDetailView.as_view())
+async def blog_post_detail(request, pk):
+    fields = requested_fields(request.GET, BlogPostSerializer)
+    posts = BlogPost.objects.published().filter(pk=pk)
+    post = await select_fields(posts, BlogPostSerializer, fields).afirst()
+    if post is None:
+        # Drafts are shown to their author only, which the DRF view checks
+        return await _sync_detail(request, pk=pk)
+    serializer = BlogPostSerializer(post, context={"fields": fields})
+    data = await sync_to_async(lambda: serializer.data)()
+    return render(data)
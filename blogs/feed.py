@@ -0,0 +1,204 @@
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from blogs.models import BlogPost, TimelineEntry
+from blogs.pagination import after
+from config import background
+from users.models import Follow, Profile
+
+logger = logging.getLogger(__name__)
+
+"""
+
+Home feeds: the posts of the authors a user follows, newest first.
+
+A newly published post is copied to the timeline of every follower of its
+author (fan-out on write) by a background job once the post is committed, in
+batches of FEED_FANOUT_BATCH rows. Authors with FEED_FANOUT_LIMIT followers
+or more are skipped: copying their posts would cost a row per follower, so
+their posts are read from BlogPost when the feed is built (fan-out on read).
+
+A feed page reads the next FEED_PAGE_SIZE timeline keys after the cursor
+(one scan of the timeline_page index, keeping the authors the user still
+follows), merges in the posts of followed high-fanout authors from the same
+position, and loads the posts by id. When an author falls back under the
+limit, their newest FEED_BACKFILL posts are fanned out again. The
+cursor is the (created_at, post id) of the last post of the page, so a page
+costs the same however deep it is.
+
+"""
+
+
+# Authors whose posts are read at feed time instead of being copied
+def is_high_fanout(author_id):
+    return Profile.objects.filter(
+        user_id=author_id, followers_count__gte=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+def _entries(post_ids, follower_ids):
+    posts = BlogPost.objects.filter(pk__in=post_ids).values_list(
+        "pk", "author_id", "created_at"
+    )
+    return [
+        TimelineEntry(
+            user_id=follower_id, post_id=pk, author_id=author_id, created_at=created_at
+        )
+        for pk, author_id, created_at in posts
+        for follower_id in follower_ids
+    ]
+
+
+# Copy posts to the timelines of their authors' followers; returns the rows written
+def fan_out_posts(post_ids):
+    posts_by_author = {}
+    for pk, author_id in (
+        BlogPost.objects.published()
+        .filter(pk__in=post_ids)
+        .values_list("pk", "author_id")
+    ):
+        posts_by_author.setdefault(author_id, []).append(pk)
+
+    written = 0
+    for author_id, author_posts in posts_by_author.items():
+        if is_high_fanout(author_id):
+            continue
+        last_follower = 0
+        while True:
+            # Keyset over the follow_fanout index, one batch at a time; the
+            # posts of one author share the scan of their followers
+            followers = list(
+                Follow.objects.filter(
+                    followee_id=author_id, follower_id__gt=last_follower
+                )
+                .order_by("follower_id")
+                .values_list("follower_id", flat=True)[: settings.FEED_FANOUT_BATCH]
+            )
+            if not followers:
+                break
+            TimelineEntry.objects.bulk_create(
+                _entries(author_posts, followers), ignore_conflicts=True
+            )
+            written += len(followers) * len(author_posts)
+            last_follower = followers[-1]
+    return written
+
+
+def _run_in_background(post_ids):
+    try:
+        fan_out_posts(post_ids)
+    except Exception:
+        logger.exception("Could not fan out posts %s", post_ids)
+
+
+# Queue the fan-out of newly published posts once the current transaction commits
+def schedule_fan_out(post_ids):
+    post_ids = list(post_ids)
+    if settings.FEED_FANOUT == "inline":
+        transaction.on_commit(lambda: fan_out_posts(post_ids))
+    else:
+        transaction.on_commit(
+            lambda: background.submit(
+                "feed-fanout",
+                _run_in_background,
+                post_ids,
+                workers=settings.FEED_FANOUT_WORKERS,
+            )
+        )
+
+
+# A post that is no longer published leaves every timeline
+def remove_post(post_id):
+    TimelineEntry.objects.filter(post_id=post_id).delete()
+
+
+def _count_followers(followee_id, delta):
+    Profile.objects.filter(user_id=followee_id).update(
+        followers_count=F("followers_count") + delta, updated_at=timezone.now()
+    )
+
+
+# Ids of the author's newest published posts
+def _recent_posts(author_id):
+    recent = BlogPost.objects.published().filter(author_id=author_id)
+    recent = recent.order_by("-created_at")
+    return list(recent.values_list("pk", flat=True)[: settings.FEED_BACKFILL])
+
+
+# Returns False if the user already followed the author
+def follow(follower, followee):
+    try:
+        with transaction.atomic():
+            Follow.objects.create(follower=follower, followee=followee)
+            _count_followers(followee.pk, 1)
+    except IntegrityError:
+        return False
+
+    # The newest posts of the author show up in the feed right away
+    if not is_high_fanout(followee.pk):
+        TimelineEntry.objects.bulk_create(
+            _entries(_recent_posts(followee.pk), [follower.pk]), ignore_conflicts=True
+        )
+    return True
+
+
+# Returns False if the user did not follow the author
+def unfollow(follower, followee):
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(
+            follower=follower, followee=followee
+        ).delete()
+        if not deleted:
+            return False
+        _count_followers(followee.pk, -1)
+        TimelineEntry.objects.filter(user=follower, author=followee).delete()
+        # Back under the limit, the author's posts are no longer read at feed
+        # time; those published above it were never copied, so the newest are
+        # fanned out now (the row is locked, one unfollow sees the crossing)
+        followers = Profile.objects.filter(user_id=followee.pk).values_list(
+            "followers_count", flat=True
+        )
+        if followers.first() == settings.FEED_FANOUT_LIMIT - 1:
+            schedule_fan_out(_recent_posts(followee.pk))
+    return True
+
+
+# One page of the user's feed: (posts, cursor of the next page or None);
+# the posts are loaded from `posts`, a queryset choosing their columns
+def feed_page(user, cursor=None, size=None, posts=None):
+    size = size or settings.FEED_PAGE_SIZE
+    # Only the authors followed now: a fan-out that read the followers before an
+    # unfollow can write its entries after the unfollow removed them
+    followed = Follow.objects.filter(follower=user).values("followee_id")
+    timeline = TimelineEntry.objects.filter(user=user, author_id__in=followed)
+    timeline = after(timeline, cursor, "post_id")
+    keys = set(
+        timeline.order_by("-created_at", "-post_id").values_list(
+            "created_at", "post_id"
+        )[:size]
+    )
+
+    high_fanout = list(
+        Follow.objects.filter(
+            follower=user,
+            followee__profile__followers_count__gte=settings.FEED_FANOUT_LIMIT,
+        ).values_list("followee_id", flat=True)
+    )
+    if high_fanout:
+        recent = BlogPost.objects.published().filter(author_id__in=high_fanout)
+        recent = after(recent, cursor)
+        keys.update(
+            recent.order_by("-created_at", "-id").values_list("created_at", "id")[:size]
+        )
+
+    keys = sorted(keys, reverse=True)[:size]
+    if posts is None:
+        posts = BlogPost.objects.with_stats()
+    posts = posts.published().in_bulk([post_id for _, post_id in keys])
+    page = [posts[post_id] for _, post_id in keys if post_id in posts]
+    next_cursor = keys[-1] if len(keys) == size else None
+    return page, next_cursor
@@ -0,0 +1,139 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from config.shmcache import SharedMemoryCache
+
+"""
+
+Compares the shared-memory cache (config/shmcache.py) with LocMemCache and
+FileBasedCache.
+
+For each backend, one process first measures get (hit) and set throughput.
+Then --processes forked processes, standing in for gunicorn workers, read
+keys from a Zipf-like key space cache-aside: a miss builds the value and sets
+it. A per-process cache (LocMem) has to warm up in every process, so its hit
+ratio drops with the number of workers; shared caches warm up once.
+
+Example:
+    python manage.py bench_cache --processes 4 --operations 20000
+
+"""
+
+
+def _backends(directory, options):
+    entries = options["keys"] * 2
+    return {
+        "locmem": lambda: LocMemCache(
+            "bench", {"OPTIONS": {"MAX_ENTRIES": entries}, "TIMEOUT": None}
+        ),
+        "filebased": lambda: FileBasedCache(
+            os.path.join(directory, "files"),
+            {"OPTIONS": {"MAX_ENTRIES": entries}, "TIMEOUT": None},
+        ),
+        "shared_memory": lambda: SharedMemoryCache(
+            os.path.join(directory, "cache.mmap"),
+            {
+                "OPTIONS": {
+                    "MAX_ENTRIES": entries,
+                    "MAX_ENTRY_SIZE": options["value_size"] + 512,
+                },
+                "TIMEOUT": None,
+            },
+        ),
+    }
+
+
+def _rate(count, started):
+    return round(count / (time.perf_counter() - started))
+
+
+def _worker(make_cache, options, seed, results):
+    cache = make_cache()
+    rng = random.Random(seed)
+    keys = options["keys"]
+    value = "x" * options["value_size"]
+    hits = 0
+    started = time.perf_counter()
+    for _ in range(options["operations"]):
+        # Low keys are requested far more often than high ones
+        key = f"post:{int(keys ** rng.random()) - 1}"
+        if cache.get(key) is None:
+            cache.set(key, value)
+        else:
+            hits += 1
+    results.put((options["operations"], time.perf_counter() - started, hits))
+
+
+class Command(BaseCommand):
+    help = "Benchmark the shared-memory cache against LocMemCache and FileBasedCache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--operations", type=int, default=20000)
+        parser.add_argument("--keys", type=int, default=5000)
+        parser.add_argument("--value-size", type=int, default=1024)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context("fork")
+        directory = tempfile.mkdtemp(prefix="bench-cache-")
+        report = {
+            "processes": options["processes"],
+            "operations": options["operations"],
+            "keys": options["keys"],
+            "value_size": options["value_size"],
+            "backends": {},
+        }
+        try:
+            for name, make_cache in _backends(directory, options).items():
+                cache = make_cache()
+                cache.clear()
+                value = "x" * options["value_size"]
+                count = min(options["operations"], options["keys"])
+
+                started = time.perf_counter()
+                for number in range(count):
+                    cache.set(f"warm:{number}", value)
+                set_rate = _rate(count, started)
+                started = time.perf_counter()
+                for number in range(count):
+                    cache.get(f"warm:{number}")
+                get_rate = _rate(count, started)
+                cache.clear()
+
+                results = context.Queue()
+                workers = [
+                    context.Process(
+                        target=_worker, args=(make_cache, options, seed, results)
+                    )
+                    for seed in range(options["processes"])
+                ]
+                for worker in workers:
+                    worker.start()
+                totals = [results.get() for _ in workers]
+                for worker in workers:
+                    worker.join()
+
+                operations = sum(total[0] for total in totals)
+                report["backends"][name] = {
+                    "set_ops_s": set_rate,
+                    "get_ops_s": get_rate,
+                    "shared_ops_s": round(
+                        operations / max(total[1] for total in totals)
+                    ),
+                    "shared_hit_ratio": round(
+                        sum(total[2] for total in totals) / operations, 3
+                    ),
+                }
+                cache.clear()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.stdout.write(json.dumps(report, indent=2))
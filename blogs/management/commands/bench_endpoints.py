@@ -0,0 +1,127 @@
+import io
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from blogs.models import BlogPost
+
+"""
+
+Measures the latency of the blog list and detail endpoints with different
+database connection settings.
+
+Requests go through the real WSGI handler in this process (not the test client),
+so request_started/request_finished close or keep the connection exactly as a
+gunicorn worker would. With CONN_MAX_AGE=0 every request pays for a new
+connection (TCP, TLS and authentication); with a positive value it is reused.
+
+Example:
+    python manage.py bench_endpoints --requests 500 --conn-max-age 0 60
+
+"""
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# Latency summary in milliseconds
+def summarize(latencies):
+    return {
+        "requests": len(latencies),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmark the blog endpoints under different connection settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--conn-max-age",
+            type=int,
+            nargs="+",
+            default=[0, 60],
+            help="CONN_MAX_AGE values to compare (ignored when DB_POOL is on)",
+        )
+        parser.add_argument("--path", action="append", help="Extra path to request")
+
+    def handle(self, *args, **options):
+        post = BlogPost.objects.order_by("pk").first()
+        if post is None:
+            raise CommandError("Create at least one post first (e.g. with seed data)")
+        paths = ["/api/blogs/", f"/api/blogs/{post.pk}/"] + (options["path"] or [])
+
+        database = connections["default"].settings_dict
+        if database.get("OPTIONS", {}).get("pool"):
+            modes = [("pool", None)]
+        else:
+            modes = [(f"conn_max_age={age}", age) for age in options["conn_max_age"]]
+
+        handler = WSGIHandler()
+        original_age = database["CONN_MAX_AGE"]
+        report = {}
+        try:
+            for label, age in modes:
+                if age is not None:
+                    database["CONN_MAX_AGE"] = age
+                connections.close_all()
+                report[label] = {
+                    path: summarize(self.run(handler, path, options["requests"]))
+                    for path in paths
+                }
+        finally:
+            database["CONN_MAX_AGE"] = original_age
+            connections.close_all()
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, handler, path, count):
+        host = next(
+            (h.lstrip(".") for h in settings.ALLOWED_HOSTS if h != "*"), "localhost"
+        )
+
+        # One warm-up request so imports and URL resolving are not measured
+        self.request(handler, path, host)
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            status = self.request(handler, path, host)
+            latencies.append(time.perf_counter() - started)
+            if not status.startswith("200"):
+                raise CommandError(f"{path} answered {status}")
+        return latencies
+
+    def request(self, handler, path, host):
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": host,
+            "SERVER_PORT": "80",
+            "HTTP_HOST": host,
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(b""),
+            "wsgi.errors": io.StringIO(),
+        }
+        result = {}
+
+        def start_response(status, headers, exc_info=None):
+            result["status"] = status
+
+        response = handler(environ, start_response)
+        b"".join(response)
+        response.close()
+        return result["status"]
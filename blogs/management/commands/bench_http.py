@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand
+
+from blogs.management.commands.bench_endpoints import summarize
+
+"""
+
+Concurrency benchmark against a running server, to compare deployments side by
+side (for example gunicorn sync workers against uvicorn workers with
+ASYNC_READ_VIEWS=1). Every client thread requests the given paths in turn for
+--duration seconds; the report gives throughput and latency per path as JSON.
+
+Example:
+    python manage.py bench_http --url http://127.0.0.1:8000 --concurrency 64 \\
+        --path /api/blogs/ --path /api/blogs/1/ --path /api/blogs/1/comments/
+
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure throughput and latency of a running server under concurrency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--path", action="append", required=True)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument("--timeout", type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        paths = options["path"]
+        latencies = {path: [] for path in paths}
+        errors = {path: 0 for path in paths}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def client(offset):
+            index = offset
+            while time.monotonic() < deadline:
+                path = paths[index % len(paths)]
+                index += 1
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(
+                        options["url"] + path, timeout=options["timeout"]
+                    ) as response:
+                        response.read()
+                    ok = True
+                except (urllib.error.URLError, OSError):
+                    ok = False
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if ok:
+                        latencies[path].append(elapsed)
+                    else:
+                        errors[path] += 1
+
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=client, args=(number,))
+            for number in range(options["concurrency"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        report = {
+            "url": options["url"],
+            "concurrency": options["concurrency"],
+            "duration_s": round(elapsed, 2),
+            "throughput_rps": round(sum(map(len, latencies.values())) / elapsed, 1),
+            "paths": {
+                path: dict(
+                    summarize(values) if values else {"requests": 0},
+                    errors=errors[path],
+                )
+                for path, values in latencies.items()
+            },
+        }
+        self.stdout.write(json.dumps(report, indent=2))
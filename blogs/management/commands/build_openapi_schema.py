@@ -0,0 +1,32 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from config.openapi import generate_schema
+
+"""
+
+Writes the OpenAPI schema to OPENAPI_SCHEMA_FILE (or --output), so workers
+serve it without introspecting the API. Run it at image build time; the file
+must be rebuilt whenever a view or serializer changes.
+
+"""
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema file served on /swagger.json"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=settings.OPENAPI_SCHEMA_FILE)
+
+    def handle(self, *args, **options):
+        content = generate_schema()
+        path = options["output"]
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(content)
+        os.replace(temporary, path)
+        self.stdout.write(
+            self.style.SUCCESS(f"Wrote {len(content)} bytes of schema to {path}")
+        )
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+
+from blogs.models import BlogPost, Rating
+from blogs.transfer import dump_record
+from comments.models import Comments
+
+"""
+
+Streams every post, comment, like and rating to a JSONL file in the format of
+blogs/transfer.py, for import_blog on another site.
+Rows come from server-side cursors (.iterator()), one model after the other,
+so memory use does not grow with the size of the site.
+
+Example:
+    python manage.py export_users -o users.jsonl
+    python manage.py export_blog -o blog.jsonl
+
+"""
+
+
+def _querysets():
+    return [
+        (
+            "post",
+            BlogPost.objects.order_by("pk").values_list(
+                "pk",
+                "author__username",
+                "title",
+                "content",
+                "tags",
+                "status",
+                "publish_at",
+                "created_at",
+                "updated_at",
+            ),
+        ),
+        (
+            "comment",
+            Comments.objects.order_by("pk").values_list(
+                "pk",
+                "blog_id",
+                "author__username",
+                "parent_id",
+                "content",
+                "created_at",
+            ),
+        ),
+        (
+            "like",
+            BlogPost.likes.through.objects.order_by("pk").values_list(
+                "blogpost_id", "user__username"
+            ),
+        ),
+        (
+            "rating",
+            Rating.objects.order_by("pk").values_list(
+                "blog_id", "user__username", "score"
+            ),
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Export posts, comments, likes and ratings as JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", "-o", help="Output file (standard output by default)"
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        output = (
+            open(options["output"], "w", encoding="utf-8")
+            if options["output"]
+            else self.stdout
+        )
+        counts = {}
+        try:
+            for record_type, rows in _querysets():
+                count = 0
+                for row in rows.iterator(chunk_size=options["chunk_size"]):
+                    output.write(dump_record(record_type, row))
+                    count += 1
+                counts[record_type] = count
+        finally:
+            if output is not self.stdout:
+                output.close()
+
+        self.stderr.write(
+            "Exported "
+            + ", ".join(f"{count} {name}s" for name, count in counts.items())
+        )
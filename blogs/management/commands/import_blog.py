@@ -0,0 +1,212 @@
+import os
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries, transaction
+
+from blogs.models import BlogPost, ImportedRow, ImportRun, Rating, Tag
+from blogs.rendering import render_post
+from blogs.transfer import allocate_ids, keep_timestamps, read_chunks
+from comments.models import Comments
+
+User = get_user_model()
+
+"""
+
+Bulk import of the JSONL file written by export_blog (see blogs/transfer.py).
+
+The file is read as a stream, in chunks of --chunk-size records of one type.
+Each chunk is one transaction that creates its rows with bulk_create, records
+the new ids of posts and comments in ImportedRow and moves the run's offset
+past the chunk. If the import stops, running it again with the same file (or
+--run name) resumes after the last committed chunk.
+
+New ids are taken from the table sequences before the rows are inserted, so
+a reply in the same chunk as its parent points to it directly; the parent
+foreign key is checked when the transaction commits. Rows whose user is
+unknown (or whose post or parent comment was skipped) are skipped.
+bulk_create sends no signals, so the contents are rendered and the tag
+counts updated here, and imported posts are not copied to existing timelines.
+
+"""
+
+
+class Command(BaseCommand):
+    help = "Import posts, comments, likes and ratings from an export_blog file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSONL file written by export_blog")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--run",
+            help="Name of the import to resume (the absolute path by default)",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Forget the progress of an earlier run (rows it created are kept)",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+
+        name = options["run"] or os.path.abspath(path)
+        if options["restart"]:
+            ImportRun.objects.filter(name=name).delete()
+        run, _ = ImportRun.objects.get_or_create(name=name)
+        if run.finished:
+            self.stdout.write(
+                f"{path} was already imported; use --restart to import again"
+            )
+            return
+        if run.offset:
+            self.stdout.write(
+                f"Resuming at byte {run.offset} ({run.imported} rows done)"
+            )
+
+        with open(path, "rb") as handle, keep_timestamps(BlogPost, Comments):
+            handle.seek(run.offset)
+            for record_type, records, end in read_chunks(handle, options["chunk_size"]):
+                importer = getattr(self, f"import_{record_type}s", None)
+                if importer is None:
+                    raise CommandError(f"Unknown record type: {record_type}")
+                with transaction.atomic():
+                    imported = importer(run, records)
+                    run.offset = end
+                    run.imported += imported
+                    run.skipped += len(records) - imported
+                    run.save()
+                # With DEBUG on, every bulk INSERT would stay in connection.queries
+                reset_queries()
+                self.stdout.write(
+                    f"Imported {run.imported} rows ({run.skipped} skipped)"
+                )
+
+        # The id map is only needed while the file is being read
+        with transaction.atomic():
+            ImportedRow.objects.filter(run=run).delete()
+            run.finished = True
+            run.save()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {run.imported} rows imported, {run.skipped} skipped"
+            )
+        )
+
+    def user_ids(self, names):
+        return dict(
+            User.objects.filter(username__in=set(names)).values_list("username", "pk")
+        )
+
+    # New ids of the given exported ids, one query per chunk
+    def new_ids(self, run, model, old_ids):
+        return dict(
+            ImportedRow.objects.filter(
+                run=run, model=model, old_id__in=set(old_ids)
+            ).values_list("old_id", "new_id")
+        )
+
+    def remember(self, run, model, pairs):
+        ImportedRow.objects.bulk_create(
+            ImportedRow(run=run, model=model, old_id=old_id, new_id=new_id)
+            for old_id, new_id in pairs
+        )
+
+    def import_posts(self, run, records):
+        users = self.user_ids(record["author"] for record in records)
+        records = [record for record in records if record["author"] in users]
+        if not records:
+            return 0
+        ids = allocate_ids(BlogPost, len(records))
+        posts = [
+            BlogPost(
+                pk=new_id,
+                author_id=users[record["author"]],
+                title=record["title"],
+                content=record["content"],
+                tags=record.get("tags") or [],
+                status=record.get("status") or BlogPost.PUBLISHED,
+                publish_at=record.get("publish_at"),
+                created_at=record["created_at"],
+                updated_at=record["updated_at"],
+            )
+            for record, new_id in zip(records, ids)
+        ]
+        for post in posts:
+            render_post(post)
+        BlogPost.objects.bulk_create(posts)
+        self.remember(run, "post", zip((record["id"] for record in records), ids))
+        Tag.add_counts(
+            Counter(
+                tag for post in posts if post.is_published for tag in set(post.tags)
+            )
+        )
+        return len(posts)
+
+    def import_comments(self, run, records):
+        users = self.user_ids(record["author"] for record in records)
+        posts = self.new_ids(run, "post", (record["post"] for record in records))
+        parents = self.new_ids(
+            run, "comment", (record["parent"] for record in records if record["parent"])
+        )
+        records = [
+            record
+            for record in records
+            if record["author"] in users and record["post"] in posts
+        ]
+        if not records:
+            return 0
+
+        comments, pairs = [], []
+        for record, new_id in zip(records, allocate_ids(Comments, len(records))):
+            parent_id = record["parent"]
+            if parent_id is not None:
+                # Parents come first, from an earlier chunk or earlier in this one
+                parent_id = parents.get(parent_id)
+                if parent_id is None:
+                    continue
+            parents[record["id"]] = new_id
+            pairs.append((record["id"], new_id))
+            comments.append(
+                Comments(
+                    pk=new_id,
+                    blog_id=posts[record["post"]],
+                    author_id=users[record["author"]],
+                    parent_id=parent_id,
+                    content=record["content"],
+                    created_at=record["created_at"],
+                )
+            )
+        Comments.objects.bulk_create(comments)
+        self.remember(run, "comment", pairs)
+        return len(comments)
+
+    def import_likes(self, run, records):
+        Like = BlogPost.likes.through
+        users = self.user_ids(record["user"] for record in records)
+        posts = self.new_ids(run, "post", (record["post"] for record in records))
+        likes = [
+            Like(blogpost_id=posts[record["post"]], user_id=users[record["user"]])
+            for record in records
+            if record["user"] in users and record["post"] in posts
+        ]
+        Like.objects.bulk_create(likes, ignore_conflicts=True)
+        return len(likes)
+
+    def import_ratings(self, run, records):
+        users = self.user_ids(record["user"] for record in records)
+        posts = self.new_ids(run, "post", (record["post"] for record in records))
+        ratings = [
+            Rating(
+                blog_id=posts[record["post"]],
+                user_id=users[record["user"]],
+                score=record["score"],
+            )
+            for record in records
+            if record["user"] in users and record["post"] in posts
+        ]
+        Rating.objects.bulk_create(ratings, ignore_conflicts=True)
+        return len(ratings)
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries
+
+from blogs.models import BlogPost, PostTerm
+from blogs.related import build_index, index_posts
+
+"""
+
+Builds the related posts index (see blogs/related.py).
+
+Without options the whole index is built again, with the idf values of the
+current posts; run it after large imports or now and then as the vocabulary
+drifts. --missing only adds the published posts that are not indexed yet
+(posts written by seed_blog or import_blog), and --post updates given posts,
+the same way as the background updates after an edit.
+
+Examples:
+    python manage.py index_related
+    python manage.py index_related --missing --batch-size 200
+    python manage.py index_related --post 12 --post 15
+
+"""
+
+
+class Command(BaseCommand):
+    help = "Build or update the related posts index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--missing", action="store_true")
+        parser.add_argument("--post", type=int, action="append", default=[])
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options["post"]:
+            indexed = index_posts(options["post"])
+        elif options["missing"]:
+            indexed = self.index_missing(options["batch_size"])
+        else:
+            indexed = build_index()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Indexed {indexed} posts in {elapsed:.1f}s")
+
+    def index_missing(self, batch_size):
+        indexed = 0
+        missing = (
+            BlogPost.objects.published()
+            .exclude(pk__in=PostTerm.objects.values("post_id"))
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        last = 0
+        while True:
+            post_ids = list(missing.filter(pk__gt=last)[:batch_size])
+            if not post_ids:
+                return indexed
+            # Posts without a word of their own stay missing; the keyset moves on
+            indexed += index_posts(post_ids)
+            last = post_ids[-1]
+            reset_queries()
@@ -0,0 +1,248 @@
+import http.client
+import json
+import random
+import subprocess
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from blogs.management.commands.bench_endpoints import summarize
+from blogs.management.commands.seed_blog import zipf_weights
+from blogs.models import BlogPost
+
+User = get_user_model()
+
+"""
+
+Load driver for a running server, meant to be used on a seed_blog dataset.
+
+Each client thread logs in as a random seeded user and then replays a weighted
+mix of the real endpoints for --duration seconds, keeping its HTTP connection
+open between requests. Posts are picked with the same Zipf skew as the data,
+so the popular posts get most of the reads. The JSON report (throughput and
+p50/p95/p99 per endpoint, plus the git commit) can be saved with --output and
+compared between runs.
+
+Example:
+    python manage.py load_test --url http://127.0.0.1:8000 --concurrency 32 \\
+        --duration 60 --mix list=20,detail=35,comments=25,like=5,rate=5,login=5,refresh=5
+
+"""
+
+DEFAULT_MIX = "list=20,detail=35,comments=25,like=5,rate=5,login=5,refresh=5"
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in Client.ENDPOINTS:
+            raise CommandError(f"Unknown endpoint in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# One simulated reader, with its own keep-alive connection and tokens
+class Client:
+    ENDPOINTS = ("list", "detail", "comments", "like", "rate", "login", "refresh")
+
+    def __init__(self, url, timeout, username, password, rng):
+        parts = urlsplit(url)
+        connection_class = (
+            http.client.HTTPSConnection
+            if parts.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.connect = lambda: connection_class(parts.netloc, timeout=timeout)
+        self.connection = self.connect()
+        self.prefix = parts.path.rstrip("/")
+        self.credentials = {"username": username, "password": password}
+        self.rng = rng
+        self.access = self.refresh_token = None
+
+    def request(self, method, path, body=None, auth=False):
+        headers = {"Accept": "application/json"}
+        if body is not None:
+            body = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        if auth and self.access:
+            headers["Authorization"] = f"Bearer {self.access}"
+        # A server that closes idle connections (gunicorn sync workers) gets a fresh one
+        for attempt in (1, 2):
+            try:
+                self.connection.request(method, self.prefix + path, body, headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                if response.getheader("Connection", "").lower() == "close":
+                    self.connection.close()
+                return response.status, data
+            except (http.client.HTTPException, ConnectionError):
+                self.connection.close()
+                self.connection = self.connect()
+                if attempt == 2:
+                    raise
+
+    def login(self):
+        status, data = self.request("POST", "/api/auth/login/", self.credentials)
+        if status == 200:
+            tokens = json.loads(data)
+            self.access, self.refresh_token = tokens["access"], tokens["refresh"]
+        return status
+
+    def refresh(self):
+        status, data = self.request(
+            "POST", "/api/auth/token/refresh/", {"refresh": self.refresh_token}
+        )
+        if status == 200:
+            tokens = json.loads(data)
+            self.access = tokens["access"]
+            # Rotated refresh tokens replace the old one, which is blacklisted
+            self.refresh_token = tokens.get("refresh", self.refresh_token)
+        return status
+
+    def run(self, endpoint, post_id):
+        if endpoint == "list":
+            return self.request("GET", "/api/blogs/")[0]
+        if endpoint == "detail":
+            return self.request("GET", f"/api/blogs/{post_id}/")[0]
+        if endpoint == "comments":
+            return self.request("GET", f"/api/blogs/{post_id}/comments/")[0]
+        if endpoint == "like":
+            return self.request("POST", f"/api/blogs/{post_id}/like/", {}, auth=True)[0]
+        if endpoint == "rate":
+            score = self.rng.randint(1, 5)
+            return self.request(
+                "POST", f"/api/blogs/{post_id}/rate/", {"score": score}, auth=True
+            )[0]
+        if endpoint == "login":
+            return self.login()
+        return self.refresh()
+
+
+class Command(BaseCommand):
+    help = "Replay a weighted mix of the API endpoints against a running server"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=30.0)
+        parser.add_argument("--timeout", type=float, default=30.0)
+        parser.add_argument("--mix", default=DEFAULT_MIX)
+        parser.add_argument("--prefix", default="seed", help="As given to seed_blog")
+        parser.add_argument("--password", default="Seed-pass-123!")
+        parser.add_argument("--skew", type=float, default=1.1)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Also write the report to this file")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options["mix"])
+        usernames = list(
+            User.objects.filter(username__startswith=f"{options['prefix']}_")
+            .order_by("pk")
+            .values_list("username", flat=True)
+        )
+        # Ranked like seed_blog ranked them, so the skew hits the same posts
+        post_ids = list(
+            BlogPost.objects.filter(
+                author__username__startswith=f"{options['prefix']}_"
+            )
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        if not usernames or not post_ids:
+            raise CommandError("No seeded data found, run seed_blog first")
+
+        endpoints, weights = list(mix), list(mix.values())
+        post_weights = zipf_weights(len(post_ids), options["skew"])
+        latencies = {endpoint: [] for endpoint in endpoints}
+        statuses = {endpoint: {} for endpoint in endpoints}
+        lock = threading.Lock()
+        clock = {}
+
+        # The clock starts once every client has logged in
+        def start_clock():
+            clock["started"] = time.monotonic()
+            clock["deadline"] = clock["started"] + options["duration"]
+
+        ready = threading.Barrier(options["concurrency"], action=start_clock)
+
+        def worker(number):
+            rng = random.Random(options["seed"] * 1000003 + number)
+            client = Client(
+                options["url"],
+                options["timeout"],
+                rng.choice(usernames),
+                options["password"],
+                rng,
+            )
+            # Logging in first is part of the setup, not of the measured mix
+            try:
+                client.login()
+            except (OSError, http.client.HTTPException):
+                pass
+            ready.wait()
+            while time.monotonic() < clock["deadline"]:
+                endpoint = rng.choices(endpoints, weights)[0]
+                post_id = rng.choices(post_ids, cum_weights=post_weights)[0]
+                started = time.perf_counter()
+                try:
+                    status = client.run(endpoint, post_id)
+                except (OSError, http.client.HTTPException):
+                    status = "error"
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies[endpoint].append(elapsed)
+                    counts = statuses[endpoint]
+                    counts[str(status)] = counts.get(str(status), 0) + 1
+                # An expired access token is renewed like a real client would
+                if status == 401:
+                    try:
+                        client.login()
+                    except (OSError, http.client.HTTPException):
+                        pass
+
+        threads = [
+            threading.Thread(target=worker, args=(number,))
+            for number in range(options["concurrency"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - clock["started"]
+
+        report = {
+            "commit": git_commit(),
+            "url": options["url"],
+            "concurrency": options["concurrency"],
+            "mix": mix,
+            "duration_s": round(elapsed, 2),
+            "throughput_rps": round(sum(map(len, latencies.values())) / elapsed, 1),
+            "endpoints": {
+                endpoint: dict(
+                    summarize(values) if values else {"requests": 0},
+                    statuses=statuses[endpoint],
+                )
+                for endpoint, values in latencies.items()
+            },
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        self.stdout.write(output)
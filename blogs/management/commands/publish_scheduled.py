@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from blogs.publishing import publish_due_posts
+
+"""
+
+Publishes the scheduled posts that are due (see blogs/publishing.py).
+
+Run it once from cron, or keep it running with --loop. Several instances may
+run at the same time; each post is published by exactly one of them.
+
+Examples:
+    python manage.py publish_scheduled
+    python manage.py publish_scheduled --loop --interval 30 --batch-size 500
+
+"""
+
+
+class Command(BaseCommand):
+    help = "Publish scheduled posts whose publish_at has passed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.PUBLISH_BATCH_SIZE
+        )
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.PUBLISH_INTERVAL,
+            help="Seconds between runs with --loop",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            published = publish_due_posts(options["batch_size"])
+            if published or not options["loop"]:
+                self.stdout.write(f"Published {published} scheduled posts")
+            if not options["loop"]:
+                return
+            # A long-running process should not keep a dead or stale connection
+            close_old_connections()
+            time.sleep(options["interval"])
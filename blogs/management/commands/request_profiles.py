@@ -0,0 +1,96 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from config.profiling import (
+    collapsed_stacks,
+    load_profiles,
+    make_token,
+    render_top,
+)
+
+"""
+
+Lists and renders the request profiles written by RequestProfilingMiddleware.
+
+Examples:
+    python manage.py request_profiles token            # value for X-Profile-Request
+    python manage.py request_profiles list
+    python manage.py request_profiles show <id> --top 30 --sort cumulative
+    python manage.py request_profiles collapsed <id> > out.folded   # flamegraph.pl / speedscope
+
+"""
+
+
+class Command(BaseCommand):
+    help = "List and render on-demand request profiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action", choices=["token", "list", "show", "collapsed"], default="list"
+        )
+        parser.add_argument("id", nargs="?", help="Profile id (or a unique prefix)")
+        parser.add_argument("--top", type=int, default=25)
+        parser.add_argument(
+            "--sort", choices=["cumulative", "tottime", "ncalls"], default="cumulative"
+        )
+
+    def handle(self, *args, **options):
+        action = options["action"]
+        if action == "token":
+            try:
+                self.stdout.write(make_token())
+            except ImproperlyConfigured as exc:
+                raise CommandError(str(exc))
+        elif action == "list":
+            self.list_profiles()
+        else:
+            record = self.find(options["id"])
+            if action == "show":
+                self.show(record, options["top"], options["sort"])
+            else:
+                stacks = collapsed_stacks(record)
+                for stack, value in sorted(stacks.items()):
+                    self.stdout.write(f"{stack} {value}")
+
+    def find(self, profile_id):
+        if not profile_id:
+            raise CommandError("Give the id of a profile (see `request_profiles list`)")
+        matches = [p for p in load_profiles() if p["id"].startswith(profile_id)]
+        if len(matches) != 1:
+            raise CommandError(f"{len(matches)} profiles match {profile_id!r}")
+        return matches[0]
+
+    def list_profiles(self):
+        self.stdout.write(
+            f"{'id':<29} {'time':<19} {'ms':>9} {'sql':>4} {'slow':>4} status request"
+        )
+        for record in load_profiles():
+            when = timezone.datetime.fromtimestamp(record["time"]).strftime(
+                "%Y-%m-%d %H:%M:%S"
+            )
+            slow = sum(1 for query in record["queries"] if "explain" in query)
+            self.stdout.write(
+                f"{record['id']:<29} {when:<19} {record['duration_ms']:>9.1f} "
+                f"{len(record['queries']):>4} {slow:>4} {record['status']:>6} "
+                f"{record['method']} {record['path']} ({record['view']})"
+            )
+
+    def show(self, record, top, sort):
+        self.stdout.write(
+            f"{record['method']} {record['path']} -> {record['status']} "
+            f"in {record['duration_ms']} ms ({record['mode']})\n"
+        )
+        self.stdout.write(render_top(record, top, sort))
+
+        total = sum(query["ms"] for query in record["queries"])
+        self.stdout.write(f"{len(record['queries'])} queries, {total:.1f} ms\n")
+        for query in record["queries"]:
+            self.stdout.write(
+                f"[{query['alias']}] {query['ms']:.3f} ms  {query['sql']}"
+            )
+            if query["params"]:
+                self.stdout.write(f"    params: {', '.join(query['params'])}")
+            if "explain" in query:
+                for line in query["explain"].splitlines():
+                    self.stdout.write(f"    | {line}")
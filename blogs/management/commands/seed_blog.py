@@ -0,0 +1,213 @@
+import random
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from blogs.models import BlogPost, Rating
+from blogs.rendering import render_post
+from comments.models import Comments
+from users.models import Profile
+
+User = get_user_model()
+
+"""
+
+Synthetic data for load tests, created with bulk_create.
+
+Users are named <prefix>_<n> and all share --password, so the load driver
+(load_test) can log in as any of them. Authors, likes, ratings and comments
+follow a Zipf-like distribution: a few posts get most of the traffic, like on a
+real blog. Comments form trees: a comment answers an earlier comment of the
+same post with probability --reply-ratio, usually one of the latest, so some
+threads reach --max-depth.
+
+Example:
+    python manage.py seed_blog --users 1000 --posts 5000 --likes 100000 \\
+        --ratings 50000 --comments 100000
+
+"""
+
+WORDS = (
+    "django api blog post comment reply cache query index database worker "
+    "request response latency python server thread model view token user "
+    "profile avatar rating like feed page schema async pool metric trace"
+).split()
+
+
+# Cumulative weights of ranks 1..n for random.choices (rank r has weight 1/r^s)
+def zipf_weights(count, exponent):
+    return list(accumulate(1 / rank**exponent for rank in range(1, count + 1)))
+
+
+def sentence(rng, low, high):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+class Command(BaseCommand):
+    help = "Generate users, posts, likes, ratings and comment trees for load tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--posts", type=int, default=1000)
+        parser.add_argument("--likes", type=int, default=20000)
+        parser.add_argument("--ratings", type=int, default=10000)
+        parser.add_argument("--comments", type=int, default=20000)
+        parser.add_argument("--max-depth", type=int, default=8)
+        parser.add_argument("--reply-ratio", type=float, default=0.6)
+        parser.add_argument(
+            "--skew", type=float, default=1.1, help="Zipf exponent (0 = uniform)"
+        )
+        parser.add_argument("--prefix", default="seed")
+        parser.add_argument("--password", default="Seed-pass-123!")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["posts"] < 1:
+            raise CommandError("--users and --posts must be at least 1")
+        if User.objects.filter(username__startswith=f"{options['prefix']}_").exists():
+            raise CommandError(
+                f"Users named {options['prefix']}_* already exist, pick another --prefix"
+            )
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.skew = options["skew"]
+
+        with transaction.atomic():
+            users = self.create_users(options)
+            posts = self.create_posts(users, options["posts"])
+            likes = self.create_likes(users, posts, options["likes"])
+            ratings = self.create_ratings(users, posts, options["ratings"])
+            comments, depth = self.create_comments(users, posts, options)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {len(users)} users, {len(posts)} posts, {likes} likes, "
+                f"{ratings} ratings and {comments} comments (deepest reply: {depth})"
+            )
+        )
+
+    # Posts (or users) picked with the Zipf skew, the first ones most often
+    def pick(self, items, count):
+        weights = zipf_weights(len(items), self.skew)
+        return self.rng.choices(items, cum_weights=weights, k=count)
+
+    def create_users(self, options):
+        # One hash for everybody: hashing thousands of passwords would dominate the run
+        password = make_password(options["password"])
+        prefix = options["prefix"]
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=f"{prefix}_{number}",
+                    email=f"{prefix}_{number}@example.com",
+                    password=password,
+                )
+                for number in range(options["users"])
+            ],
+            batch_size=self.batch_size,
+        )
+        # bulk_create does not send post_save, so create_profile does not run
+        Profile.objects.bulk_create(
+            [Profile(user=user) for user in users], batch_size=self.batch_size
+        )
+        self.stdout.write(f"Created {len(users)} users")
+        return users
+
+    def create_posts(self, users, count):
+        authors = self.pick(users, count)
+        posts = [
+            BlogPost(
+                title=sentence(self.rng, 3, 8)[:100],
+                content="\n\n".join(
+                    sentence(self.rng, 40, 120) for _ in range(self.rng.randint(1, 6))
+                ),
+                author=author,
+            )
+            for author in authors
+        ]
+        # bulk_create does not send pre_save, so the content is rendered here
+        for post in posts:
+            render_post(post)
+        posts = BlogPost.objects.bulk_create(posts, batch_size=self.batch_size)
+        self.stdout.write(f"Created {len(posts)} posts")
+        return posts
+
+    # Unique (user, post) pairs, posts drawn with the skew and users uniformly
+    def pairs(self, users, posts, count):
+        count = min(count, len(users) * len(posts))
+        seen = set()
+        while len(seen) < count:
+            for post in self.pick(posts, count - len(seen)):
+                seen.add((self.rng.choice(users).pk, post.pk))
+        return seen
+
+    def create_likes(self, users, posts, count):
+        Like = BlogPost.likes.through
+        likes = [
+            Like(user_id=user_id, blogpost_id=post_id)
+            for user_id, post_id in self.pairs(users, posts, count)
+        ]
+        Like.objects.bulk_create(likes, batch_size=self.batch_size)
+        self.stdout.write(f"Created {len(likes)} likes")
+        return len(likes)
+
+    def create_ratings(self, users, posts, count):
+        # Readers mostly rate what they liked
+        scores = self.rng.choices([1, 2, 3, 4, 5], weights=[1, 1, 2, 4, 4], k=count)
+        ratings = [
+            Rating(user_id=user_id, blog_id=post_id, score=score)
+            for (user_id, post_id), score in zip(
+                self.pairs(users, posts, count), scores
+            )
+        ]
+        Rating.objects.bulk_create(ratings, batch_size=self.batch_size)
+        self.stdout.write(f"Created {len(ratings)} ratings")
+        return len(ratings)
+
+    """
+    The trees are planned in memory first, then created one depth at a time:
+    a reply needs the primary key of its parent, which bulk_create returns.
+    """
+
+    def create_comments(self, users, posts, options):
+        max_depth, reply_ratio = options["max_depth"], options["reply_ratio"]
+        threads = {}
+        # Each planned comment: [post, author, parent index, depth]
+        plan = []
+        for post in self.pick(posts, options["comments"]):
+            thread = threads.setdefault(post.pk, [])
+            parent, depth = None, 0
+            if thread and self.rng.random() < reply_ratio:
+                # Latest comments are answered most, which builds long chains
+                index = thread[
+                    -1 - min(int(self.rng.expovariate(1.0)), len(thread) - 1)
+                ]
+                if plan[index][3] < max_depth:
+                    parent, depth = index, plan[index][3] + 1
+            thread.append(len(plan))
+            plan.append([post, self.rng.choice(users), parent, depth])
+
+        created = [None] * len(plan)
+        deepest = max((entry[3] for entry in plan), default=0)
+        for level in range(deepest + 1):
+            indexes = [index for index, entry in enumerate(plan) if entry[3] == level]
+            comments = Comments.objects.bulk_create(
+                [
+                    Comments(
+                        blog=plan[index][0],
+                        author=plan[index][1],
+                        content=sentence(self.rng, 5, 40),
+                        parent=created[plan[index][2]] if level else None,
+                    )
+                    for index in indexes
+                ],
+                batch_size=self.batch_size,
+            )
+            for index, comment in zip(indexes, comments):
+                created[index] = comment
+        self.stdout.write(f"Created {len(plan)} comments")
+        return len(plan), deepest
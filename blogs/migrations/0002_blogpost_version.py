@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blogs", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blogpost",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blogs", "0004_post_tags"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="blogpost",
+            name="post_author_recent",
+        ),
+        migrations.RemoveIndex(
+            model_name="blogpost",
+            name="post_recent",
+        ),
+        migrations.AddField(
+            model_name="blogpost",
+            name="publish_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="blogpost",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("draft", "Draft"),
+                    ("scheduled", "Scheduled"),
+                    ("published", "Published"),
+                ],
+                default="published",
+                max_length=10,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="blogpost",
+            index=models.Index(
+                condition=models.Q(("status", "published")),
+                fields=["author", "-created_at"],
+                name="post_author_recent",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="blogpost",
+            index=models.Index(
+                condition=models.Q(("status", "published")),
+                fields=["-created_at", "-id"],
+                name="post_recent",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="blogpost",
+            index=models.Index(
+                condition=models.Q(("status", "scheduled")),
+                fields=["publish_at"],
+                name="post_scheduled",
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:15
+
+from django.db import migrations, models
+
+from blogs.rendering import rendered_fields
+
+
+# Existing posts are rendered in batches, reading one batch at a time
+def render_existing_posts(apps, schema_editor):
+    BlogPost = apps.get_model("blogs", "BlogPost")
+    fields = ["content_html", "excerpt", "word_count", "reading_time"]
+    batch = []
+    for post in BlogPost.objects.only("pk", "content").iterator(chunk_size=1000):
+        for name, value in rendered_fields(post.content).items():
+            setattr(post, name, value)
+        batch.append(post)
+        if len(batch) == 1000:
+            BlogPost.objects.bulk_update(batch, fields)
+            batch = []
+    BlogPost.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blogs", "0007_post_revision"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blogpost",
+            name="content_html",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="blogpost",
+            name="excerpt",
+            field=models.CharField(blank=True, default="", max_length=300),
+        ),
+        migrations.AddField(
+            model_name="blogpost",
+            name="reading_time",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="blogpost",
+            name="word_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(render_existing_posts, migrations.RunPython.noop),
+    ]
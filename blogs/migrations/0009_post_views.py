@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blogs", "0008_rendered_content"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostViews",
+            fields=[
+                (
+                    "post",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="view_stats",
+                        serialize=False,
+                        to="blogs.blogpost",
+                    ),
+                ),
+                ("views", models.BigIntegerField(default=0)),
+                ("unique_viewers", models.BigIntegerField(default=0)),
+                ("sketch", models.BinaryField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
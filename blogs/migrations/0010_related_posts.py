@@ -0,0 +1,105 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blogs", "0009_post_views"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IndexTerm",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("idf", models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PostTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=50)),
+                ("weight", models.FloatField()),
+                (
+                    "post",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="blogs.blogpost",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["term"],
+                        include=("post", "weight"),
+                        name="post_term_lookup",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("post", "term"), name="unique_post_term"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="RelatedPost",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                (
+                    "post",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="blogs.blogpost",
+                    ),
+                ),
+                (
+                    "related",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="related_from",
+                        to="blogs.blogpost",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["post", "-score"], name="related_top")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("post", "related"), name="unique_related_post"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,9 +1,65 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.db.models import Avg, Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.conf import settings
 
+from blogs.rendering import render_post
+
+
+# Queryset that computes likes and average rating in the same query as the posts
+class BlogPostQuerySet(models.QuerySet):
+    # Posts readers can see; matches the condition of the partial indexes
+    def published(self):
+        return self.filter(status=BlogPost.PUBLISHED)
+
+    # Published posts, plus the user's own drafts and scheduled posts
+    def visible_to(self, user):
+        return self.visible_to_id(user.pk if user.is_authenticated else None)
+
+    # The same from the user's id (None when anonymous), without loading the user
+    def visible_to_id(self, user_id):
+        if user_id is None:
+            return self.published()
+        return self.filter(Q(status=BlogPost.PUBLISHED) | Q(author_id=user_id))
+
+    # Each annotation is a correlated subquery, added only where it is shown
+    def with_likes_count(self):
+        likes = (
+            BlogPost.likes.through.objects.filter(blogpost_id=OuterRef("pk"))
+            .values("blogpost_id")
+            .annotate(count=Count("*"))
+            .values("count")
+        )
+        return self.annotate(likes_count=Coalesce(Subquery(likes), 0))
+
+    def with_rating_average(self):
+        ratings = (
+            Rating.objects.filter(blog_id=OuterRef("pk"))
+            .values("blog_id")
+            .annotate(average=Avg("score"))
+            .values("average")
+        )
+        return self.annotate(rating_average=Subquery(ratings))
+
+    def with_stats(self):
+        return self.select_related("author").with_likes_count().with_rating_average()
+
 
 # Creating a custom model with the required fields for each blog post
 class BlogPost(models.Model):
+    DRAFT = "draft"
+    SCHEDULED = "scheduled"
+    PUBLISHED = "published"
+    STATUS_CHOICES = [
+        (DRAFT, "Draft"),
+        (SCHEDULED, "Scheduled"),
+        (PUBLISHED, "Published"),
+    ]
+
     title = models.CharField(max_length=100)
     content = models.TextField()
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -12,11 +68,62 @@ class BlogPost(models.Model):
     likes = models.ManyToManyField(
         settings.AUTH_USER_MODEL, related_name="liked_posts", blank=True
     )
+    # Bumped by likes and ratings, which change the response but not updated_at
+    version = models.PositiveIntegerField(default=0)
+    # Normalized tag names (see BlogPostSerializer.validate_tags); ?tag= filters use the GIN index
+    tags = ArrayField(models.CharField(max_length=50), default=list, blank=True)
+    # Only published posts are listed; a scheduled post is published by the
+    # publish_scheduled command at publish_at, which becomes its created_at
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PUBLISHED)
+    publish_at = models.DateTimeField(null=True, blank=True)
+    # Rendered from content on every save (blogs/rendering.py)
+    content_html = models.TextField(blank=True, default="")
+    excerpt = models.CharField(max_length=300, blank=True, default="")
+    word_count = models.PositiveIntegerField(default=0)
+    # Minutes
+    reading_time = models.PositiveIntegerField(default=0)
+
+    objects = BlogPostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Newest posts of one author (feed backfill and fan-out on read)
+            models.Index(
+                fields=["author", "-created_at"],
+                name="post_author_recent",
+                condition=Q(status="published"),
+            ),
+            # The list order, and the keyset pages of filtered lists; drafts and
+            # scheduled posts are left out, so the index only holds listed rows
+            models.Index(
+                fields=["-created_at", "-id"],
+                name="post_recent",
+                condition=Q(status="published"),
+            ),
+            # Due posts for the scheduler
+            models.Index(
+                fields=["publish_at"],
+                name="post_scheduled",
+                condition=Q(status="scheduled"),
+            ),
+            GinIndex(fields=["tags"], name="post_tags"),
+        ]
+
+    @property
+    def is_published(self):
+        return self.status == self.PUBLISHED
 
+    # Both methods use the annotations of with_stats() when the post was loaded with them
     def total_likes(self):
+        if hasattr(self, "likes_count"):
+            return self.likes_count
         return self.likes.count()
 
     def average_rating(self):
+        if hasattr(self, "rating_average"):
+            if self.rating_average is None:
+                return None
+            return round(self.rating_average, 2)
         ratings = self.ratings.all()
         if ratings.exists():
             return round(sum(r.score for r in ratings) / ratings.count(), 2)
@@ -25,6 +132,108 @@ class BlogPost(models.Model):
     def __str__(self):
         return self.title
 
+    # Strong ETag and Last-Modified of one post, and whether it is published,
+    # from a single narrow query; None when the user cannot see it, so a draft
+    # gets no ETag and no 304
+    @classmethod
+    def validators(cls, pk, user_id):
+        posts = cls.objects.visible_to_id(user_id).filter(pk=pk)
+        row = posts.values_list("updated_at", "version", "status").first()
+        if row is None:
+            return None
+        updated_at, version, status = row
+        etag = f"post-{pk}-{int(updated_at.timestamp() * 1000000)}-{version}"
+        return etag, None, status == cls.PUBLISHED
+
+    # Record a change that does not touch updated_at (likes and ratings)
+    @classmethod
+    def bump_version(cls, pk):
+        cls.objects.filter(pk=pk).update(version=models.F("version") + 1)
+
+
+"""
+
+Number of published posts per tag, for the tag cloud. The counts are changed
+by the signals below whenever a post is created, re-tagged, published,
+unpublished or deleted (and by the scheduler for a whole batch), so reading
+the cloud never groups the posts.
+
+"""
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    post_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["-post_count", "name"], name="tag_cloud")]
+
+    def __str__(self):
+        return f"{self.name} ({self.post_count})"
+
+    @classmethod
+    def adjust(cls, names, delta):
+        if not names:
+            return
+        if delta > 0:
+            cls.objects.bulk_create(
+                [cls(name=name) for name in names], ignore_conflicts=True
+            )
+        cls.objects.filter(name__in=names).update(post_count=F("post_count") + delta)
+
+    # Add {name: number of posts}, one UPDATE per distinct number
+    @classmethod
+    def add_counts(cls, counts):
+        by_delta = {}
+        for name, delta in counts.items():
+            by_delta.setdefault(delta, []).append(name)
+        for delta, names in sorted(by_delta.items()):
+            cls.adjust(sorted(names), delta)
+
+
+# Tags a post adds to the counts: none until it is published
+def _counted_tags(tags, status):
+    return set(tags) if status == BlogPost.PUBLISHED else set()
+
+
+# Render the content once, when it is written, instead of on every read
+@receiver(pre_save, sender=BlogPost)
+def render_post_content(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "content" in update_fields:
+        render_post(instance)
+
+
+# The tags the post counted before this save, to count only what changed
+@receiver(pre_save, sender=BlogPost)
+def remember_post_tags(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {"tags", "status"} & set(update_fields):
+        instance._saved_tags = None
+    elif instance._state.adding:
+        instance._saved_tags = set()
+    else:
+        row = (
+            BlogPost.objects.filter(pk=instance.pk)
+            .values_list("tags", "status")
+            .first()
+        )
+        instance._saved_tags = _counted_tags(*row) if row else set()
+
+
+@receiver(post_save, sender=BlogPost)
+def count_post_tags(sender, instance, **kwargs):
+    saved = getattr(instance, "_saved_tags", None)
+    if saved is None:
+        return
+    current = _counted_tags(instance.tags, instance.status)
+    Tag.adjust(sorted(current - saved), 1)
+    Tag.adjust(sorted(saved - current), -1)
+    instance._saved_tags = current
+
+
+@receiver(post_delete, sender=BlogPost)
+def uncount_post_tags(sender, instance, **kwargs):
+    Tag.adjust(sorted(_counted_tags(instance.tags, instance.status)), -1)
+
 
 # Creating a model for the scores of each post by users, which is linked to other models through the primary key
 class Rating(models.Model):
@@ -37,3 +246,190 @@ class Rating(models.Model):
 
     def __str__(self):
         return f"User {self.user.username} gave a score of {self.score} to {self.blog.title}'s post"
+
+
+"""
+
+Views of a post, written by the periodic flushes of blogs/viewcounts.py and
+kept out of the BlogPost row so that reads never update it. sketch holds the
+HyperLogLog registers (one byte each) of the viewers, and unique_viewers the
+estimate computed from them at the last flush.
+
+"""
+
+
+class PostViews(models.Model):
+    post = models.OneToOneField(
+        BlogPost,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="view_stats",
+    )
+    views = models.BigIntegerField(default=0)
+    unique_viewers = models.BigIntegerField(default=0)
+    sketch = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+"""
+
+One post in the home timeline of a follower of its author, written by the
+fan-out in blogs/feed.py. created_at is a copy of the post's, so a page of
+the feed is one scan of the (user, created_at, post) index.
+
+"""
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+",
+        db_index=False,
+    )
+    post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name="+")
+    # Lets an unfollow remove the author's posts without a join
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+"
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"], name="unique_timeline_post"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-post"], name="timeline_page")
+        ]
+
+
+"""
+
+One version of a post: the whole content (a snapshot) or a delta against the
+previous revision, as written by blogs/revisions.py. The unique index on
+(post, number) serves the range of rows that rebuilds a version.
+
+"""
+
+
+class PostRevision(models.Model):
+    post = models.ForeignKey(
+        BlogPost, on_delete=models.CASCADE, related_name="revisions", db_index=False
+    )
+    number = models.PositiveIntegerField()
+    title = models.CharField(max_length=100)
+    editor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    compressed = models.BooleanField(default=False)
+    content_length = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "number"], name="unique_post_revision"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} r{self.number}"
+
+
+"""
+
+Progress of one import_blog run, so that an interrupted import starts again
+after the last chunk it committed. ImportedRow maps the post and comment ids
+of the exported site to the new ones; it is filled chunk by chunk in the same
+transaction as the rows, so the ids are never kept in memory.
+
+"""
+
+
+class ImportRun(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    # Byte offset in the file after the last committed chunk
+    offset = models.BigIntegerField(default=0)
+    imported = models.BigIntegerField(default=0)
+    skipped = models.BigIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.imported} rows)"
+
+
+class ImportedRow(models.Model):
+    run = models.ForeignKey(
+        ImportRun, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    model = models.CharField(max_length=10)
+    old_id = models.BigIntegerField()
+    new_id = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["run", "model", "old_id"], name="unique_imported_row"
+            )
+        ]
+
+
+"""
+
+The related-posts index of blogs/related.py. IndexTerm holds the inverse
+document frequency of every term as of the last full build, PostTerm the
+signature of each published post (its RELATED_TERMS heaviest TF-IDF terms,
+normalized to length 1) and RelatedPost its RELATED_POSTS nearest neighbours
+by cosine similarity, read by the related endpoint from the related_top index.
+
+"""
+
+
+class IndexTerm(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    idf = models.FloatField()
+
+
+class PostTerm(models.Model):
+    post = models.ForeignKey(
+        BlogPost, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    term = models.CharField(max_length=50)
+    weight = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["post", "term"], name="unique_post_term")
+        ]
+        # The posts sharing a term, read without visiting the table
+        indexes = [
+            models.Index(
+                fields=["term"], include=["post", "weight"], name="post_term_lookup"
+            )
+        ]
+
+
+class RelatedPost(models.Model):
+    post = models.ForeignKey(
+        BlogPost, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    related = models.ForeignKey(
+        BlogPost, on_delete=models.CASCADE, related_name="related_from"
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "related"], name="unique_related_post"
+            )
+        ]
+        indexes = [models.Index(fields=["post", "-score"], name="related_top")]
@@ -0,0 +1,86 @@
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+"""
+
+Keyset pagination over (created_at, id), newest first.
+
+The cursor is the (created_at, id) of the last row of the previous page, so a
+page is read from an index starting at that position, however deep it is,
+and rows added meanwhile do not shift the following pages.
+
+"""
+
+
+def encode_cursor(created_at, pk):
+    value = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        created_at, pk = base64.urlsafe_b64decode(value).decode().split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError({"cursor": "Invalid cursor."})
+
+
+# Rows strictly after the cursor in (created_at, id) descending order
+def after(queryset, cursor, id_field="id"):
+    if cursor is None:
+        return queryset
+    created_at, pk = cursor
+    # The first condition bounds the index scan, the second breaks ties
+    return queryset.filter(created_at__lte=created_at).filter(
+        Q(created_at__lt=created_at) | Q(**{f"{id_field}__lt": pk})
+    )
+
+
+def next_link(request, cursor):
+    if cursor is None:
+        return None
+    return replace_query_param(
+        request.build_absolute_uri(), "cursor", encode_cursor(*cursor)
+    )
+
+
+# Used by the post list when it is filtered (?tag=) or a cursor is given;
+# the plain list keeps its original, unpaginated shape
+class KeysetPagination(BasePagination):
+    paginated_params = ("tag", "cursor")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not any(param in request.query_params for param in self.paginated_params):
+            return None
+        self.request = request
+        size = settings.POSTS_PAGE_SIZE
+        cursor = decode_cursor(request.query_params.get("cursor"))
+        rows = list(after(queryset, cursor).order_by("-created_at", "-id")[: size + 1])
+        self.next_cursor = None
+        if len(rows) > size:
+            rows = rows[:size]
+            self.next_cursor = (rows[-1].created_at, rows[-1].pk)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(
+            {"next": next_link(self.request, self.next_cursor), "results": data}
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,67 @@
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from blogs.feed import schedule_fan_out
+from blogs.models import BlogPost, Tag
+from blogs.related import schedule_index
+
+logger = logging.getLogger(__name__)
+
+"""
+
+Publishing of scheduled posts, run by the publish_scheduled command.
+
+Each batch is one transaction: it locks up to PUBLISH_BATCH_SIZE due posts
+with SELECT ... FOR UPDATE SKIP LOCKED (read from the post_scheduled partial
+index), so several schedulers can run at once; a post locked by one of them
+is skipped by the others, and once that batch commits the post is no longer
+scheduled and is not selected again. The batch is published with one UPDATE,
+the tag counts move with one UPDATE per distinct count and the fan-out of the
+batch is queued as a single job after commit.
+
+A published post takes its publish_at as created_at, so lists and feeds show
+it at the time it was scheduled for.
+
+"""
+
+
+# Publish one batch of due posts; returns the number of posts published
+def publish_batch(batch_size=None, now=None):
+    batch_size = batch_size or settings.PUBLISH_BATCH_SIZE
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = list(
+            BlogPost.objects.select_for_update(skip_locked=True)
+            .filter(status=BlogPost.SCHEDULED, publish_at__lte=now)
+            .order_by("publish_at")
+            .values_list("pk", "tags")[:batch_size]
+        )
+        if not due:
+            return 0
+        post_ids = [pk for pk, _ in due]
+        BlogPost.objects.filter(pk__in=post_ids).update(
+            status=BlogPost.PUBLISHED,
+            created_at=F("publish_at"),
+            updated_at=now,
+            version=F("version") + 1,
+        )
+        Tag.add_counts(Counter(tag for _, tags in due for tag in set(tags)))
+        schedule_fan_out(post_ids)
+        schedule_index(post_ids)
+    return len(due)
+
+
+# Publish every due post, batch after batch; returns the number published
+def publish_due_posts(batch_size=None, now=None):
+    batch_size = batch_size or settings.PUBLISH_BATCH_SIZE
+    total = 0
+    while True:
+        published = publish_batch(batch_size, now)
+        total += published
+        if published < batch_size:
+            return total
@@ -0,0 +1,323 @@
+import heapq
+import io
+import logging
+import math
+import re
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.db.models import Count, F, Max, Min, Window
+from django.db.models.functions import RowNumber
+from scipy import sparse
+
+from blogs.models import BlogPost, IndexTerm, PostTerm, RelatedPost
+from blogs.rendering import plain_text
+from config import background
+
+logger = logging.getLogger(__name__)
+
+"""
+
+Related posts: the RELATED_POSTS published posts most similar to each one,
+precomputed so that GET /api/blogs/<pk>/related/ is one read of an index.
+
+A post is a TF-IDF vector of the words of its title (counted twice) and of
+the plain text of its content: (1 + log count) * idf per word, where
+idf = 1 + log((1 + posts) / (1 + posts with the word)). Only its
+RELATED_TERMS heaviest words are kept (its signature, in PostTerm) and the
+vector is normalized, so that the similarity of two posts is the sum of the
+products of the weights of the words their signatures share (the cosine).
+
+build_index() computes everything at once (manage.py index_related): the
+signatures form a sparse matrix X (SciPy CSR) and the similarities of all
+pairs are X @ X.T, computed BUILD_CHUNK rows at a time; NumPy picks the top
+RELATED_POSTS of each row. The idf values are those of this build.
+
+Between builds, index_posts() updates only the posts a change affects, in the
+background once the change is committed: the changed posts get a new
+signature (with the stored idf values; a word not seen by the last build gets
+the largest one) and their neighbours are found in SQL through the
+post_term_lookup index, from the posts sharing one of their words. A post
+they now beat enters the list of that post, and the posts that listed a
+changed or deleted post compute their list again. Updates take a transaction
+level advisory lock, so they run one at a time and never during a build.
+
+"""
+
+WORD = re.compile(r"[^\W\d_]{3,50}")
+STOP_WORDS = frozenset(
+    """
+    about above after again all also and any are because been before being
+    below between both but can could did does doing down during each few for
+    from further had has have having her here hers herself him himself his
+    how into its itself just more most not now off once only other our ours
+    out over own same she should some such than that the their theirs them
+    then there these they this those through too under until very was were
+    what when where which while who whom why will with would you your yours
+    """.split()
+)
+TITLE_WEIGHT = 2
+# Rows of X whose similarities are computed at once by build_index()
+BUILD_CHUNK = 500
+# Key of the advisory lock held by builds and updates
+LOCK_KEY = 50_0001
+
+# The posts sharing a word with a post, by descending similarity
+SIMILAR_POSTS = """
+SELECT other.post_id, SUM(mine.weight * other.weight) AS score
+FROM {table} AS mine
+JOIN {table} AS other ON other.term = mine.term
+WHERE mine.post_id = %s AND other.post_id <> %s
+GROUP BY other.post_id
+ORDER BY score DESC, other.post_id
+"""
+
+
+# {word: count} of a post
+def term_counts(title, content_html):
+    counts = Counter(
+        word
+        for word in WORD.findall(plain_text(content_html).lower())
+        if word not in STOP_WORDS
+    )
+    for word in WORD.findall(title.lower()):
+        if word not in STOP_WORDS:
+            counts[word] += TITLE_WEIGHT
+    return counts
+
+
+def inverse_frequency(posts, posts_with_term):
+    return math.log((1 + posts) / (1 + posts_with_term)) + 1
+
+
+# The post's signature: {word: weight} of its heaviest words, normalized
+def signature(counts, idf, unseen_idf):
+    weights = {
+        word: (1 + math.log(count)) * idf.get(word, unseen_idf)
+        for word, count in counts.items()
+    }
+    top = heapq.nlargest(settings.RELATED_TERMS, weights.items(), key=lambda x: x[1])
+    norm = math.sqrt(sum(weight * weight for _, weight in top))
+    return {word: weight / norm for word, weight in top} if norm else {}
+
+
+def _lock():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [LOCK_KEY])
+
+
+def _published_posts():
+    posts = BlogPost.objects.published().order_by("pk")
+    return posts.values_list("pk", "title", "content_html").iterator(chunk_size=1000)
+
+
+# Write rows with COPY: a build writes RELATED_TERMS + RELATED_POSTS rows per
+# post, and bulk_create spends more time building them than PostgreSQL does
+# storing them (the words are letters only, so need no escaping). psycopg2
+# reads the data from a file, psycopg 3 (DB_POOL=1) takes it through copy()
+def _copy(model, columns, rows):
+    data = "".join("\t".join(map(str, row)) + "\n" for row in rows)
+    sql = f"COPY {model._meta.db_table} ({', '.join(columns)}) FROM STDIN"
+    with connection.cursor() as cursor:
+        if is_psycopg3:
+            with cursor.copy(sql) as copy:
+                copy.write(data)
+        else:
+            cursor.copy_expert(sql, io.StringIO(data))
+
+
+# (post id, [related ids], [scores]) of every row of X, by similarity
+def _neighbours(post_ids, matrix):
+    size = settings.RELATED_POSTS
+    transposed = matrix.T.tocsc()
+    for start in range(0, matrix.shape[0], BUILD_CHUNK):
+        scores = (matrix[start : start + BUILD_CHUNK] @ transposed).tocsr()
+        for row in range(scores.shape[0]):
+            begin, end = scores.indptr[row], scores.indptr[row + 1]
+            columns = scores.indices[begin:end]
+            values = scores.data[begin:end]
+            other = columns != start + row
+            columns, values = columns[other], values[other]
+            if len(values) > size:
+                top = np.argpartition(-values, size)[:size]
+                columns, values = columns[top], values[top]
+            yield post_ids[start + row], post_ids[columns], values
+
+
+# Build the whole index again; returns the number of posts indexed
+def build_index():
+    with transaction.atomic():
+        _lock()
+        # First pass: the number of posts each word appears in
+        frequency = Counter()
+        posts = 0
+        for _, title, content_html in _published_posts():
+            frequency.update(term_counts(title, content_html).keys())
+            posts += 1
+        idf = {
+            word: inverse_frequency(posts, count) for word, count in frequency.items()
+        }
+        unseen_idf = inverse_frequency(posts, 0)
+
+        # Second pass: the signatures, as the rows of X
+        post_ids, rows, columns, weights, post_terms = [], [], [], [], []
+        vocabulary = {}
+        for pk, title, content_html in _published_posts():
+            terms = signature(term_counts(title, content_html), idf, unseen_idf)
+            for word, weight in terms.items():
+                rows.append(len(post_ids))
+                columns.append(vocabulary.setdefault(word, len(vocabulary)))
+                weights.append(weight)
+                post_terms.append((pk, word, weight))
+            post_ids.append(pk)
+        matrix = sparse.csr_matrix(
+            (np.array(weights, dtype=np.float32), (rows, columns)),
+            shape=(len(post_ids), len(vocabulary)),
+        )
+        del rows, columns, weights
+
+        # Readers keep seeing the previous index until the build commits
+        IndexTerm.objects.all().delete()
+        _copy(IndexTerm, ["name", "idf"], idf.items())
+        PostTerm.objects.all().delete()
+        _copy(PostTerm, ["post_id", "term", "weight"], post_terms)
+        del post_terms
+
+        RelatedPost.objects.all().delete()
+        related = []
+        for pk, related_ids, scores in _neighbours(np.array(post_ids), matrix):
+            related.extend(zip([pk] * len(scores), related_ids, scores.tolist()))
+            if len(related) >= 50000:
+                _copy(RelatedPost, ["post_id", "related_id", "score"], related)
+                related = []
+        _copy(RelatedPost, ["post_id", "related_id", "score"], related)
+
+        # Every row was replaced; the planner needs the new statistics
+        with connection.cursor() as cursor:
+            for model in (IndexTerm, PostTerm, RelatedPost):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+    return len(post_ids)
+
+
+# [(post id, score)] of the indexed posts similar to a post, most similar first
+def similar_posts(post_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SIMILAR_POSTS.format(table=PostTerm._meta.db_table), [post_id, post_id]
+        )
+        return cursor.fetchall()
+
+
+def _set_neighbours(post_id, neighbours):
+    RelatedPost.objects.filter(post_id=post_id).delete()
+    RelatedPost.objects.bulk_create(
+        RelatedPost(post_id=post_id, related_id=other, score=score)
+        for other, score in neighbours[: settings.RELATED_POSTS]
+    )
+
+
+# Add a post to the lists of the posts it is now among the nearest of
+def _offer(post_id, candidates):
+    if not candidates:
+        return
+    lists = (
+        RelatedPost.objects.filter(post_id__in=[other for other, _ in candidates])
+        .values("post_id")
+        .annotate(count=Count("*"), lowest=Min("score"))
+        .values_list("post_id", "count", "lowest")
+    )
+    lists = {other: (count, lowest) for other, count, lowest in lists}
+    entered = []
+    for other, score in candidates:
+        count, lowest = lists.get(other, (0, None))
+        if count < settings.RELATED_POSTS or score > lowest:
+            entered.append(RelatedPost(post_id=other, related_id=post_id, score=score))
+    RelatedPost.objects.bulk_create(entered)
+
+    # The lists it entered keep their RELATED_POSTS best
+    ranked = RelatedPost.objects.filter(
+        post_id__in=[row.post_id for row in entered]
+    ).annotate(
+        rank=Window(
+            RowNumber(),
+            partition_by=F("post_id"),
+            order_by=[F("score").desc(), F("related_id")],
+        )
+    )
+    dropped = ranked.filter(rank__gt=settings.RELATED_POSTS).values_list(
+        "pk", flat=True
+    )
+    RelatedPost.objects.filter(pk__in=list(dropped)).delete()
+
+
+# Update the index after posts were created, edited, (un)published or deleted;
+# `listing` are posts whose lists must be computed again as well (those that
+# listed a deleted post, whose rows are gone)
+def index_posts(post_ids, listing=()):
+    post_ids = set(post_ids)
+    with transaction.atomic():
+        _lock()
+        listing = set(listing) | set(
+            RelatedPost.objects.filter(related_id__in=post_ids).values_list(
+                "post_id", flat=True
+            )
+        )
+        listing -= post_ids
+        PostTerm.objects.filter(post_id__in=post_ids).delete()
+        RelatedPost.objects.filter(post_id__in=post_ids).delete()
+        RelatedPost.objects.filter(related_id__in=post_ids).delete()
+
+        # Unpublished and deleted posts stay out of the index
+        posts = BlogPost.objects.published().filter(pk__in=post_ids)
+        counts = {
+            pk: term_counts(title, content_html)
+            for pk, title, content_html in posts.values_list(
+                "pk", "title", "content_html"
+            )
+        }
+        words = set().union(*counts.values())
+        idf = dict(IndexTerm.objects.filter(name__in=words).values_list("name", "idf"))
+        unseen_idf = IndexTerm.objects.aggregate(idf=Max("idf"))["idf"] or 1.0
+        PostTerm.objects.bulk_create(
+            PostTerm(post_id=pk, term=word, weight=weight)
+            for pk, post_counts in sorted(counts.items())
+            for word, weight in signature(post_counts, idf, unseen_idf).items()
+        )
+
+        for pk in sorted(counts):
+            neighbours = similar_posts(pk)
+            _set_neighbours(pk, neighbours)
+            _offer(
+                pk,
+                [
+                    (other, score)
+                    for other, score in neighbours
+                    if other not in post_ids and other not in listing
+                ],
+            )
+        for pk in sorted(listing):
+            _set_neighbours(pk, similar_posts(pk))
+    return len(counts)
+
+
+def _index_in_background(post_ids, listing):
+    try:
+        index_posts(post_ids, listing)
+    except Exception:
+        logger.exception("Could not update the related posts of %s", post_ids)
+
+
+# Queue the update of the index once the current transaction commits
+def schedule_index(post_ids, listing=()):
+    post_ids, listing = list(post_ids), list(listing)
+    if settings.RELATED_INDEXING == "inline":
+        transaction.on_commit(lambda: index_posts(post_ids, listing))
+    else:
+        transaction.on_commit(
+            lambda: background.submit(
+                "related", _index_in_background, post_ids, listing
+            )
+        )
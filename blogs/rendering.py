@@ -0,0 +1,107 @@
+import html
+import math
+import re
+
+import markdown
+import nh3
+from django.conf import settings
+
+"""
+
+Server-side rendering of post contents, done once when a post is saved.
+
+The Markdown source is converted to HTML and then sanitized with nh3: only
+the tags below are kept, links may only use http(s) and mailto and get
+rel="nofollow noopener noreferrer", and everything else (scripts, event
+handlers, raw HTML the author typed) is removed. The plain text of the
+result gives the excerpt shown in lists, the word count and the reading time.
+
+"""
+
+ALLOWED_TAGS = {
+    "a",
+    "abbr",
+    "blockquote",
+    "br",
+    "code",
+    "del",
+    "em",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "hr",
+    "img",
+    "li",
+    "ol",
+    "p",
+    "pre",
+    "strong",
+    "table",
+    "tbody",
+    "td",
+    "th",
+    "thead",
+    "tr",
+    "ul",
+}
+ALLOWED_ATTRIBUTES = {
+    "a": {"href", "title"},
+    "abbr": {"title"},
+    "img": {"src", "alt", "title"},
+    "th": {"align"},
+    "td": {"align"},
+}
+URL_SCHEMES = {"http", "https", "mailto"}
+MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "sane_lists"]
+
+SPACES = re.compile(r"\s+")
+BLOCK_END = re.compile(r"</(?:p|h[1-6]|li|pre|blockquote|td|th)>|<br>|<hr>")
+
+
+def render_html(source):
+    rendered = markdown.markdown(source, extensions=MARKDOWN_EXTENSIONS)
+    return nh3.clean(
+        rendered,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        url_schemes=URL_SCHEMES,
+        link_rel="nofollow noopener noreferrer",
+    )
+
+
+def plain_text(rendered):
+    # Block ends become spaces so that words of two paragraphs stay apart
+    text = nh3.clean(BLOCK_END.sub(r" \g<0>", rendered), tags=set())
+    return SPACES.sub(" ", html.unescape(text)).strip()
+
+
+# The first EXCERPT_LENGTH characters, cut at a word boundary
+def make_excerpt(text):
+    limit = settings.EXCERPT_LENGTH
+    if len(text) <= limit:
+        return text
+    cut = text[: limit - 1]
+    if text[limit - 1] != " " and " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip() + "…"
+
+
+# content_html, excerpt, word_count and reading_time of a post, from its content
+def rendered_fields(content):
+    rendered = render_html(content)
+    text = plain_text(rendered)
+    word_count = len(text.split())
+    return {
+        "content_html": rendered,
+        "excerpt": make_excerpt(text),
+        "word_count": word_count,
+        "reading_time": math.ceil(word_count / settings.READING_WORDS_PER_MINUTE),
+    }
+
+
+def render_post(post):
+    for name, value in rendered_fields(post.content).items():
+        setattr(post, name, value)
@@ -0,0 +1,180 @@
+import difflib
+import json
+import re
+import zlib
+
+from django.conf import settings
+from django.db.models import Max, OuterRef, Subquery
+
+from blogs.models import PostRevision
+
+"""
+
+Revision history of post contents.
+
+Revision 1 is the post as it was created; every edit of the title or the
+content adds the next one. A revision stores the content either whole (a
+snapshot) or as a delta against the revision before it; every
+REVISION_SNAPSHOT_INTERVAL-th revision is a snapshot, so rebuilding any
+version reads one snapshot and at most REVISION_SNAPSHOT_INTERVAL - 1 deltas,
+in one query.
+
+A delta is a list of operations over the words of the previous content (a
+word keeps the whitespace after it, so joining the words gives the text back):
+    n       keep the next n words
+    -n      drop the next n words
+    "text"  insert text
+It is stored as JSON, zlib-compressed when that makes it smaller.
+
+"""
+
+WORDS = re.compile(r"\S+\s*|\s+")
+
+
+def split_words(text):
+    return WORDS.findall(text)
+
+
+def make_delta(old, new):
+    old_words, new_words = split_words(old), split_words(new)
+    # Edits are usually local: only the middle that differs goes to the matcher
+    start, limit = 0, min(len(old_words), len(new_words))
+    while start < limit and old_words[start] == new_words[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old_words[-end - 1] == new_words[-end - 1]:
+        end += 1
+
+    delta = [start] if start else []
+    matcher = difflib.SequenceMatcher(
+        None,
+        old_words[start : len(old_words) - end],
+        new_words[start : len(new_words) - end],
+        autojunk=False,
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append(i2 - i1)
+            continue
+        if i2 > i1:
+            delta.append(i1 - i2)
+        if j2 > j1:
+            delta.append("".join(new_words[start + j1 : start + j2]))
+    if end:
+        delta.append(end)
+    return delta
+
+
+def apply_delta(old, delta):
+    words, position, result = split_words(old), 0, []
+    for operation in delta:
+        if isinstance(operation, str):
+            result.append(operation)
+        elif operation >= 0:
+            result.extend(words[position : position + operation])
+            position += operation
+        else:
+            position -= operation
+    return "".join(result)
+
+
+# (data, compressed) for a snapshot (text) or a delta (list)
+def encode(value):
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+    packed = zlib.compress(raw, 9)
+    if len(packed) < len(raw):
+        return packed, True
+    return raw, False
+
+
+def decode(data, compressed):
+    data = bytes(data)
+    return json.loads(zlib.decompress(data) if compressed else data)
+
+
+def _revision(post, number, editor, content, previous_content):
+    snapshot = previous_content is None or (
+        (number - 1) % settings.REVISION_SNAPSHOT_INTERVAL == 0
+    )
+    value = content if snapshot else make_delta(previous_content, content)
+    data, compressed = encode(value)
+    return PostRevision(
+        post=post,
+        number=number,
+        title=post.title,
+        editor=editor,
+        snapshot=snapshot,
+        data=data,
+        compressed=compressed,
+        content_length=len(content),
+    )
+
+
+"""
+
+Adds the revision of a post that was just created or saved. `previous` is
+the (title, content) the post had before the save, read while its row was
+locked, or None for a new post. A post without history (created before
+revisions existed, or imported) first gets its previous state as revision 1.
+
+"""
+
+
+def record_revision(post, editor, previous=None):
+    if previous is not None and previous == (post.title, post.content):
+        return None
+    last = (
+        PostRevision.objects.filter(post=post).aggregate(number=Max("number"))["number"]
+        or 0
+    )
+    revisions = []
+    previous_content = None
+    if previous is not None:
+        previous_title, previous_content = previous
+        if last == 0:
+            first = _revision(post, 1, None, previous_content, None)
+            first.title = previous_title
+            revisions.append(first)
+            last = 1
+    revisions.append(_revision(post, last + 1, editor, post.content, previous_content))
+    PostRevision.objects.bulk_create(revisions)
+    return revisions[-1]
+
+
+# The revision with its content rebuilt, or None if there is no such revision
+def load_revision(post_id, number):
+    latest_snapshot = (
+        PostRevision.objects.filter(
+            post_id=OuterRef("post_id"), number__lte=number, snapshot=True
+        )
+        .order_by("-number")
+        .values("number")[:1]
+    )
+    rows = list(
+        PostRevision.objects.filter(
+            post_id=post_id, number__lte=number, number__gte=Subquery(latest_snapshot)
+        )
+        .select_related("editor")
+        .order_by("number")
+    )
+    if not rows or rows[-1].number != number:
+        return None
+    content = None
+    for row in rows:
+        value = decode(row.data, row.compressed)
+        content = value if row.snapshot else apply_delta(content, value)
+    revision = rows[-1]
+    revision.content = content
+    return revision
+
+
+def unified_diff(old, new, old_label, new_label):
+    return "\n".join(
+        difflib.unified_diff(
+            old.content.splitlines(),
+            new.content.splitlines(),
+            fromfile=old_label,
+            tofile=new_label,
+            lineterm="",
+        )
+    )
@@ -1,11 +1,30 @@
+import re
+
+from django.utils import timezone
 from rest_framework import serializers
-from blogs.models import BlogPost, Rating
+from blogs.models import BlogPost, PostRevision, Rating, Tag
+from config.fieldsets import FieldQuery, SparseFieldsetMixin
+
+MAX_TAGS = 10
+TAG_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+
+# Lowercase, spaces to hyphens; the same form is used for storing and filtering
+def normalize_tag(name):
+    return re.sub(r"\s+", "-", name.strip().lower())
 
 
 # This class is for serializing the BlogPost model
-class BlogPostSerializer(serializers.ModelSerializer):
+# (?fields= / ?exclude= pick the fields, and field_queries the SQL they need)
+class BlogPostSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source="author.username")
 
+    field_queries = {
+        "author": FieldQuery(columns=["author__username"], related=["author"]),
+        "total_likes": FieldQuery(annotate=["with_likes_count"]),
+        "average_rating": FieldQuery(annotate=["with_rating_average"]),
+    }
+
     class Meta:
         model = BlogPost
         fields = [
@@ -17,6 +36,49 @@ class BlogPostSerializer(serializers.ModelSerializer):
             "updated_at",
             "total_likes",
             "average_rating",
+            "tags",
+            "status",
+            "publish_at",
+            "content_html",
+            "excerpt",
+            "word_count",
+            "reading_time",
+        ]
+        read_only_fields = ["content_html", "excerpt", "word_count", "reading_time"]
+
+    def validate(self, attrs):
+        instance = self.instance
+        status = attrs.get("status", instance.status if instance else None)
+        publish_at = attrs.get("publish_at", instance.publish_at if instance else None)
+        if status == BlogPost.SCHEDULED and publish_at is None:
+            raise serializers.ValidationError(
+                {"publish_at": "A scheduled post needs a publish_at date."}
+            )
+        # A draft published now is listed as a new post
+        if instance and not instance.is_published and status == BlogPost.PUBLISHED:
+            attrs["created_at"] = timezone.now()
+        return attrs
+
+    def validate_tags(self, value):
+        tags = list(dict.fromkeys(normalize_tag(name) for name in value))
+        if len(tags) > MAX_TAGS:
+            raise serializers.ValidationError(f"At most {MAX_TAGS} tags per post.")
+        for tag in tags:
+            if not TAG_PATTERN.match(tag):
+                raise serializers.ValidationError(
+                    f"'{tag}' may only contain letters, digits, '-' and '_'."
+                )
+        return tags
+
+
+# Posts in lists: the excerpt instead of the content, whose columns are then not
+# read
+class BlogPostListSerializer(BlogPostSerializer):
+    class Meta(BlogPostSerializer.Meta):
+        fields = [
+            name
+            for name in BlogPostSerializer.Meta.fields
+            if name not in ("content", "content_html")
         ]
 
 
@@ -25,3 +87,19 @@ class RatingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rating
         fields = ["id", "score"]
+
+
+# This class is for serializing the tag cloud
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ["name", "post_count"]
+
+
+# This class is for serializing the revision history of a post
+class PostRevisionSerializer(serializers.ModelSerializer):
+    editor = serializers.ReadOnlyField(source="editor.username", default=None)
+
+    class Meta:
+        model = PostRevision
+        fields = ["number", "title", "editor", "content_length", "created_at"]
@@ -1,12 +1,65 @@
-from rest_framework.test import APITestCase
+import importlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from asgiref.sync import async_to_sync, sync_to_async
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core import signing
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import LiveServerTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
 from django.contrib.auth import get_user_model
 from rest_framework import status
-from .models import BlogPost, Rating
+from rest_framework.exceptions import ValidationError
+from config import background, batch
+from config.metrics import Registry, registry
+from config.openapi import schema_document
+from config.profiling import load_profiles, make_token
+from config.replicas import replicas
+from config.shmcache import SharedMemoryCache
+from rest_framework_simplejwt.tokens import RefreshToken
+from users.models import Profile
+from users.tests import TEST_COUNTER_STORE
+from users.throttling import get_counter_store
+from .async_views import blog_post_detail, blog_post_list
+from .management.commands.import_blog import Command as ImportBlogCommand
+from comments.models import Comments
+from .models import (
+    BlogPost,
+    ImportedRow,
+    ImportRun,
+    IndexTerm,
+    PostRevision,
+    PostTerm,
+    PostViews,
+    Rating,
+    RelatedPost,
+    Tag,
+    TimelineEntry,
+)
+from .publishing import publish_batch
+from .related import similar_posts
+from .revisions import apply_delta, make_delta
+from .views import BlogPostRateView
+from . import related, viewcounts
 
 User = get_user_model()
 
 
 # This class is for testing operations on posts in the (blogs app)
+@override_settings(THROTTLE_COUNTER_STORE=TEST_COUNTER_STORE)
 class BlogTest(APITestCase):
 
     # In this function, we temporarily register and log in once for testing this app
@@ -130,3 +183,1769 @@ class BlogTest(APITestCase):
         )
         avg = BlogPost.average_rating(post)
         self.assertIsNone(avg)
+
+    # A matching If-None-Match is answered with 304 from one narrow query
+    def test_detail_not_modified(self):
+        post = BlogPost.objects.create(
+            title="Test title", content="Test content", author=self.user
+        )
+        response = self.client.get(f"/api/blogs/{post.id}/")
+        etag = response["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                f"/api/blogs/{post.id}/", HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    # Likes change the response, so they must change the ETag too
+    def test_like_changes_etag(self):
+        post = BlogPost.objects.create(
+            title="Test title", content="Test content", author=self.user
+        )
+        etag = self.client.get(f"/api/blogs/{post.id}/")["ETag"]
+        self.client.post(f"/api/blogs/{post.id}/like/")
+        response = self.client.get(f"/api/blogs/{post.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total_likes"], 1)
+
+    # The version is bumped once the like is written
+    def test_like_bumps_version_after_toggle(self):
+        post = BlogPost.objects.create(
+            title="Test title", content="Test content", author=self.user
+        )
+        bump = BlogPost.bump_version
+
+        def check_bump(pk):
+            self.assertEqual(post.likes.count(), 1)
+            bump(pk)
+
+        with mock.patch.object(BlogPost, "bump_version", side_effect=check_bump):
+            response = self.client.post(f"/api/blogs/{post.id}/like/")
+        self.assertEqual(response.data["message"], "Liked")
+        post.refresh_from_db()
+        self.assertEqual(post.version, 1)
+
+    # An edit based on an old ETag is refused with 412
+    def test_edit_with_stale_if_match(self):
+        post = BlogPost.objects.create(
+            title="Old title", content="Old content", author=self.user
+        )
+        etag = self.client.get(f"/api/blogs/{post.id}/")["ETag"]
+        response = self.client.put(
+            f"/api/blogs/{post.id}/",
+            {"title": "First edit", "content": "Old content"},
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+        response = self.client.put(
+            f"/api/blogs/{post.id}/",
+            {"title": "Lost update", "content": "Old content"},
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        post.refresh_from_db()
+        self.assertEqual(post.title, "First edit")
+
+    # A draft has an ETag for its author only, so others cannot tell it exists
+    def test_draft_etag_is_private(self):
+        post = BlogPost.objects.create(
+            title="Draft", content="Later", author=self.user, status=BlogPost.DRAFT
+        )
+        response = self.client.get(f"/api/blogs/{post.id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        response = self.client.get(f"/api/blogs/{post.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        User.objects.create_user(
+            username="OtherUser", email="other@example.com", password="12345!Ab"
+        )
+        res = self.client.post(
+            "/api/auth/login/", {"username": "OtherUser", "password": "12345!Ab"}
+        )
+        other = f"Bearer {res.data['access']}"
+        for authorization in (None, other):
+            if authorization:
+                self.client.credentials(HTTP_AUTHORIZATION=authorization)
+            else:
+                self.client.credentials()
+            for headers in ({}, {"HTTP_IF_NONE_MATCH": etag}):
+                response = self.client.get(f"/api/blogs/{post.id}/", **headers)
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                self.assertFalse(response.has_header("ETag"))
+
+            request = RequestFactory().get(
+                f"/api/blogs/{post.id}/", HTTP_IF_NONE_MATCH=etag
+            )
+            if authorization:
+                request.META["HTTP_AUTHORIZATION"] = authorization
+            response = async_to_sync(blog_post_detail)(request, pk=post.id)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertFalse(response.has_header("ETag"))
+
+    # The async read views answer with the same data as the DRF views
+    def test_async_views_match_sync_views(self):
+        post = BlogPost.objects.create(
+            title="Test title", content="Test content", author=self.user
+        )
+        self.client.post(f"/api/blogs/{post.id}/like/")
+        self.client.post(f"/api/blogs/{post.id}/rate/", {"score": 4})
+        factory = RequestFactory()
+
+        response = async_to_sync(blog_post_list)(factory.get("/api/blogs/"))
+        self.assertEqual(
+            json.loads(response.content), self.client.get("/api/blogs/").json()
+        )
+
+        response = async_to_sync(blog_post_detail)(
+            factory.get(f"/api/blogs/{post.id}/"), pk=post.id
+        )
+        sync_response = self.client.get(f"/api/blogs/{post.id}/")
+        self.assertEqual(json.loads(response.content), sync_response.json())
+        # Both views are counted
+        stats = self.client.get(f"/api/blogs/{post.id}/views/").data
+        self.assertEqual(stats["viewers"]["estimate"], 2)
+        self.assertEqual(response["ETag"], sync_response["ETag"])
+
+        response = async_to_sync(blog_post_detail)(factory.get("/api/blogs/0/"), pk=0)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # An invalid token is refused by the async views just like by DRF
+    def test_async_view_rejects_invalid_token(self):
+        request = RequestFactory().get("/api/blogs/", HTTP_AUTHORIZATION="Bearer bad")
+        response = async_to_sync(blog_post_list)(request)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("WWW-Authenticate", response)
+
+
+# This class is for testing the request metrics on /metrics
+@override_settings(METRICS_TOKEN="scraper-token")
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        registry.clear()
+        self.user = User.objects.create_user(
+            username="TestUser2", email="Test2@gmail.com", password="123456!Ab"
+        )
+        self.post = BlogPost.objects.create(
+            title="Test title", content="Test content", author=self.user
+        )
+
+    def scrape(self):
+        response = self.client.get(
+            "/metrics", HTTP_AUTHORIZATION="Bearer scraper-token"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+
+    def metric(self, text, line_start):
+        for line in text.splitlines():
+            if line.startswith(line_start):
+                return float(line.rsplit(" ", 1)[1])
+        self.fail(f"{line_start} not in /metrics")
+
+    # Requests are counted per URL name with their queries and body size
+    def test_records_requests_per_url_name(self):
+        self.client.get("/api/blogs/")
+        response = self.client.get("/api/blogs/")
+        self.client.get(f"/api/blogs/{self.post.id}/")
+        self.client.get("/api/blogs/0/")
+
+        text = self.scrape()
+        labels = 'view="blog-list-create",method="GET",status="2xx"'
+        self.assertEqual(
+            self.metric(text, f"http_request_duration_seconds_count{{{labels}}}"), 2
+        )
+        self.assertEqual(
+            self.metric(text, f"http_request_db_queries_sum{{{labels}}}"), 2
+        )
+        self.assertEqual(
+            self.metric(text, f"http_response_size_bytes_total{{{labels}}}"),
+            2 * len(response.content),
+        )
+        self.assertGreater(
+            self.metric(text, f"http_request_db_seconds_total{{{labels}}}"), 0
+        )
+        self.assertEqual(
+            self.metric(
+                text,
+                'http_request_duration_seconds_count{view="blog-detail",'
+                'method="GET",status="4xx"}',
+            ),
+            1,
+        )
+
+    # Only the scraper with the token reads the metrics
+    def test_requires_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer guess")
+        self.assertEqual(response.status_code, 404)
+        with override_settings(METRICS_TOKEN=""):
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, 404)
+
+    # Under ASGI the queries run in another thread than the middleware
+    async def test_counts_queries_of_async_requests(self):
+        await self.async_client.get("/api/blogs/")
+        text = await sync_to_async(self.scrape)()
+        labels = 'view="blog-list-create",method="GET",status="2xx"'
+        self.assertEqual(
+            self.metric(text, f"http_request_db_queries_sum{{{labels}}}"), 1
+        )
+
+    # With METRICS_DIR the numbers of every worker are added up
+    def test_adds_up_workers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            other = Registry()
+            other.observe(("blog-list-create", "GET", "2xx"), 0.02, 3, 0.01, 100)
+            other.flush(directory)
+            os.rename(
+                os.path.join(directory, f"metrics-{os.getpid()}.json"),
+                os.path.join(directory, "metrics-1.json"),
+            )
+
+            with override_settings(METRICS_DIR=directory):
+                self.client.get("/api/blogs/")
+                text = self.scrape()
+
+        labels = 'view="blog-list-create",method="GET",status="2xx"'
+        self.assertEqual(
+            self.metric(text, f"http_request_duration_seconds_count{{{labels}}}"), 2
+        )
+        self.assertEqual(
+            self.metric(text, f"http_request_db_queries_sum{{{labels}}}"), 4
+        )
+        self.assertEqual(
+            self.metric(text, f'http_request_db_queries_bucket{{{labels},le="5"}}'),
+            2,
+        )
+
+
+# This class is for testing the synthetic data generator
+@override_settings(THROTTLE_COUNTER_STORE=TEST_COUNTER_STORE)
+class SeedBlogTests(APITestCase):
+
+    def test_seed_blog(self):
+        call_command(
+            "seed_blog",
+            users=20,
+            posts=30,
+            likes=200,
+            ratings=100,
+            comments=300,
+            max_depth=4,
+            stdout=StringIO(),
+        )
+        self.assertEqual(User.objects.filter(username__startswith="seed_").count(), 20)
+        self.assertEqual(BlogPost.objects.count(), 30)
+        self.assertEqual(BlogPost.likes.through.objects.count(), 200)
+        self.assertEqual(Rating.objects.count(), 100)
+        self.assertEqual(Comments.objects.count(), 300)
+
+        # Seeded users can log in with the shared password
+        response = self.client.post(
+            "/api/auth/login/", {"username": "seed_3", "password": "Seed-pass-123!"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The first posts get most of the likes
+        posts = list(BlogPost.objects.with_stats().order_by("pk"))
+        self.assertGreater(posts[0].likes_count, posts[-1].likes_count)
+
+        # Replies are nested, but never deeper than max_depth
+        parents = dict(Comments.objects.values_list("pk", "parent_id"))
+        depths = []
+        for pk in parents:
+            depth = 0
+            while parents[pk] is not None:
+                pk, depth = parents[pk], depth + 1
+            depths.append(depth)
+        self.assertGreater(max(depths), 1)
+        self.assertLessEqual(max(depths), 4)
+
+
+# This class is for testing the load driver against a live server
+@override_settings(THROTTLE_COUNTER_STORE=TEST_COUNTER_STORE)
+class LoadTestDriverTests(LiveServerTestCase):
+
+    def test_load_test_report(self):
+        call_command(
+            "seed_blog",
+            users=5,
+            posts=10,
+            likes=10,
+            ratings=10,
+            comments=20,
+            stdout=StringIO(),
+        )
+        output = StringIO()
+        call_command(
+            "load_test",
+            url=self.live_server_url,
+            concurrency=2,
+            duration=1,
+            mix="list=1,detail=1,comments=1,like=1,rate=1,refresh=1",
+            stdout=output,
+        )
+        report = json.loads(output.getvalue())
+        self.assertGreater(report["throughput_rps"], 0)
+        for endpoint, result in report["endpoints"].items():
+            if result["requests"]:
+                self.assertEqual(set(result["statuses"]), {"200"}, endpoint)
+                self.assertIn("p99_ms", result)
+
+
+# This class is for testing the cached OpenAPI schema and the docs pages
+class OpenAPISchemaTests(APITestCase):
+
+    def setUp(self):
+        schema_document.cache_clear()
+        self.addCleanup(schema_document.cache_clear)
+
+    def test_schema_served_with_etag(self):
+        response = self.client.get("/swagger.json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("/blogs/{id}/", json.loads(response.content)["paths"])
+
+        response = self.client.get("/swagger.json", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # The docs pages load the same document
+        page = self.client.get("/swagger/")
+        self.assertEqual(page.status_code, status.HTTP_200_OK)
+        self.assertIn(b"/swagger.json", page.content)
+        response = self.client.get("/redoc/?format=openapi")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("/blogs/{id}/", json.loads(response.content)["paths"])
+
+    def test_schema_read_from_built_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "schema.json")
+            call_command("build_openapi_schema", output=path, stdout=StringIO())
+            with open(path, "rb") as file:
+                built = file.read()
+            with open(path, "wb") as file:
+                file.write(built.replace(b"Blog API", b"Built Blog API"))
+
+            with override_settings(OPENAPI_SCHEMA_FILE=path):
+                response = self.client.get("/swagger.json")
+        self.assertEqual(
+            json.loads(response.content)["info"]["title"], "Built Blog API"
+        )
+
+
+# This class is for testing read replica routing, with a second local database as the replica
+# (not wrapped in a transaction: reads inside one always stay on the primary)
+@override_settings(
+    DATABASE_REPLICAS=["replica"],
+    RELATED_INDEXING="inline",
+    THROTTLE_COUNTER_STORE=TEST_COUNTER_STORE,
+)
+class ReplicaRoutingTests(APITransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        get_counter_store().clear()
+        replicas.invalidate()
+        self.addCleanup(replicas.invalidate)
+        self.user = User.objects.create_user(
+            username="TestUser2", email="Test2@gmail.com", password="123456!Ab"
+        )
+        # Nothing is replicated in the tests, so the replica stays empty
+        self.post = BlogPost.objects.create(
+            title="Test title", content="Test content", author=self.user
+        )
+
+    def authorize(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.cookies.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    # Safe requests read from the replica, writes go to the primary
+    def test_reads_go_to_replica(self):
+        response = self.client.get("/api/blogs/")
+        self.assertEqual(response.json(), [])
+        response = self.client.get(f"/api/blogs/{self.post.id}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.authorize(self.user)
+        response = self.client.post(
+            "/api/blogs/", {"title": "New title", "content": "New content"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(BlogPost.objects.using("default").count(), 2)
+        self.assertEqual(BlogPost.objects.using("replica").count(), 0)
+
+    # After a write, the same user reads from the primary, other clients do not
+    def test_writer_is_pinned_to_primary(self):
+        self.authorize(self.user)
+        response = self.client.post(f"/api/blogs/{self.post.id}/like/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("db_pin", response.cookies)
+
+        # Pinned through the token, even without the cookie
+        self.authorize(self.user)
+        response = self.client.get(f"/api/blogs/{self.post.id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["total_likes"], 1)
+
+        # Other clients keep reading from the replica
+        self.client.cookies.clear()
+        self.client.credentials()
+        response = self.client.get(f"/api/blogs/{self.post.id}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # A replica that lags behind is left out of the rotation
+    def test_lagging_replica_is_skipped(self):
+        with mock.patch("config.replicas.replica_lag", return_value=30.0):
+            response = self.client.get(f"/api/blogs/{self.post.id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        replicas.invalidate()
+        response = self.client.get(f"/api/blogs/{self.post.id}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+# This class is for testing on-demand request profiling
+class RequestProfilingTests(APITestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = os.path.join(directory.name, "profiles")
+        settings_override = override_settings(
+            PROFILING_DIR=self.directory,
+            PROFILING_MAX_FILES=2,
+            PROFILING_EXPLAIN_MS=0,
+            PROFILING_KEY="profiling-test-key",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(
+            username="TestUser2", email="Test2@gmail.com", password="123456!Ab"
+        )
+        self.post = BlogPost.objects.create(
+            title="Test title", content="Test content", author=self.user
+        )
+
+    # Only requests with a valid signed header are profiled
+    def test_signed_header(self):
+        response = self.client.get(f"/api/blogs/{self.post.id}/")
+        self.assertNotIn("X-Profile-Id", response)
+        response = self.client.get(
+            f"/api/blogs/{self.post.id}/", HTTP_X_PROFILE_REQUEST="forged"
+        )
+        self.assertNotIn("X-Profile-Id", response)
+
+        response = self.client.get(
+            f"/api/blogs/{self.post.id}/", HTTP_X_PROFILE_REQUEST=make_token()
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        [profile] = load_profiles()
+        self.assertEqual(profile["id"], response["X-Profile-Id"])
+        self.assertEqual(profile["view"], "blog-detail")
+        self.assertTrue(profile["queries"])
+        self.assertTrue(all("explain" in query for query in profile["queries"]))
+
+        # Only the owner can read the profiles, and the values are not kept
+        self.assertEqual(os.stat(self.directory).st_mode & 0o777, 0o700)
+        path = os.path.join(self.directory, f"{profile['id']}.json")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        params = [value for query in profile["queries"] for value in query["params"]]
+        self.assertIn("<int>", params)
+        self.assertNotIn(repr(self.post.id), params)
+
+        output = StringIO()
+        call_command("request_profiles", "show", profile["id"], stdout=output)
+        self.assertIn("function calls", output.getvalue())
+        self.assertIn("Index Scan", output.getvalue())
+        output = StringIO()
+        call_command("request_profiles", "collapsed", profile["id"], stdout=output)
+        stacks = dict(line.rsplit(" ", 1) for line in output.getvalue().splitlines())
+        self.assertTrue(any(";get (" in stack for stack in stacks))
+        self.assertTrue(all(value.isdigit() for value in stacks.values()))
+
+    # Tokens are signed with PROFILING_KEY only; without it the header is ignored
+    def test_header_needs_profiling_key(self):
+        url = f"/api/blogs/{self.post.id}/"
+        with_secret_key = signing.TimestampSigner(salt="config.profiling").sign(
+            "profile"
+        )
+        response = self.client.get(url, HTTP_X_PROFILE_REQUEST=with_secret_key)
+        self.assertNotIn("X-Profile-Id", response)
+
+        token = make_token()
+        with override_settings(PROFILING_KEY=""):
+            response = self.client.get(url, HTTP_X_PROFILE_REQUEST=token)
+            self.assertNotIn("X-Profile-Id", response)
+            with self.assertRaises(CommandError):
+                call_command("request_profiles", "token", stdout=StringIO())
+
+    # Sampled requests go to the ring buffer, which keeps only the newest files
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MODE="sampling")
+    def test_sampling_and_ring_buffer(self):
+        ids = [self.client.get("/api/blogs/")["X-Profile-Id"] for _ in range(3)]
+        profiles = load_profiles()
+        self.assertEqual([profile["id"] for profile in profiles], ids[1:])
+        self.assertIn("samples", profiles[0])
+
+        output = StringIO()
+        call_command("request_profiles", "list", stdout=output)
+        self.assertIn("GET /api/blogs/ (blog-list-create)", output.getvalue())
+
+
+# This class is for testing the server profile and its warm-up hooks
+class ServerProfileTests(APITestCase):
+    databases = "__all__"
+
+    def load_config(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            import config.gunicorn
+
+            return importlib.reload(config.gunicorn)
+
+    def test_worker_models(self):
+        server = self.load_config(GUNICORN_WORKER_CLASS="gthread", GUNICORN_THREADS="8")
+        self.assertEqual(server.wsgi_app, "config.wsgi:application")
+        self.assertEqual((server.worker_class, server.threads), ("gthread", 8))
+        self.assertTrue(server.preload_app)
+        self.assertGreater(server.max_requests_jitter, 0)
+
+        server = self.load_config(SERVER_MODE="asgi")
+        self.assertEqual(server.wsgi_app, "config.asgi:application")
+        self.assertEqual(server.worker_class, "uvicorn_worker.UvicornWorker")
+
+    def test_warm_up(self):
+        from config.warmup import warm_up_application, warm_up_connections
+
+        with self.assertLogs("config.warmup", "INFO") as logs:
+            warm_up_application()
+        self.assertRegex(logs.output[0], r"Warmed up URL resolver and \d+ serializers")
+        # The replica tests' database is not one requests use
+        with mock.patch.object(
+            connections["replica"], "ensure_connection"
+        ) as replica_connect:
+            warm_up_connections()
+        self.assertIsNotNone(connection.connection)
+        replica_connect.assert_not_called()
+
+
+# URLs of AsyncHandlerTests: the async post detail (ASYNC_READ_VIEWS) in front
+# of the project's URLs
+urlpatterns = [
+    path("api/blogs/<int:pk>/", blog_post_detail, name="blog-detail"),
+    path("", include("config.urls")),
+]
+
+
+# This class is for testing the middleware under the ASGI handler
+@override_settings(ROOT_URLCONF="blogs.tests")
+class AsyncHandlerTests(APITestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            PROFILING_DIR=directory.name, PROFILING_KEY="profiling-test-key"
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(
+            username="TestUser2", email="Test2@gmail.com", password="123456!Ab"
+        )
+        self.post = BlogPost.objects.create(
+            title="Test title", content="Test content", author=self.user
+        )
+
+    # Every middleware runs as a coroutine: none is moved to a thread
+    @override_settings(DEBUG=True)
+    def test_no_middleware_is_adapted(self):
+        with mock.patch("django.core.handlers.base.logger") as logger:
+            ASGIHandler()
+        adapted = [
+            call.args
+            for call in logger.debug.call_args_list
+            if "adapted" in call.args[0]
+        ]
+        self.assertEqual(adapted, [])
+
+    async def test_async_view_through_asgi_handler(self):
+        url = f"/api/blogs/{self.post.id}/"
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await self.async_client.get(
+            url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Async views are not profiled, sync views still are
+        token = make_token()
+        response = await self.async_client.get(
+            url, headers={"X-Profile-Request": token}
+        )
+        self.assertNotIn("X-Profile-Id", response)
+        response = await self.async_client.get(
+            "/api/blogs/", headers={"X-Profile-Request": token}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("X-Profile-Id", response)
+
+
+# This class is for testing the shared-memory cache backend
+class SharedMemoryCacheTests(APITestCase):
+
+    def make_cache(self, **options):
+        options.setdefault("MAX_ENTRIES", 64)
+        options.setdefault("MAX_ENTRY_SIZE", 256)
+        return SharedMemoryCache(self.location, {"OPTIONS": options})
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.location = os.path.join(directory, "cache.mmap")
+        self.cache = self.make_cache()
+
+    def test_cache_api(self):
+        cache = self.cache
+        cache.set("post", {"id": 1})
+        self.assertEqual(cache.get("post"), {"id": 1})
+        self.assertFalse(cache.add("post", "other"))
+        self.assertTrue(cache.add("new", 1))
+        self.assertEqual(cache.incr("new", 5), 6)
+        self.assertEqual(cache.decr("new"), 5)
+        with self.assertRaises(ValueError):
+            cache.incr("missing")
+        self.assertEqual(
+            cache.get_many(["post", "new", "missing"]), {"post": {"id": 1}, "new": 5}
+        )
+        self.assertTrue(cache.delete("post"))
+        self.assertFalse(cache.has_key("post"))
+
+        # A value too large for a slot replaces nothing stale
+        cache.set("big", "small")
+        cache.set("big", "x" * 1000)
+        self.assertIsNone(cache.get("big"))
+
+        cache.clear()
+        self.assertIsNone(cache.get("new"))
+
+    def test_expiry(self):
+        self.cache.set("short", 1, timeout=0.05)
+        self.cache.set("gone", 1, timeout=0)
+        self.assertIsNone(self.cache.get("gone"))
+        self.assertEqual(self.cache.get("short"), 1)
+        self.assertTrue(self.cache.touch("short", None))
+        time.sleep(0.1)
+        self.assertEqual(self.cache.get("short"), 1)
+
+    # Recently read entries survive when their bucket is full
+    def test_clock_eviction(self):
+        self.location += ".small"
+        cache = self.make_cache(MAX_ENTRIES=4, WAYS=4)
+        for number in range(4):
+            cache.set(f"k{number}", number)
+        cache.get("k0")
+        cache.set("k4", 4)
+        self.assertEqual(cache.get("k0"), 0)
+        self.assertEqual(sum(cache.has_key(f"k{number}") for number in range(5)), 4)
+
+    # Every process sees the same entries, and incr() is atomic between them
+    def test_shared_between_processes(self):
+        self.cache.set("counter", 0)
+        context = multiprocessing.get_context("fork")
+
+        def work():
+            cache = self.make_cache()
+            for _ in range(200):
+                cache.incr("counter")
+            cache.set(f"pid:{os.getpid()}", True)
+
+        workers = [context.Process(target=work) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get("counter"), 600)
+        for worker in workers:
+            self.assertTrue(self.cache.get(f"pid:{worker.pid}"))
+
+        # A file made with other options keeps its own geometry
+        self.assertEqual(self.make_cache(MAX_ENTRIES=1024)._table.slots, 64)
+
+
+# This class is for testing the follow graph and the home feed
+@override_settings(
+    FEED_FANOUT="inline",
+    FEED_PAGE_SIZE=2,
+    FEED_FANOUT_LIMIT=3,
+    RELATED_INDEXING="inline",
+)
+class FeedTests(APITestCase):
+
+    def setUp(self):
+        self.reader, self.author, self.other = [
+            User.objects.create_user(
+                username=name, email=f"{name}@test.com", password="123456!Ab"
+            )
+            for name in ("reader", "author", "other")
+        ]
+
+    def login(self, user):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+    def publish(self, user, title):
+        self.login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/blogs/", {"title": title, "content": "Feed content"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def follow(self, follower, followee):
+        self.login(follower)
+        return self.client.post(f"/api/auth/profile/{followee.id}/follow/")
+
+    def read_feed(self, user):
+        self.login(user)
+        titles, url = [], "/api/blogs/feed/"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            titles += [post["title"] for post in response.data["results"]]
+            url = response.data["next"]
+        return titles
+
+    def test_follow_toggle(self):
+        self.publish(self.author, "Before follow")
+        self.assertEqual(
+            self.follow(self.reader, self.author).data["message"], "Followed"
+        )
+        self.assertEqual(Profile.objects.get(user=self.author).followers_count, 1)
+        # The newest posts of the author are copied on follow
+        self.assertEqual(self.read_feed(self.reader), ["Before follow"])
+
+        self.assertEqual(
+            self.follow(self.reader, self.author).data["message"], "Unfollowed"
+        )
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.read_feed(self.reader), [])
+        response = self.follow(self.reader, self.reader)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # New posts are fanned out and read back newest first across pages
+    def test_fan_out_on_write(self):
+        self.follow(self.reader, self.author)
+        for number in range(5):
+            self.publish(self.author, f"Post {number}")
+        self.publish(self.other, "Not followed")
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 5)
+        self.assertEqual(
+            self.read_feed(self.reader),
+            [f"Post {number}" for number in range(4, -1, -1)],
+        )
+
+        self.client.credentials()
+        self.assertEqual(
+            self.client.get("/api/blogs/feed/").status_code,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+        self.login(self.reader)
+        response = self.client.get("/api/blogs/feed/?cursor=bad")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Authors at FEED_FANOUT_LIMIT followers are merged in at read time
+    def test_fan_out_on_read(self):
+        fans = [
+            User.objects.create_user(
+                username=f"fan{number}",
+                email=f"fan{number}@test.com",
+                password="123456!Ab",
+            )
+            for number in range(3)
+        ]
+        for fan in fans:
+            self.follow(fan, self.author)
+        self.follow(fans[0], self.other)
+        self.publish(self.other, "Copied")
+        self.publish(self.author, "Read on demand")
+        self.publish(self.other, "Copied later")
+
+        self.assertFalse(TimelineEntry.objects.filter(author=self.author).exists())
+        self.assertEqual(
+            self.read_feed(fans[0]), ["Copied later", "Read on demand", "Copied"]
+        )
+        self.assertEqual(self.read_feed(fans[1]), ["Read on demand"])
+
+        # Back under the limit, the posts read on demand are copied
+        self.login(fans[2])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/auth/profile/{self.author.id}/follow/")
+        self.assertEqual(TimelineEntry.objects.filter(author=self.author).count(), 2)
+        self.assertEqual(self.read_feed(fans[1]), ["Read on demand"])
+        self.assertEqual(self.read_feed(fans[2]), [])
+
+    # An entry written by a fan-out that raced an unfollow is not shown
+    def test_unfollowed_author_is_not_shown(self):
+        self.follow(self.reader, self.author)
+        post_id = self.publish(self.author, "Raced")
+        self.follow(self.reader, self.author)
+        post = BlogPost.objects.get(pk=post_id)
+        TimelineEntry.objects.create(
+            user=self.reader,
+            post=post,
+            author=self.author,
+            created_at=post.created_at,
+        )
+        self.assertEqual(self.read_feed(self.reader), [])
+
+
+# This class is for testing tags, tag filters and the tag cloud counters
+@override_settings(POSTS_PAGE_SIZE=2)
+class TagTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="tagger", email="tagger@test.com", password="123456!Ab"
+        )
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+    def create(self, title, tags):
+        response = self.client.post(
+            "/api/blogs/",
+            {"title": title, "content": "Tagged", "tags": tags},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def titles(self, query):
+        titles, url = [], f"/api/blogs/?{query}"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            titles += [post["title"] for post in response.data["results"]]
+            url = response.data["next"]
+        return titles
+
+    def cloud(self):
+        return {
+            tag["name"]: tag["post_count"]
+            for tag in self.client.get("/api/blogs/tags/").data
+        }
+
+    def test_tags_are_normalized(self):
+        post = self.create("Normalized", ["Django", " Web  Dev ", "django"])
+        self.assertEqual(post["tags"], ["django", "web-dev"])
+        response = self.client.post(
+            "/api/blogs/",
+            {"title": "Bad", "content": "x", "tags": ["c++"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filters_and_pages(self):
+        self.create("Both", ["django", "python"])
+        self.create("Django only", ["django"])
+        self.create("Python only", ["python"])
+        self.create("Both again", ["python", "django"])
+
+        self.assertEqual(self.titles("tag=django&tag=python"), ["Both again", "Both"])
+        self.assertEqual(
+            self.titles("tag=django&tag=Python&tag_mode=any"),
+            ["Both again", "Python only", "Django only", "Both"],
+        )
+        self.assertEqual(self.titles("tag=rust"), [])
+        # Without filters the list keeps its unpaginated shape
+        self.assertEqual(len(self.client.get("/api/blogs/").data), 4)
+
+    def test_cloud_counts_follow_changes(self):
+        first = self.create("First", ["django", "python"])
+        self.create("Second", ["django"])
+        self.assertEqual(self.cloud(), {"django": 2, "python": 1})
+
+        # One indexed read, no GROUP BY over the posts
+        self.client.credentials()
+        with self.assertNumQueries(1):
+            self.client.get("/api/blogs/tags/")
+        self.client.force_authenticate(self.user)
+
+        self.client.patch(
+            f"/api/blogs/{first['id']}/", {"tags": ["rust"]}, format="json"
+        )
+        self.assertEqual(self.cloud(), {"django": 1, "rust": 1})
+
+        self.client.delete(f"/api/blogs/{first['id']}/")
+        self.assertEqual(self.cloud(), {"django": 1})
+        self.assertEqual(Tag.objects.get(name="rust").post_count, 0)
+
+
+# This class is for testing drafts, scheduled posts and the publish scheduler
+@override_settings(FEED_FANOUT="inline", RELATED_INDEXING="inline")
+class PublishingTests(APITestCase):
+
+    def setUp(self):
+        self.author, self.reader = [
+            User.objects.create_user(
+                username=name, email=f"{name}@test.com", password="123456!Ab"
+            )
+            for name in ("writer", "reader")
+        ]
+        self.client.force_authenticate(self.reader)
+        self.client.post(f"/api/auth/profile/{self.author.id}/follow/")
+        self.client.force_authenticate(self.author)
+
+    def create(self, title, **fields):
+        response = self.client.post(
+            "/api/blogs/",
+            {"title": title, "content": "Later", "tags": ["django"], **fields},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def listed(self):
+        return [post["title"] for post in self.client.get("/api/blogs/").data]
+
+    def test_drafts_are_hidden_until_published(self):
+        draft = self.create("Draft", status="draft")
+        url = f"/api/blogs/{draft['id']}/"
+        self.assertEqual(self.listed(), [])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        response = self.client.get("/api/blogs/drafts/")
+        self.assertEqual([post["title"] for post in response.data], ["Draft"])
+        self.assertEqual(self.client.get("/api/blogs/tags/").data, [])
+
+        self.client.force_authenticate(self.reader)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(f"{url}like/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, {"status": "published"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(response.data["created_at"], draft["created_at"])
+        self.assertEqual(self.listed(), ["Draft"])
+        self.assertEqual(Tag.objects.get(name="django").post_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader).exists())
+
+        # Back to draft: out of the counts and the timelines
+        self.client.patch(url, {"status": "draft"}, format="json")
+        self.assertEqual(Tag.objects.get(name="django").post_count, 0)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+
+    def test_scheduled_post_needs_a_date(self):
+        response = self.client.post(
+            "/api/blogs/",
+            {"title": "When?", "content": "x", "status": "scheduled"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("publish_at", response.data)
+
+    def test_scheduler_publishes_due_posts_in_batches(self):
+        now = timezone.now()
+        for number in range(3):
+            self.create(
+                f"Due {number}",
+                status="scheduled",
+                publish_at=now - timedelta(minutes=3 - number),
+            )
+        self.create("Future", status="scheduled", publish_at=now + timedelta(hours=1))
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("publish_scheduled", "--batch-size", "2", stdout=out)
+        self.assertIn("Published 3", out.getvalue())
+        self.assertEqual(self.listed(), ["Due 2", "Due 1", "Due 0"])
+        post = BlogPost.objects.get(title="Due 0")
+        self.assertEqual(post.created_at, post.publish_at)
+        self.assertEqual(post.version, 1)
+        self.assertEqual(Tag.objects.get(name="django").post_count, 3)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(
+            BlogPost.objects.get(title="Future").status, BlogPost.SCHEDULED
+        )
+
+        # A batch costs the same queries whatever its size
+        for number in range(5):
+            self.create(f"Late {number}", status="scheduled", publish_at=now)
+        with self.assertNumQueries(6):
+            self.assertEqual(publish_batch(10), 5)
+
+
+# This class is for testing that concurrent schedulers skip each other's posts
+@override_settings(FEED_FANOUT="inline", RELATED_INDEXING="inline")
+class PublishingConcurrencyTests(APITransactionTestCase):
+
+    def test_locked_posts_are_skipped(self):
+        author = User.objects.create_user(
+            username="writer", email="writer@test.com", password="123456!Ab"
+        )
+        past = timezone.now() - timedelta(minutes=1)
+        first, second = [
+            BlogPost.objects.create(
+                title=title,
+                content="x",
+                author=author,
+                status=BlogPost.SCHEDULED,
+                publish_at=past,
+            )
+            for title in ("First", "Second")
+        ]
+
+        published = []
+
+        def other_scheduler():
+            try:
+                published.append(publish_batch(10))
+            finally:
+                connection.close()
+
+        # This "scheduler" holds the lock on the first post meanwhile
+        with transaction.atomic():
+            BlogPost.objects.select_for_update().get(pk=first.pk)
+            thread = threading.Thread(target=other_scheduler)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(published, [1])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, BlogPost.SCHEDULED)
+        self.assertEqual(second.status, BlogPost.PUBLISHED)
+        self.assertEqual(publish_batch(10), 1)
+
+
+# This class is for testing the JSONL export and the resumable import of posts
+class TransferTests(APITestCase):
+
+    def setUp(self):
+        self.alice, self.bob = [
+            User.objects.create_user(
+                username=name, email=f"{name}@test.com", password="123456!Ab"
+            )
+            for name in ("alice", "bob")
+        ]
+        post = BlogPost.objects.create(
+            title="Exported", content="Body", author=self.alice, tags=["django"]
+        )
+        BlogPost.objects.create(
+            title="Draft", content="Later", author=self.bob, status=BlogPost.DRAFT
+        )
+        root = Comments.objects.create(blog=post, author=self.bob, content="Root")
+        reply = Comments.objects.create(
+            blog=post, author=self.alice, content="Reply", parent=root
+        )
+        Comments.objects.create(
+            blog=post, author=self.bob, content="Reply to reply", parent=reply
+        )
+        post.likes.add(self.bob)
+        Rating.objects.create(user=self.bob, blog=post, score=4)
+        self.created_at = post.created_at
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "blog.jsonl")
+        call_command("export_blog", "-o", self.path, stderr=StringIO())
+        BlogPost.objects.all().delete()
+
+    def import_file(self, *args):
+        out = StringIO()
+        call_command("import_blog", self.path, "--chunk-size", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def assert_imported(self):
+        post = BlogPost.objects.get(title="Exported")
+        self.assertEqual(post.created_at, self.created_at)
+        self.assertEqual(post.author, self.alice)
+        self.assertEqual(BlogPost.objects.get(title="Draft").status, BlogPost.DRAFT)
+        self.assertEqual(BlogPost.objects.count(), 2)
+
+        deepest = Comments.objects.get(content="Reply to reply")
+        self.assertEqual(deepest.blog, post)
+        self.assertEqual(deepest.parent.parent.content, "Root")
+        self.assertEqual(Comments.objects.count(), 3)
+        self.assertEqual(list(post.likes.all()), [self.bob])
+        self.assertEqual(post.ratings.get().score, 4)
+        self.assertEqual(Tag.objects.get(name="django").post_count, 1)
+
+    def test_round_trip(self):
+        with open(self.path, encoding="utf-8") as handle:
+            types = [json.loads(line)["type"] for line in handle]
+        self.assertEqual(types, ["post"] * 2 + ["comment"] * 3 + ["like", "rating"])
+
+        self.assertIn("Done: 7 rows imported, 0 skipped", self.import_file())
+        self.assert_imported()
+        self.assertTrue(ImportRun.objects.get().finished)
+        self.assertFalse(ImportedRow.objects.exists())
+
+        # Running it again does not duplicate anything
+        self.assertIn("already imported", self.import_file())
+        self.assertEqual(BlogPost.objects.count(), 2)
+
+    def test_unknown_users_are_skipped(self):
+        self.bob.delete()
+        self.assertIn("Done: 1 rows imported, 6 skipped", self.import_file())
+        self.assertEqual(BlogPost.objects.get().title, "Exported")
+        # The reply's parent (by bob) was skipped, and so was its reply
+        self.assertFalse(Comments.objects.exists())
+
+    def test_resume_after_crash(self):
+        with mock.patch.object(
+            ImportBlogCommand, "import_likes", side_effect=RuntimeError("crash")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.import_file()
+        run = ImportRun.objects.get()
+        self.assertFalse(run.finished)
+        self.assertEqual(run.imported, 5)
+        self.assertGreater(run.offset, 0)
+
+        self.assertIn("Resuming at byte", self.import_file())
+        self.assert_imported()
+
+
+# This class is for testing the revision history of posts
+@override_settings(REVISION_SNAPSHOT_INTERVAL=3)
+class RevisionTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="editor", email="editor@test.com", password="123456!Ab"
+        )
+        self.client.force_authenticate(self.user)
+        self.versions = [
+            "First line.\nSecond line.",
+            "First line.\nSecond line, edited.",
+            "Intro.\nFirst line.\nSecond line, edited.",
+            "Intro.\nSecond line, edited twice.",
+            "Intro.",
+            "Rewritten from scratch.",
+        ]
+        response = self.client.post(
+            "/api/blogs/", {"title": "Draft 1", "content": self.versions[0]}
+        )
+        self.post_id = response.data["id"]
+        for number, content in enumerate(self.versions[1:], start=2):
+            self.client.patch(
+                f"/api/blogs/{self.post_id}/",
+                {"title": f"Draft {number}", "content": content},
+                format="json",
+            )
+
+    def test_delta_round_trip(self):
+        for old in self.versions:
+            for new in self.versions:
+                self.assertEqual(apply_delta(old, make_delta(old, new)), new)
+        text = "word " * 1000
+        self.assertEqual(make_delta(text, text + "more"), [1000, "more"])
+
+    def test_every_version_is_rebuilt(self):
+        response = self.client.get(f"/api/blogs/{self.post_id}/revisions/")
+        self.assertEqual([item["number"] for item in response.data], [6, 5, 4, 3, 2, 1])
+        self.assertEqual(response.data[0]["editor"], "editor")
+        self.assertEqual(
+            list(
+                PostRevision.objects.filter(snapshot=True).values_list(
+                    "number", flat=True
+                )
+            ),
+            [1, 4],
+        )
+
+        for number, content in enumerate(self.versions, start=1):
+            # One query for the post, one for the snapshot and its deltas
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    f"/api/blogs/{self.post_id}/revisions/{number}/"
+                )
+            self.assertEqual(response.data["content"], content)
+            self.assertEqual(response.data["title"], f"Draft {number}")
+
+        response = self.client.get(f"/api/blogs/{self.post_id}/revisions/9/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unchanged_save_adds_no_revision(self):
+        self.client.patch(
+            f"/api/blogs/{self.post_id}/", {"tags": ["django"]}, format="json"
+        )
+        self.assertEqual(PostRevision.objects.count(), 6)
+
+    def test_history_starts_at_first_edit_of_older_posts(self):
+        post = BlogPost.objects.create(
+            title="Old", content="Old body", author=self.user
+        )
+        self.client.patch(f"/api/blogs/{post.id}/", {"content": "New body"})
+        response = self.client.get(f"/api/blogs/{post.id}/revisions/diff/?from=1&to=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("-Old body", response.data["diff"])
+        self.assertIn("+New body", response.data["diff"])
+        self.assertFalse(response.data["title_changed"])
+
+    def test_diff_and_visibility(self):
+        url = f"/api/blogs/{self.post_id}/revisions/diff/"
+        response = self.client.get(f"{url}?from=2&to=3")
+        self.assertIn("+Intro.", response.data["diff"])
+        self.assertTrue(response.data["title_changed"])
+        self.assertEqual(
+            self.client.get(f"{url}?from=2").status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+        self.client.patch(
+            f"/api/blogs/{self.post_id}/", {"status": "draft"}, format="json"
+        )
+        self.client.force_authenticate(None)
+        self.assertEqual(
+            self.client.get(f"/api/blogs/{self.post_id}/revisions/").status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+
+
+# This class is for testing the rendered content, excerpts and list payloads
+@override_settings(EXCERPT_LENGTH=40, READING_WORDS_PER_MINUTE=5)
+class RenderingTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="writer", email="writer@test.com", password="123456!Ab"
+        )
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            "/api/blogs/",
+            {
+                "title": "Markdown",
+                "content": "# Title\n\nSome **bold** text and a "
+                "[link](https://example.com) <script>alert(1)</script>"
+                "[bad](javascript:alert(1)) &amp; more words here.",
+            },
+        )
+        self.post_id = response.data["id"]
+
+    def test_content_is_rendered_and_sanitized(self):
+        response = self.client.get(f"/api/blogs/{self.post_id}/")
+        html = response.data["content_html"]
+        self.assertIn("<h1>Title</h1>", html)
+        self.assertIn("<strong>bold</strong>", html)
+        self.assertIn('href="https://example.com"', html)
+        self.assertIn('rel="nofollow noopener noreferrer"', html)
+        self.assertNotIn("<script", html)
+        self.assertNotIn("javascript:", html)
+
+        self.assertEqual(
+            response.data["excerpt"], "Title Some bold text and a link bad &…"
+        )
+        self.assertEqual(response.data["word_count"], 12)
+        self.assertEqual(response.data["reading_time"], 3)
+
+        # Rendered again when the content changes, and only written by the server
+        self.client.patch(
+            f"/api/blogs/{self.post_id}/",
+            {"content": "Short *one*.", "excerpt": "Mine"},
+            format="json",
+        )
+        post = BlogPost.objects.get(pk=self.post_id)
+        self.assertEqual(post.content_html, "<p>Short <em>one</em>.</p>")
+        self.assertEqual(post.excerpt, "Short one.")
+
+    def test_list_does_not_read_content(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/blogs/")
+        self.assertNotIn("content", response.data[0])
+        self.assertNotIn("content_html", response.data[0])
+        self.assertTrue(response.data[0]["excerpt"].startswith("Title Some bold"))
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertNotIn('"blogs_blogpost"."content"', sql)
+        self.assertNotIn('"blogs_blogpost"."content_html"', sql)
+
+
+# ?fields= / ?exclude= trim the response and the SQL behind it
+class SparseFieldsetTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="writer", email="writer@test.com", password="123456!Ab"
+        )
+        self.post = BlogPost.objects.create(
+            title="Sparse", content="Some *content*", author=self.user
+        )
+        self.post.likes.add(self.user)
+        Rating.objects.create(blog=self.post, user=self.user, score=5)
+
+    def test_list_reads_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/blogs/?fields=id,title")
+        self.assertEqual(response.json(), [{"id": self.post.id, "title": "Sparse"}])
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertNotIn('"blogs_blogpost"."excerpt"', sql)
+        self.assertNotIn("blogs_rating", sql)
+        self.assertNotIn("blogs_blogpost_likes", sql)
+        self.assertNotIn("users_user", sql)
+
+        # Only the annotation of the field asked for is computed
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/blogs/?fields=id,total_likes")
+        self.assertEqual(response.json()[0]["total_likes"], 1)
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertIn("blogs_blogpost_likes", sql)
+        self.assertNotIn("blogs_rating", sql)
+
+    def test_exclude_and_unknown_fields(self):
+        response = self.client.get(
+            f"/api/blogs/{self.post.id}/?exclude=content,content_html"
+        )
+        self.assertNotIn("content", response.data)
+        self.assertEqual(response.data["author"], "writer")
+        self.assertEqual(response.data["average_rating"], 5)
+
+        response = self.client.get("/api/blogs/?fields=id,secret")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("secret", str(response.data["fields"]))
+
+        request = RequestFactory().get("/api/blogs/?fields=secret")
+        response = async_to_sync(blog_post_list)(request)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # The async views answer with the same trimmed data
+    def test_async_views_match_sync_views(self):
+        factory = RequestFactory()
+        url = f"/api/blogs/{self.post.id}/?fields=id,author,average_rating"
+        response = async_to_sync(blog_post_detail)(factory.get(url), pk=self.post.id)
+        self.assertEqual(json.loads(response.content), self.client.get(url).json())
+
+        url = "/api/blogs/?exclude=excerpt,tags"
+        response = async_to_sync(blog_post_list)(factory.get(url))
+        self.assertEqual(json.loads(response.content), self.client.get(url).json())
+
+    # Writes load the whole row and answer with every field
+    def test_updates_ignore_fieldsets(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(
+            f"/api/blogs/{self.post.id}/?fields=id", {"title": "New"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["title"], "New")
+        self.assertEqual(
+            BlogPost.objects.get(pk=self.post.id).content, "Some *content*"
+        )
+
+
+# POST /api/batch/ runs several API calls in one request
+class BatchTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="writer", email="writer@test.com", password="123456!Ab"
+        )
+        self.post = BlogPost.objects.create(
+            title="Batch", content="Batched *content*", author=self.user
+        )
+        Comments.objects.create(blog=self.post, author=self.user, content="First")
+        self.client.force_authenticate(self.user)
+
+    def batch(self, *requests, **options):
+        return self.client.post(
+            "/api/batch/", {"requests": list(requests), **options}, format="json"
+        )
+
+    def test_sub_requests_share_one_response(self):
+        detail = self.client.get(f"/api/blogs/{self.post.id}/")
+        response = self.batch(
+            {"id": "post", "name": "blog-detail", "kwargs": {"pk": self.post.id}},
+            {
+                "id": "comments",
+                "name": "comment-list",
+                "kwargs": {"pk": self.post.id},
+                "query": {"fields": "content"},
+            },
+            {"name": "user-profile", "kwargs": {"user_id": self.user.id}},
+            {"method": "POST", "name": "blog-like", "kwargs": {"pk": self.post.id}},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        post, comments, profile, like = response.data["responses"]
+        self.assertEqual(post["id"], "post")
+        self.assertEqual(post["body"], detail.json())
+        self.assertEqual(post["headers"]["ETag"], detail["ETag"])
+        self.assertEqual(comments["body"], [{"content": "First"}])
+        self.assertIsNone(profile["id"])
+        self.assertEqual(profile["status"], status.HTTP_200_OK)
+        self.assertEqual(like["body"], {"message": "Liked"})
+        self.assertEqual(self.post.likes.count(), 1)
+
+        # Conditional headers are the sub-request's own
+        detail = self.client.get(f"/api/blogs/{self.post.id}/")
+        response = self.batch(
+            {
+                "name": "blog-detail",
+                "kwargs": {"pk": self.post.id},
+                "headers": {"If-None-Match": detail["ETag"]},
+            }
+        )
+        self.assertEqual(response.data["responses"][0]["status"], 304)
+
+    # A failed sub-request is rolled back and reported alone
+    def test_failures_are_per_request(self):
+        with mock.patch(
+            "blogs.views.Rating.objects.update_or_create", side_effect=RuntimeError
+        ), self.assertLogs("config.batch", "ERROR"):
+            response = self.batch(
+                {"method": "POST", "name": "blog-like", "kwargs": {"pk": self.post.id}},
+                {
+                    "method": "POST",
+                    "name": "blog-rate",
+                    "kwargs": {"pk": self.post.id},
+                    "body": {"score": 4},
+                },
+                {"name": "blog-detail", "kwargs": {"pk": 0}},
+            )
+        statuses = [result["status"] for result in response.data["responses"]]
+        self.assertEqual(statuses, [200, 500, 404])
+        self.assertEqual(self.post.likes.count(), 1)
+
+        self.client.force_authenticate(None)
+        response = self.batch(
+            {"method": "POST", "name": "blog-like", "kwargs": {"pk": self.post.id}}
+        )
+        self.assertEqual(response.data["responses"][0]["status"], 401)
+
+    # A view that answers 4xx after writing keeps none of its writes
+    def test_error_response_is_rolled_back(self):
+        def write_then_fail(view, request, pk):
+            Rating.objects.create(user=request.user, blog_id=pk, score=5)
+            raise ValidationError("Failed after writing.")
+
+        with mock.patch.object(BlogPostRateView, "post", write_then_fail):
+            response = self.batch(
+                {"method": "POST", "name": "blog-rate", "kwargs": {"pk": self.post.id}},
+                {"method": "POST", "name": "blog-like", "kwargs": {"pk": self.post.id}},
+            )
+        statuses = [result["status"] for result in response.data["responses"]]
+        self.assertEqual(statuses, [400, 200])
+        self.assertFalse(Rating.objects.exists())
+        self.assertEqual(self.post.likes.count(), 1)
+
+    @override_settings(BATCH_MAX_REQUESTS=2, BATCH_MAX_RESPONSE_BYTES=100)
+    def test_limits_and_validation(self):
+        detail = {"name": "blog-detail", "kwargs": {"pk": self.post.id}}
+        response = self.batch(detail, detail, detail)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.batch(detail)
+        self.assertEqual(response.data["responses"][0]["status"], 413)
+
+        for request in (
+            {"name": "blog-detail"},
+            {"name": "no-such-url"},
+            {"name": "api-batch"},
+            {"name": "metrics"},
+            {**detail, "headers": {"Authorization": "Bearer other"}},
+        ):
+            response = self.batch(request)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# Concurrent batches read in threads, on the snapshot of the batch's transaction
+class ConcurrentBatchTests(APITransactionTestCase):
+    databases = {"default"}
+
+    def test_concurrent_reads_match_sequential_reads(self):
+        user = User.objects.create_user(
+            username="writer", email="writer@test.com", password="123456!Ab"
+        )
+        posts = [
+            BlogPost.objects.create(title=f"Post {n}", content="Text", author=user)
+            for n in range(4)
+        ]
+        requests = [
+            {"id": str(post.id), "name": "blog-detail", "kwargs": {"pk": post.id}}
+            for post in posts
+        ]
+        self.client.force_authenticate(user)
+        sequential = self.client.post(
+            "/api/batch/", {"requests": requests}, format="json"
+        )
+
+        threads = []
+        run_request = batch.run_request
+
+        def record_thread(*args):
+            threads.append(threading.current_thread().name)
+            return run_request(*args)
+
+        with mock.patch("config.batch.run_request", record_thread):
+            concurrent = self.client.post(
+                "/api/batch/", {"requests": requests, "concurrent": True}, format="json"
+            )
+        self.assertEqual(concurrent.data, sequential.data)
+        self.assertTrue(all(name.startswith("batch") for name in threads))
+
+
+class BackgroundTests(APITransactionTestCase):
+    databases = {"default"}
+
+    def test_one_pool_per_name(self):
+        executors = []
+        threads = [
+            threading.Thread(
+                target=lambda: executors.append(background.get_executor("test-pool"))
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(executors), 8)
+        self.assertTrue(all(executor is executors[0] for executor in executors))
+
+    def test_job_connections_are_closed(self):
+        def job(pk):
+            BlogPost.objects.filter(pk=pk).exists()
+            return threading.current_thread().name, connections["default"]
+
+        name, job_connection = background.submit("test-pool", job, 1).result()
+        self.assertTrue(name.startswith("test-pool"))
+        self.assertIsNot(job_connection, connections["default"])
+        self.assertIsNone(job_connection.connection)
+
+
+# Views are counted in memory and written by the periodic flush
+@override_settings(VIEW_FLUSH_INTERVAL=3600)
+class ViewCountTests(APITestCase):
+
+    def setUp(self):
+        viewcounts.buffer.clear()
+        self.user = User.objects.create_user(
+            username="writer", email="writer@test.com", password="123456!Ab"
+        )
+        self.post = BlogPost.objects.create(
+            title="Viewed", content="Text", author=self.user
+        )
+        self.url = f"/api/blogs/{self.post.id}/"
+
+    def test_views_are_buffered_then_flushed(self):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(
+            [query for query in queries if not query["sql"].startswith("SELECT")]
+        )
+        self.client.get(self.url)
+        self.client.force_authenticate(None)
+        self.client.get(self.url)
+        response = self.client.get(f"{self.url}views/")
+        self.assertEqual(response.data["views"], 3)
+        self.assertEqual(response.data["viewers"]["estimate"], 2)
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertFalse(PostViews.objects.exists())
+
+        self.assertEqual(viewcounts.flush_views(), 1)
+        row = PostViews.objects.get(post=self.post)
+        self.assertEqual((row.views, row.unique_viewers), (3, 2))
+
+        # The row and this worker's new views are added up; a 304 is a view too
+        etag = self.client.get(self.url, HTTP_USER_AGENT="other")["ETag"]
+        response = self.client.get(
+            self.url, HTTP_USER_AGENT="other", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(f"{self.url}views/")
+        self.assertEqual(response.data["views"], 5)
+        self.assertEqual(response.data["viewers"]["estimate"], 3)
+        viewcounts.flush_views()
+        self.assertEqual(PostViews.objects.get(post=self.post).views, 5)
+
+        # Drafts are not counted, and lists do not show counts
+        self.post.status = BlogPost.DRAFT
+        self.post.save()
+        self.client.force_authenticate(self.user)
+        self.client.get(self.url)
+        self.assertEqual(viewcounts.buffer.pending(self.post.id), (0, {}))
+        self.assertNotIn("views", self.client.get("/api/blogs/drafts/").data[0])
+        self.assertNotIn("views", self.client.get(self.url).data)
+
+    # The buffer is flushed every VIEW_FLUSH_INTERVAL, whether or not views come
+    def test_flush_timer(self):
+        with mock.patch("blogs.viewcounts.threading.Thread") as thread, mock.patch(
+            "blogs.viewcounts._timer_pid", None
+        ):
+            self.client.get(self.url)
+            self.client.get(self.url)
+        thread.assert_called_once_with(
+            target=viewcounts._flush_periodically,
+            name="view-flush-timer",
+            daemon=True,
+        )
+
+        # An empty buffer is not flushed
+        with mock.patch("blogs.viewcounts.time.sleep") as sleep, mock.patch.object(
+            background, "submit"
+        ) as submit:
+            for _ in range(2):
+                sleep.side_effect = [None, StopIteration]
+                with self.assertRaises(StopIteration):
+                    viewcounts._flush_periodically()
+                viewcounts.buffer.clear()
+        sleep.assert_called_with(3600)
+        submit.assert_called_once_with("view-flush", viewcounts._flush_in_background)
+
+    def test_failed_flush_is_kept(self):
+        self.client.get(self.url)
+        with mock.patch(
+            "blogs.viewcounts.estimate", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            viewcounts.flush_views()
+        self.assertEqual(viewcounts.buffer.pending(self.post.id)[0], 1)
+        viewcounts.flush_views()
+        self.assertEqual(PostViews.objects.get(post=self.post).views, 1)
+
+    # The estimates stay within the advertised bounds
+    def test_unique_viewer_estimates(self):
+        for count in (50, 3000, 200000):
+            sketch = bytearray(viewcounts.REGISTERS)
+            for number in range(count):
+                register, rank = viewcounts.viewer_register(f"user:{number}")
+                if rank > sketch[register]:
+                    sketch[register] = rank
+            bounds = viewcounts.viewer_bounds(viewcounts.estimate(sketch))
+            self.assertLessEqual(bounds["low"], count)
+            self.assertGreaterEqual(bounds["high"], count)
+
+
+@override_settings(RELATED_INDEXING="inline", RELATED_POSTS=2)
+class RelatedPostsTests(APITestCase):
+
+    POSTS = {
+        "django": ("Django views", "Python views render templates with Django."),
+        "orm": ("Django ORM", "Python queries through Django models and querysets."),
+        "asyncio": ("Python asyncio", "Coroutines and event loops in Python."),
+        "bread": ("Sourdough bread", "Bake bread with flour, water and starter."),
+        "pasta": ("Fresh pasta", "Knead flour and eggs, then boil the pasta."),
+    }
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="writer", email="writer@test.com", password="123456!Ab"
+        )
+        self.posts = {
+            key: BlogPost.objects.create(title=title, content=content, author=self.user)
+            for key, (title, content) in self.POSTS.items()
+        }
+        call_command("index_related", stdout=StringIO())
+
+    def related(self, key):
+        response = self.client.get(f"/api/blogs/{self.posts[key].id}/related/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post["id"] for post in response.data]
+
+    def ids(self, *keys):
+        return [self.posts[key].id for key in keys]
+
+    # Every list holds the best neighbours of the current signatures
+    def assertIndexConsistent(self):
+        for post_id in set(PostTerm.objects.values_list("post_id", flat=True)):
+            expected = [other for other, _ in similar_posts(post_id)[:2]]
+            listed = RelatedPost.objects.filter(post_id=post_id).order_by(
+                "-score", "related_id"
+            )
+            self.assertEqual(
+                list(listed.values_list("related_id", flat=True)), expected
+            )
+
+    def test_build_and_endpoint(self):
+        self.assertEqual(self.related("django"), self.ids("orm", "asyncio"))
+        self.assertEqual(self.related("pasta"), self.ids("bread"))
+        self.assertIndexConsistent()
+
+        # One query, whatever the number of posts
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                f"/api/blogs/{self.posts['orm'].id}/related/?fields=id,title"
+            )
+        self.assertEqual(
+            response.data[0], {"id": self.posts["django"].id, "title": "Django views"}
+        )
+
+        response = self.client.get("/api/blogs/999999/related/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        draft = BlogPost.objects.create(
+            title="Django draft",
+            content="Django",
+            author=self.user,
+            status=BlogPost.DRAFT,
+        )
+        response = self.client.get(f"/api/blogs/{draft.id}/related/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # index_related runs on the configured driver; psycopg 3 (DB_POOL=1) gets
+    # the COPY data through cursor.copy()
+    def test_index_related_command(self):
+        output = StringIO()
+        call_command("index_related", stdout=output)
+        self.assertIn("Indexed 5 posts", output.getvalue())
+        self.assertEqual(PostTerm.objects.values("post_id").distinct().count(), 5)
+
+        cursor = mock.MagicMock()
+        with mock.patch("blogs.related.is_psycopg3", True), mock.patch.object(
+            connection, "cursor"
+        ) as make_cursor:
+            make_cursor.return_value.__enter__.return_value = cursor
+            related._copy(IndexTerm, ["name", "idf"], [("django", 1.5)])
+        cursor.copy.assert_called_once_with(
+            f"COPY {IndexTerm._meta.db_table} (name, idf) FROM STDIN"
+        )
+        copy = cursor.copy.return_value.__enter__.return_value
+        copy.write.assert_called_once_with("django\t1.5\n")
+
+    def test_index_follows_changes(self):
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/blogs/",
+                {
+                    "title": "Django views",
+                    "content": "Django views and Django templates.",
+                },
+                format="json",
+            )
+        new = response.data["id"]
+        self.assertIn(new, self.related("django"))
+        self.assertIndexConsistent()
+
+        # An edit moves the post to other lists
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f"/api/blogs/{new}/",
+                {"title": "Pasta bread", "content": "Pasta and bread from flour."},
+                format="json",
+            )
+        self.assertNotIn(new, self.related("django"))
+        self.assertIn(new, self.related("bread"))
+        self.assertIndexConsistent()
+
+        # Unpublished or deleted posts leave the index; their places are refilled
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/blogs/{new}/", {"status": "draft"}, format="json")
+        self.assertNotIn(new, self.related("bread"))
+        self.assertFalse(PostTerm.objects.filter(post_id=new).exists())
+        self.assertIndexConsistent()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/blogs/{self.posts['orm'].id}/")
+        self.assertEqual(self.related("django"), self.ids("asyncio"))
+        self.assertIndexConsistent()
+
+    def test_missing_posts_are_indexed(self):
+        post = BlogPost.objects.create(
+            title="Python asyncio tasks", content="Python tasks", author=self.user
+        )
+        self.assertEqual(self.client.get(f"/api/blogs/{post.id}/related/").data, [])
+        call_command("index_related", "--missing", stdout=StringIO())
+        self.assertEqual(self.related("asyncio")[0], post.id)
+        self.assertIndexConsistent()
@@ -0,0 +1,108 @@
+import json
+from contextlib import contextmanager
+
+from django.db import connection
+
+"""
+
+JSONL format of export_blog and import_blog: one object per line, with a
+"type" key, in this order:
+
+    {"type": "post", "id": 1, "author": "alice", "title": ..., "content": ...,
+     "tags": [...], "status": "published", "publish_at": null,
+     "created_at": "2025-01-01T10:00:00+00:00", "updated_at": ...}
+    {"type": "comment", "id": 7, "post": 1, "author": "bob", "parent": null,
+     "content": ..., "created_at": ...}
+    {"type": "like", "post": 1, "user": "bob"}
+    {"type": "rating", "post": 1, "user": "bob", "score": 4}
+
+Users are referred to by username; they are moved with export_users and
+import_users first. Comments are written in id order, and a reply is always
+created after the comment it answers, so a parent comes before its replies.
+
+"""
+
+# Fields of each record type, in the order export_blog reads them from the database
+RECORD_FIELDS = {
+    "post": [
+        "id",
+        "author",
+        "title",
+        "content",
+        "tags",
+        "status",
+        "publish_at",
+        "created_at",
+        "updated_at",
+    ],
+    "comment": ["id", "post", "author", "parent", "content", "created_at"],
+    "like": ["post", "user"],
+    "rating": ["post", "user", "score"],
+}
+
+
+def _default(value):
+    return value.isoformat()
+
+
+def dump_record(record_type, row):
+    record = {"type": record_type, **dict(zip(RECORD_FIELDS[record_type], row))}
+    return json.dumps(record, default=_default, ensure_ascii=False) + "\n"
+
+
+"""
+
+Reads (type, records, end offset) chunks from a JSONL file opened in binary
+mode, starting at the current position. A chunk holds up to `size` records of
+one type; the end offset is where the next chunk starts, which is what an
+interrupted import resumes from.
+
+"""
+
+
+def read_chunks(handle, size):
+    chunk, chunk_type = [], None
+    while True:
+        position = handle.tell()
+        line = handle.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if chunk and (record["type"] != chunk_type or len(chunk) == size):
+            yield chunk_type, chunk, position
+            chunk = []
+        chunk_type = record["type"]
+        chunk.append(record)
+    if chunk:
+        yield chunk_type, chunk, handle.tell()
+
+
+# Take `count` ids from the table's sequence, to know the new ids before inserting
+def allocate_ids(model, count):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) "
+            "FROM generate_series(1, %s)",
+            [model._meta.db_table, model._meta.pk.column, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Let bulk_create write the exported dates instead of the current time
+@contextmanager
+def keep_timestamps(*models):
+    fields = [
+        (field, field.auto_now, field.auto_now_add)
+        for model in models
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
@@ -1,14 +1,52 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
+    BlogDraftListView,
+    BlogFeedView,
     BlogPostDetailView,
     BlogPostRateView,
+    BlogPostRevisionDetailView,
+    BlogPostRevisionDiffView,
+    BlogPostRevisionListView,
+    BlogPostViewsView,
     BlogPostLikeView,
     BlogPostListCreateView,
+    BlogRelatedPostsView,
+    TagCloudView,
 )
 
+# Under ASGI the public reads are served by async views (see blogs/async_views.py)
+if settings.ASYNC_READ_VIEWS:
+    from .async_views import blog_post_list, blog_post_detail
+
+    list_view, detail_view = blog_post_list, blog_post_detail
+else:
+    list_view = BlogPostListCreateView.as_view()
+    detail_view = BlogPostDetailView.as_view()
+
 urlpatterns = [
-    path("", BlogPostListCreateView.as_view(), name="blog-list-create"),
-    path("<int:pk>/", BlogPostDetailView.as_view(), name="blog-detail"),
+    path("", list_view, name="blog-list-create"),
+    path("feed/", BlogFeedView.as_view(), name="blog-feed"),
+    path("drafts/", BlogDraftListView.as_view(), name="blog-drafts"),
+    path("tags/", TagCloudView.as_view(), name="blog-tags"),
+    path("<int:pk>/", detail_view, name="blog-detail"),
     path("<int:pk>/like/", BlogPostLikeView.as_view(), name="blog-like"),
     path("<int:pk>/rate/", BlogPostRateView.as_view(), name="blog-rate"),
+    path("<int:pk>/related/", BlogRelatedPostsView.as_view(), name="blog-related"),
+    path("<int:pk>/views/", BlogPostViewsView.as_view(), name="blog-views"),
+    path(
+        "<int:pk>/revisions/",
+        BlogPostRevisionListView.as_view(),
+        name="blog-revisions",
+    ),
+    path(
+        "<int:pk>/revisions/diff/",
+        BlogPostRevisionDiffView.as_view(),
+        name="blog-revision-diff",
+    ),
+    path(
+        "<int:pk>/revisions/<int:number>/",
+        BlogPostRevisionDetailView.as_view(),
+        name="blog-revision-detail",
+    ),
 ]
@@ -1,11 +1,31 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import patch_cache_control
 from rest_framework import generics, permissions, status
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from config.conditional import conditional_resource, request_user_id
+from config.fieldsets import (
+    SparseFieldsetViewMixin,
+    requested_fields,
+    select_fields,
+)
+from .feed import feed_page, remove_post, schedule_fan_out
+from .pagination import KeysetPagination, decode_cursor, next_link
 from .permissions import IsAuthorOrReadOnly
-from blogs.models import BlogPost, Rating
-from blogs.serializer import BlogPostSerializer
+from .related import schedule_index
+from .revisions import load_revision, record_revision, unified_diff
+from .viewcounts import record_view, view_stats
+from blogs.models import BlogPost, PostRevision, Rating, RelatedPost, Tag
+from blogs.serializer import (
+    BlogPostListSerializer,
+    BlogPostSerializer,
+    PostRevisionSerializer,
+    TagSerializer,
+    normalize_tag,
+)
 
 """
 
@@ -16,40 +36,210 @@ creates a record in the BlogPost table.
 """
 
 
-class BlogPostListCreateView(generics.ListCreateAPIView):
-    queryset = BlogPost.objects.all().order_by("-created_at")
-    serializer_class = BlogPostSerializer
+class BlogPostListCreateView(SparseFieldsetViewMixin, generics.ListCreateAPIView):
+    queryset = BlogPost.objects.published().order_by("-created_at")
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    # The keys of the keyset pages
+    fieldset_keep = ("created_at",)
+
+    # The list shows excerpts; a created post is returned in full
+    # (there is no request while the OpenAPI schema is generated)
+    def get_serializer_class(self):
+        if self.request is None or self.request.method == "POST":
+            return BlogPostSerializer
+        return BlogPostListSerializer
+
+    # ?tag=a&tag=b keeps posts with all the tags, and with any of them with ?tag_mode=any
+    def get_queryset(self):
+        queryset = self.select_fields(super().get_queryset())
+        tags = [
+            normalize_tag(name) for name in self.request.query_params.getlist("tag")
+        ]
+        tags = [tag for tag in tags if tag]
+        if not tags:
+            return queryset
+        if self.request.query_params.get("tag_mode") == "any":
+            return queryset.filter(tags__overlap=tags)
+        return queryset.filter(tags__contains=tags)
 
     # Creates a record in the BlogPost table
+    # (and, once published, copies it to the followers' timelines and adds it
+    # to the related posts index in the background)
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            post = serializer.save(author=self.request.user)
+            record_revision(post, self.request.user)
+        if post.is_published:
+            schedule_fan_out([post.pk])
+            schedule_index([post.pk])
+
+
+# The user's drafts and scheduled posts, most recently edited first
+class BlogDraftListView(SparseFieldsetViewMixin, generics.ListAPIView):
+    serializer_class = BlogPostListSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return BlogPost.objects.none()
+        drafts = (
+            BlogPost.objects.filter(author=self.request.user)
+            .exclude(status=BlogPost.PUBLISHED)
+            .order_by("-updated_at")
+        )
+        return self.select_fields(drafts)
+
+
+# Posts of the authors the user follows, newest first, paginated with a cursor
+class BlogFeedView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        cursor = decode_cursor(request.query_params.get("cursor"))
+        fields = requested_fields(request.query_params, BlogPostListSerializer)
+        posts = select_fields(BlogPost.objects.all(), BlogPostListSerializer, fields)
+        posts, next_cursor = feed_page(request.user, cursor, posts=posts)
+        serializer = BlogPostListSerializer(
+            posts, many=True, context={"fields": fields}
+        )
+        return Response(
+            {"next": next_link(request, next_cursor), "results": serializer.data},
+            status=status.HTTP_200_OK,
+        )
+
+
+# Tag cloud: the most used tags with their post counts, read from the maintained counters
+class TagCloudView(generics.ListAPIView):
+    serializer_class = TagSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get_queryset(self):
+        tags = Tag.objects.filter(post_count__gt=0).order_by("-post_count", "name")
+        return tags[: settings.TAG_CLOUD_SIZE]
+
+
+# Validators of the post detail (sync and async). A GET of a published post is
+# counted here, in memory (blogs/viewcounts.py), since a matching If-None-Match
+# is answered with 304 before the view runs
+def post_validators(request, pk):
+    result = BlogPost.validators(pk, request_user_id(request))
+    if result is None:
+        return None
+    etag, last_modified, published = result
+    if published and request.method == "GET":
+        record_view(request, pk)
+    return etag, last_modified
 
 
 # This class helps the author edit or delete the post
-class BlogPostDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = BlogPost.objects.all()
+# (a GET with a matching If-None-Match is answered with 304 before any serializer work,
+# a PUT/PATCH with a stale If-Match gets 412)
+@conditional_resource(post_validators)
+class BlogPostDetailView(
+    SparseFieldsetViewMixin, generics.RetrieveUpdateDestroyAPIView
+):
     serializer_class = BlogPostSerializer
     permission_classes = [IsAuthorOrReadOnly]
 
+    # Drafts and scheduled posts are only found by their author
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return BlogPost.objects.none()
+        return self.select_fields(BlogPost.objects.visible_to(self.request.user))
+
+    # Each edit of the title or the content is kept as a revision; the row is
+    # locked so that concurrent edits get consecutive revisions
+    def perform_update(self, serializer):
+        was_published = serializer.instance.is_published
+        with transaction.atomic():
+            previous = (
+                BlogPost.objects.select_for_update()
+                .filter(pk=serializer.instance.pk)
+                .values_list("title", "content")
+                .get()
+            )
+            post = serializer.save()
+            record_revision(post, self.request.user, previous)
+        if post.is_published and not was_published:
+            schedule_fan_out([post.pk])
+        elif was_published and not post.is_published:
+            remove_post(post.pk)
+        # The related posts index only holds published posts
+        edited = (post.title, post.content) != previous
+        if post.is_published != was_published or (edited and post.is_published):
+            schedule_index([post.pk])
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         self.perform_destroy(instance)
         return Response({"message": "Blog Post Deleted"}, status=status.HTTP_200_OK)
 
+    # The index rows of the post go with it; the posts that listed it among
+    # their related posts find another one
+    def perform_destroy(self, instance):
+        listing = list(
+            RelatedPost.objects.filter(related=instance).values_list(
+                "post_id", flat=True
+            )
+        )
+        instance.delete()
+        if listing:
+            schedule_index([], listing)
+
+
+# The posts most similar to a published post, read from the index built by
+# blogs/related.py (one scan of the related_top index)
+class BlogRelatedPostsView(SparseFieldsetViewMixin, generics.ListAPIView):
+    serializer_class = BlogPostListSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return BlogPost.objects.none()
+        related = BlogPost.objects.published().filter(
+            related_from__post_id=self.kwargs.get("pk")
+        )
+        return self.select_fields(related.order_by("-related_from__score"))
+
+    # A post without related posts is only looked up when the list is empty
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not response.data:
+            get_object_or_404(BlogPost.objects.published(), pk=kwargs["pk"])
+        return response
+
+
+# View count and unique viewers of a post. They change with every view, so they
+# are not part of the detail (whose ETag would then never match) and are served
+# here without validators
+class BlogPostViewsView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk):
+        posts = BlogPost.objects.visible_to(request.user).select_related("view_stats")
+        response = Response(view_stats(get_object_or_404(posts, pk=pk)))
+        patch_cache_control(response, no_cache=True)
+        return response
+
 
 # This class is for performing like and dislike operations
 class BlogPostLikeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    # The version is bumped after the toggle, in the same transaction, so a
+    # read never pairs the new ETag with the old count
     def post(self, request, pk):
-        blog = get_object_or_404(BlogPost, pk=pk)
-        if request.user in blog.likes.all():
-            blog.likes.remove(request.user)
-            return Response({"message": "Unliked"}, status=status.HTTP_200_OK)
-        else:
-            blog.likes.add(request.user)
-            return Response({"message": "Liked"}, status=status.HTTP_200_OK)
+        blog = get_object_or_404(BlogPost.objects.published(), pk=pk)
+        with transaction.atomic():
+            if request.user in blog.likes.all():
+                blog.likes.remove(request.user)
+                message = "Unliked"
+            else:
+                blog.likes.add(request.user)
+                message = "Liked"
+            BlogPost.bump_version(blog.pk)
+        return Response({"message": message}, status=status.HTTP_200_OK)
 
 
 # This class is for recording the rating for each post in the Rating table
@@ -57,7 +247,7 @@ class BlogPostRateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, pk):
-        blog = get_object_or_404(BlogPost, pk=pk)
+        blog = get_object_or_404(BlogPost.objects.published(), pk=pk)
         score = request.data.get("score")
         if not score or int(score) not in [1, 2, 3, 4, 5]:
             return Response(
@@ -65,10 +255,70 @@ class BlogPostRateView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        rating, created = Rating.objects.update_or_create(
-            user=request.user, blog=blog, defaults={"score": score}
-        )
+        with transaction.atomic():
+            rating, created = Rating.objects.update_or_create(
+                user=request.user, blog=blog, defaults={"score": score}
+            )
+            BlogPost.bump_version(blog.pk)
         return Response(
             {"message": "Rating saved", "score": rating.score},
             status=status.HTTP_200_OK,
         )
+
+
+# Revision history of a post, newest first (content is not included)
+class BlogPostRevisionListView(generics.ListAPIView):
+    serializer_class = PostRevisionSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return PostRevision.objects.none()
+        post = get_object_or_404(
+            BlogPost.objects.visible_to(self.request.user), pk=self.kwargs["pk"]
+        )
+        return post.revisions.select_related("editor").defer("data").order_by("-number")
+
+
+# One version of a post, rebuilt from the nearest snapshot
+class BlogPostRevisionDetailView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk, number):
+        get_object_or_404(BlogPost.objects.visible_to(request.user), pk=pk)
+        revision = load_revision(pk, number)
+        if revision is None:
+            return Response(
+                {"message": "Revision not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        data = PostRevisionSerializer(revision).data
+        data["content"] = revision.content
+        return Response(data, status=status.HTTP_200_OK)
+
+
+# Unified diff of the content between two versions: ?from=2&to=5
+class BlogPostRevisionDiffView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk):
+        get_object_or_404(BlogPost.objects.visible_to(request.user), pk=pk)
+        try:
+            numbers = [int(request.query_params[name]) for name in ("from", "to")]
+        except (KeyError, ValueError):
+            raise ValidationError(
+                {"message": "'from' and 'to' revision numbers are required"}
+            )
+        old, new = [load_revision(pk, number) for number in numbers]
+        if old is None or new is None:
+            return Response(
+                {"message": "Revision not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(
+            {
+                "from": old.number,
+                "to": new.number,
+                "title_changed": old.title != new.title,
+                "diff": unified_diff(old, new, f"r{old.number}", f"r{new.number}"),
+            },
+            status=status.HTTP_200_OK,
+        )
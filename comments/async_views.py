@@ -0,0 +1,26 @@
+from config.async_api import async_read_view, not_found, render
+from blogs.models import BlogPost
+from comments.models import build_comment_tree
+from comments.serializer import CommentSerializer
+from comments.views import CommentCreateListView, comment_rows
+from config.fieldsets import requested_fields
+
+"""
+
+Async version of the comment listing, used when ASYNC_READ_VIEWS is on.
+The whole comment tree of the post is read with one query.
+
+"""
+
+
+@async_read_view(CommentCreateListView.as_view())
+async def comment_list(request, pk):
+    if not await BlogPost.objects.published().filter(pk=pk).aexists():
+        return not_found(BlogPost)
+    fields = requested_fields(request.GET, CommentSerializer)
+    comments = comment_rows(pk, fields)
+    roots, children = build_comment_tree([c async for c in comments.order_by("pk")])
+    serializer = CommentSerializer(
+        roots, many=True, context={"children": children, "fields": fields}
+    )
+    return render(serializer.data)
@@ -17,3 +17,15 @@ class Comments(models.Model):
 
     def __str__(self):
         return f"{self.author.username} commented on : {self.blog.title}"
+
+
+# Group the comments of a post by parent so a whole tree is served from one query
+def build_comment_tree(comments):
+    roots, children = [], {}
+    for comment in comments:
+        if comment.parent_id is None:
+            roots.append(comment)
+        else:
+            children.setdefault(comment.parent_id, []).append(comment)
+    roots.sort(key=lambda comment: comment.created_at, reverse=True)
+    return roots, children
@@ -1,16 +1,28 @@
 from rest_framework import serializers
+from config.fieldsets import FieldQuery, SparseFieldsetMixin
 from .models import Comments
 
 
 # This class is for the serializer, and we have created a custom method for replies
-class CommentSerializer(serializers.ModelSerializer):
+# (without "replies" in ?fields=, the list view does not read the replies at all)
+class CommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source="author.username")
     replies = serializers.SerializerMethodField()
 
+    field_queries = {
+        "author": FieldQuery(columns=["author__username"], related=["author"]),
+    }
+
     class Meta:
         model = Comments
         fields = ["id", "blog", "author", "content", "parent", "replies", "created_at"]
 
     # Custom method for replies
+    # (uses the "children" map of build_comment_tree from the context when there is one)
     def get_replies(self, obj):
-        return CommentSerializer(obj.replies.all(), many=True).data
+        children = self.context.get("children")
+        if children is None:
+            return CommentSerializer(obj.replies.all(), many=True).data
+        return CommentSerializer(
+            children.get(obj.pk, []), many=True, context=self.context
+        ).data
@@ -1,13 +1,20 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory, override_settings
 from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
 from rest_framework import status
+from .async_views import comment_list
 from .models import Comments
 from blogs.models import BlogPost
+from users.tests import TEST_COUNTER_STORE
 
 User = get_user_model()
 
 
 # This class is for testing operations on comments in the (comments app)
+@override_settings(THROTTLE_COUNTER_STORE=TEST_COUNTER_STORE)
 class CommentTests(APITestCase):
 
     # In this function, we temporarily register and log in once, and create a post to test this program
@@ -107,3 +114,44 @@ class CommentTests(APITestCase):
             {"content": "Updated Content", "blog": self.post.id},
         )
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    # Nested replies come back in the tree, from the sync and the async view alike
+    def test_comment_tree_sync_and_async(self):
+        parent = Comments.objects.create(
+            blog=self.post, author=self.user1, content="Parent"
+        )
+        reply = Comments.objects.create(
+            blog=self.post, author=self.user1, content="Reply", parent=parent
+        )
+        Comments.objects.create(
+            blog=self.post, author=self.user1, content="Reply 2", parent=reply
+        )
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/blogs/{self.post.id}/comments/")
+        data = response.json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["replies"][0]["replies"][0]["content"], "Reply 2")
+
+        request = RequestFactory().get(f"/api/blogs/{self.post.id}/comments/")
+        async_response = async_to_sync(comment_list)(request, pk=self.post.id)
+        self.assertEqual(json.loads(async_response.content), data)
+
+    # Without "replies" in ?fields= only the top-level comments are read
+    def test_comment_fields(self):
+        parent = Comments.objects.create(
+            blog=self.post, author=self.user1, content="Root"
+        )
+        Comments.objects.create(
+            blog=self.post, author=self.user1, content="Reply", parent=parent
+        )
+
+        url = f"/api/blogs/{self.post.id}/comments/?fields=id,content"
+        # The token's user, the post, and the root comments without their authors
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.json(), [{"id": parent.id, "content": "Root"}])
+
+        request = RequestFactory().get(url)
+        async_response = async_to_sync(comment_list)(request, pk=self.post.id)
+        self.assertEqual(json.loads(async_response.content), response.json())
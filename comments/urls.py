@@ -1,10 +1,15 @@
+from django.conf import settings
 from django.urls import path
 from .views import CommentCreateListView, CommentDetailView
 
+# Under ASGI the comment listing is served by an async view (see comments/async_views.py)
+if settings.ASYNC_READ_VIEWS:
+    from .async_views import comment_list as list_view
+else:
+    list_view = CommentCreateListView.as_view()
+
 urlpatterns = [
-    path(
-        "<int:pk>/comments/", CommentCreateListView.as_view(), name="comment-list"
-    ),  # pk = BlogPost Id
+    path("<int:pk>/comments/", list_view, name="comment-list"),  # pk = BlogPost Id
     path(
         "comments/<int:pk>/crud/", CommentDetailView.as_view(), name="comment-create"
     ),  # Comment Id
@@ -3,12 +3,25 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from blogs.permissions import IsAuthorOrReadOnly
-from .models import Comments
+from .models import Comments, build_comment_tree
 from blogs.models import BlogPost
 from comments.serializer import CommentSerializer
+from config.fieldsets import requested_fields, select_fields
 from .permission import IsAuthenticatedOrGuest
 
 
+# The comments of a post with the columns of the requested fields;
+# without "replies" only the top-level comments are read
+def comment_rows(blog_id, fields=None):
+    comments = Comments.objects.filter(blog_id=blog_id)
+    if fields is not None and "replies" not in fields:
+        comments = comments.filter(parent__isnull=True)
+    # build_comment_tree files the comments by parent and orders them by date
+    return select_fields(
+        comments, CommentSerializer, fields, keep=("parent", "created_at")
+    )
+
+
 # This view class is for creating a new comment for a post
 class CommentCreateListView(APIView):
 
@@ -16,16 +29,18 @@ class CommentCreateListView(APIView):
 
     # Method for listing comments of the desired post
     def get(self, request, pk):
-        blog_id = get_object_or_404(BlogPost, pk=pk)
-        comment = Comments.objects.filter(blog=blog_id, parent=None).order_by(
-            "-created_at"
+        get_object_or_404(BlogPost.objects.published().only("pk"), pk=pk)
+        fields = requested_fields(request.query_params, CommentSerializer)
+        comments = comment_rows(pk, fields)
+        roots, children = build_comment_tree(comments.order_by("pk"))
+        serializer = CommentSerializer(
+            roots, many=True, context={"children": children, "fields": fields}
         )
-        serializer = CommentSerializer(comment, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     # Method for creating a comment for the desired post
     def post(self, request, pk):
-        blog = get_object_or_404(BlogPost, pk=pk)
+        blog = get_object_or_404(BlogPost.objects.published(), pk=pk)
         serializer = CommentSerializer(data=request.data, context={"request": request})
         serializer.is_valid(raise_exception=True)
         comment = serializer.save(author=request.user, blog=blog)
@@ -0,0 +1,89 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+"""
+
+Helpers for the async read-only views used under ASGI (ASYNC_READ_VIEWS=1).
+
+DRF views are synchronous, so the public GET endpoints get plain async Django
+views that reuse the DRF authentication classes and serializers; everything
+else (and every write) still goes through the original DRF view.
+
+"""
+
+
+def render(data, status_code=status.HTTP_200_OK, headers=None):
+    response = HttpResponse(
+        JSONRenderer().render(data),
+        status=status_code,
+        content_type="application/json",
+        headers=headers,
+    )
+    return response
+
+
+# Run the configured DRF authenticators the way APIView.perform_authentication does
+async def authenticate(request):
+    for authenticator_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        authenticator = authenticator_class()
+        result = await sync_to_async(authenticator.authenticate)(request)
+        if result is not None:
+            request.user, request.auth = result
+            return
+    request.auth = None
+
+
+# Same body as DRF sends when get_object_or_404 fails
+def not_found(model):
+    return render(
+        {"detail": f"No {model._meta.object_name} matches the given query."},
+        status.HTTP_404_NOT_FOUND,
+    )
+
+
+"""
+
+Decorator for the async GET handler of an endpoint.
+GET and HEAD are answered by the async handler; any other method is handed to
+the synchronous DRF view so that writes behave exactly as before.
+An invalid token is refused with the same 401 body and header as DRF sends,
+and an APIException raised by the handler (a bad ?fields=) is rendered as DRF
+renders it.
+
+"""
+
+
+def async_read_view(sync_view):
+    sync_handler = sync_to_async(sync_view)
+
+    def decorator(handler):
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return await sync_handler(request, *args, **kwargs)
+            try:
+                await authenticate(request)
+            except exceptions.APIException as exc:
+                headers = {}
+                authenticator = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]()
+                header = authenticator.authenticate_header(request)
+                if header:
+                    headers["WWW-Authenticate"] = header
+                detail = exc.detail
+                if not isinstance(detail, dict):
+                    detail = {"detail": detail}
+                return render(detail, exc.status_code, headers)
+            try:
+                return await handler(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return render(exc.detail, exc.status_code)
+
+        view.csrf_exempt = True
+        return view
+
+    return decorator
@@ -0,0 +1,42 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+"""
+
+Thread pools for the work that runs after the response: view count flushes,
+related posts updates, feed fan-out, avatar variants and concurrent batch reads.
+
+Each pool is created on first use, once per process (after the gunicorn fork),
+and is named after the job; its threads are named after the pool. submit()
+closes the connections the job opened when it returns: a pool thread is idle
+between jobs and should not hold a connection.
+
+"""
+
+_lock = threading.Lock()
+_executors = {}
+
+
+# The pool named name, with workers threads, created on first use
+def get_executor(name, workers=1):
+    with _lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = _executors[name] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=name
+            )
+        return executor
+
+
+def _run(func, args):
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+# Run func(*args) in the pool named name; returns its Future
+def submit(name, func, *args, workers=1):
+    return get_executor(name, workers).submit(_run, func, args)
@@ -0,0 +1,242 @@
+import json
+import logging
+from io import BytesIO
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, transaction
+from django.urls import NoReverseMatch, resolve, reverse
+from rest_framework import generics, permissions, serializers, status
+from rest_framework.response import Response
+
+from config import background
+
+logger = logging.getLogger(__name__)
+
+"""
+
+Batch requests: POST /api/batch/ runs several API calls in one round trip.
+
+    {
+        "requests": [
+            {"id": "post", "name": "blog-detail", "kwargs": {"pk": 7}},
+            {"id": "comments", "name": "comment-list", "kwargs": {"pk": 7},
+             "query": {"fields": "id,content"}},
+            {"id": "like", "method": "POST", "name": "blog-like", "kwargs": {"pk": 7}}
+        ],
+        "concurrent": false
+    }
+
+Each sub-request names an API URL (its name in the URLconf and kwargs) and is
+run in-process by the view behind it, with the permissions, throttles and
+serializers that view always uses. The batch is authenticated once and the
+sub-requests run as the same user. The response lists, in order, the id,
+status, headers and body of every sub-request.
+
+The sub-requests share the batch's connection and run in one transaction,
+each inside a savepoint, so a failed one is rolled back alone. A batch of
+reads only (GET / HEAD) runs in a REPEATABLE READ READ ONLY transaction: every
+sub-request sees the same snapshot of the database. With "concurrent": true
+such a batch is spread over BATCH_WORKERS threads; each opens its own
+transaction on the snapshot exported by the batch's (pg_export_snapshot), so
+they still see the same data. Batches with writes always run in order.
+
+Limits: at most BATCH_MAX_REQUESTS sub-requests; every statement of a
+sub-request is cancelled after BATCH_STATEMENT_TIMEOUT milliseconds; a
+sub-response larger than BATCH_MAX_RESPONSE_BYTES is replaced by a 413.
+
+"""
+
+METHODS = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE")
+READ_METHODS = ("GET", "HEAD")
+# The only headers a sub-request sets itself; the others are the batch's
+HEADERS = ("If-Match", "If-None-Match", "If-Modified-Since", "If-Unmodified-Since")
+
+
+class SubRequestSerializer(serializers.Serializer):
+    id = serializers.CharField(required=False, max_length=100)
+    method = serializers.ChoiceField(choices=METHODS, default="GET")
+    name = serializers.CharField()
+    kwargs = serializers.DictField(required=False, default=dict)
+    query = serializers.DictField(
+        child=serializers.CharField(allow_blank=True), required=False, default=dict
+    )
+    headers = serializers.DictField(
+        child=serializers.CharField(), required=False, default=dict
+    )
+    body = serializers.JSONField(required=False)
+
+    def validate(self, attrs):
+        try:
+            path = reverse(attrs["name"], kwargs=attrs["kwargs"])
+        except NoReverseMatch:
+            raise serializers.ValidationError(
+                {"name": "No API endpoint has this name and kwargs."}
+            )
+        if not path.startswith("/api/") or path == reverse("api-batch"):
+            raise serializers.ValidationError(
+                {"name": "This endpoint cannot be called in a batch."}
+            )
+        unknown = set(attrs["headers"]) - set(HEADERS)
+        if unknown:
+            raise serializers.ValidationError(
+                {"headers": f"Unsupported header(s): {', '.join(sorted(unknown))}"}
+            )
+        attrs["path"] = path
+        return attrs
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True, allow_empty=False)
+    concurrent = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f"At most {settings.BATCH_MAX_REQUESTS} requests per batch."
+            )
+        return value
+
+
+# A WSGI request for the sub-request, with the batch's other headers
+def build_request(request, sub):
+    body = b""
+    if "body" in sub:
+        body = json.dumps(sub["body"]).encode()
+    environ = {
+        key: value
+        for key, value in request.META.items()
+        if not key.startswith("HTTP_IF_")
+        and key not in ("CONTENT_TYPE", "CONTENT_LENGTH")
+    }
+    environ.update(
+        {
+            "REQUEST_METHOD": sub["method"],
+            "SCRIPT_NAME": "",
+            "PATH_INFO": sub["path"],
+            "QUERY_STRING": urlencode(sub["query"]),
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": BytesIO(body),
+        }
+    )
+    for name, value in sub["headers"].items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+    sub_request = WSGIRequest(environ)
+    # Authenticated once for the whole batch (DRF's Request reads these)
+    if request.user.is_authenticated:
+        sub_request._force_auth_user = request.user
+        sub_request._force_auth_token = request.auth
+    return sub_request
+
+
+def _body(response):
+    if not response.content:
+        return None
+    if response.get("Content-Type", "").startswith("application/json"):
+        return json.loads(response.content)
+    return response.content.decode(response.charset, errors="replace")
+
+
+def _result(sub, status_code, headers, body):
+    return {
+        "id": sub.get("id"),
+        "status": status_code,
+        "headers": headers,
+        "body": body,
+    }
+
+
+def _error(sub, status_code, detail):
+    return _result(sub, status_code, {}, {"detail": detail})
+
+
+# Run one sub-request in a savepoint of the current transaction
+def run_request(request, sub):
+    sub_request = build_request(request, sub)
+    match = resolve(sub["path"])
+    view = match.func
+    if iscoroutinefunction(view):
+        view = async_to_sync(view)
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                timeout = int(settings.BATCH_STATEMENT_TIMEOUT)
+                cursor.execute(f"SET LOCAL statement_timeout = {timeout}")
+            response = view(sub_request, *match.args, **match.kwargs)
+            if hasattr(response, "render"):
+                response.render()
+            # DRF answers its exceptions with a 4xx response instead of raising;
+            # what the view wrote before failing goes with the savepoint
+            if response.status_code >= 400:
+                transaction.set_rollback(True)
+    except Exception:
+        logger.exception("Batch sub-request %s %s failed", sub["method"], sub["path"])
+        return _error(sub, status.HTTP_500_INTERNAL_SERVER_ERROR, "Server error.")
+
+    if response.streaming:
+        return _error(
+            sub, status.HTTP_400_BAD_REQUEST, "Streaming responses cannot be batched."
+        )
+    if len(response.content) > settings.BATCH_MAX_RESPONSE_BYTES:
+        return _error(
+            sub,
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            "The response is too large for a batch; request it on its own.",
+        )
+    return _result(sub, response.status_code, dict(response.headers), _body(response))
+
+
+# Run a read in a worker thread, on the snapshot of the batch's transaction
+def _run_on_snapshot(snapshot, request, sub):
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", [snapshot])
+        return run_request(request, sub)
+
+
+def run_batch(request, subs, concurrent=False):
+    read_only = all(sub["method"] in READ_METHODS for sub in subs)
+    # Tests and ATOMIC_REQUESTS already run in a transaction whose level is set
+    own_transaction = not connection.in_atomic_block
+    with transaction.atomic():
+        if own_transaction and read_only:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+                )
+                if concurrent and len(subs) > 1 and settings.BATCH_WORKERS > 1:
+                    cursor.execute("SELECT pg_export_snapshot()")
+                    snapshot = cursor.fetchone()[0]
+                    futures = [
+                        background.submit(
+                            "batch",
+                            _run_on_snapshot,
+                            snapshot,
+                            request,
+                            sub,
+                            workers=settings.BATCH_WORKERS,
+                        )
+                        for sub in subs
+                    ]
+                    return [future.result() for future in futures]
+        return [run_request(request, sub) for sub in subs]
+
+
+# Several API calls in one request (see the module docstring)
+class BatchView(generics.GenericAPIView):
+    serializer_class = BatchSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        responses = run_batch(
+            request,
+            serializer.validated_data["requests"],
+            serializer.validated_data["concurrent"],
+        )
+        return Response({"responses": responses}, status=status.HTTP_200_OK)
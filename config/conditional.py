@@ -0,0 +1,110 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from config.replicas import token_user_id
+
+"""
+
+Conditional requests (ETag / Last-Modified, If-None-Match / If-Match) for
+detail views.
+
+`validators(request, **kwargs)` runs one narrow query and returns
+(etag, last_modified) for the requested object, or None if it does not exist.
+It runs before the view, so a 304 Not Modified or a 412 Precondition Failed
+never reaches the serializer or the aggregate queries. The result is kept on
+the request so the ETag and the date come from the same query.
+
+Since they run before DRF authenticates the request, validators of objects
+that are not visible to everyone take the user from request_user_id() and
+return None for objects the user cannot see: no ETag, and no 304 or 412 that
+would reveal them.
+
+"""
+
+_NOT_FETCHED = object()
+
+
+# Id of the user DRF will authenticate, without a query: the user set by a
+# batch (or the test client), else the user of a valid access token
+def request_user_id(request):
+    user = getattr(request, "_force_auth_user", None)
+    if user is not None:
+        return user.pk if user.is_authenticated else None
+    return token_user_id(request)
+
+
+def conditional_resource(validators):
+    def _validators(request, *args, **kwargs):
+        cached = getattr(request, "_conditional_validators", _NOT_FETCHED)
+        if cached is _NOT_FETCHED:
+            cached = validators(request, *args, **kwargs)
+            request._conditional_validators = cached
+        return cached
+
+    def etag_func(request, *args, **kwargs):
+        result = _validators(request, *args, **kwargs)
+        return result[0] if result else None
+
+    def last_modified_func(request, *args, **kwargs):
+        result = _validators(request, *args, **kwargs)
+        return result[1] if result else None
+
+    def decorator(dispatch):
+        conditional_dispatch = condition(etag_func, last_modified_func)(dispatch)
+
+        @wraps(dispatch)
+        def inner(request, *args, **kwargs):
+            response = conditional_dispatch(request, *args, **kwargs)
+
+            # After a successful change, hand back the new validators for If-Match
+            if request.method in ("PUT", "PATCH") and response.status_code == 200:
+                result = validators(request, *args, **kwargs)
+                if result:
+                    etag, last_modified = result
+                    response.headers["ETag"] = f'"{etag}"'
+                    if last_modified:
+                        response.headers["Last-Modified"] = http_date(
+                            last_modified.timestamp()
+                        )
+            return response
+
+        return inner
+
+    # Applied to the class, so it wraps dispatch() before DRF builds its Request
+    return method_decorator(decorator, name="dispatch")
+
+
+# Same checks for the async read views (GET and HEAD only, writes go to the sync view)
+def async_conditional(validators):
+    async_validators = sync_to_async(validators)
+
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return await view(request, *args, **kwargs)
+            result = await async_validators(request, *args, **kwargs)
+            etag = last_modified = None
+            if result:
+                etag = quote_etag(result[0])
+                if result[1]:
+                    last_modified = int(result[1].timestamp())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag:
+                response.headers.setdefault("ETag", etag)
+            if last_modified and not response.has_header("Last-Modified"):
+                response.headers["Last-Modified"] = http_date(last_modified)
+            return response
+
+        return inner
+
+    return decorator
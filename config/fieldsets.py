@@ -0,0 +1,143 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+"""
+
+Sparse fieldsets: ?fields=id,title keeps only those fields of the response,
+?exclude=content drops fields from it (both may be combined).
+
+They trim the SQL as well as the JSON. Each serializer maps its fields to the
+query work they need in `field_queries`:
+    columns      model fields to load (a field may reach through a relation:
+                 "author__username")
+    related      relations to join with select_related
+    annotate     queryset methods that add the annotations the field reads
+A field that is not in the map and whose source is a model field needs that
+column only. select_fields() then loads the columns of the requested fields
+with .only(), joins only the relations they use and adds only the
+annotations they read; everything else is never queried.
+
+The serializer drops the other fields through SparseFieldsetMixin, which
+reads the selection from context["fields"].
+
+"""
+
+FieldQuery = namedtuple(
+    "FieldQuery", ["columns", "related", "annotate"], defaults=[(), (), ()]
+)
+
+
+class SparseFieldsetMixin:
+    field_queries = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get("fields")
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
+
+
+# Query work of every field the serializer can output
+@lru_cache(maxsize=None)
+def field_queries(serializer_class):
+    serializer = serializer_class()
+    model = serializer_class.Meta.model
+    queries = {}
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in serializer_class.field_queries:
+            queries[name] = serializer_class.field_queries[name]
+            continue
+        try:
+            model._meta.get_field(field.source)
+            queries[name] = FieldQuery(columns=[field.source])
+        except FieldDoesNotExist:
+            queries[name] = FieldQuery()
+    return queries
+
+
+def _names(value):
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+# The field names asked for with ?fields= / ?exclude=, or None for all of them
+def requested_fields(query_params, serializer_class):
+    if "fields" not in query_params and "exclude" not in query_params:
+        return None
+    available = field_queries(serializer_class)
+    fields = _names(query_params.get("fields", "")) or list(available)
+    exclude = set(_names(query_params.get("exclude", "")))
+    unknown = sorted((set(fields) | exclude) - set(available))
+    if unknown:
+        raise ValidationError(
+            {"fields": f"Unknown field(s): {', '.join(unknown)}"},
+        )
+    return frozenset(name for name in fields if name not in exclude)
+
+
+"""
+
+Applies the query work of the selected fields (all readable fields when
+`names` is None) to a queryset. `keep` lists columns the view itself needs,
+e.g. the keys of a keyset page. With `load_all` every column is read, for
+objects that are going to be saved.
+
+"""
+
+
+def select_fields(queryset, serializer_class, names=None, keep=(), load_all=False):
+    queries = field_queries(serializer_class)
+    selected = [
+        query for name, query in queries.items() if names is None or name in names
+    ]
+    related = sorted({name for query in selected for name in query.related})
+    if related:
+        queryset = queryset.select_related(*related)
+    for method in dict.fromkeys(name for query in selected for name in query.annotate):
+        queryset = getattr(queryset, method)()
+    if load_all:
+        return queryset
+    columns = dict.fromkeys(
+        [
+            queryset.model._meta.pk.name,
+            *keep,
+            *(column for query in selected for column in query.columns),
+        ]
+    )
+    return queryset.only(*columns)
+
+
+# For generic views: sparse fieldsets on reads, every column for writes
+class SparseFieldsetViewMixin:
+    # Columns the view needs whatever fields are asked for
+    fieldset_keep = ()
+
+    def get_requested_fields(self):
+        if not hasattr(self, "_requested_fields"):
+            self._requested_fields = requested_fields(
+                self.request.query_params, self.get_serializer_class()
+            )
+        return self._requested_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request is not None and self.request.method in SAFE_METHODS:
+            context["fields"] = self.get_requested_fields()
+        return context
+
+    def select_fields(self, queryset):
+        serializer_class = self.get_serializer_class()
+        if self.request.method not in SAFE_METHODS:
+            return select_fields(queryset, serializer_class, load_all=True)
+        return select_fields(
+            queryset,
+            serializer_class,
+            self.get_requested_fields(),
+            keep=self.fieldset_keep,
+        )
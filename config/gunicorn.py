@@ -0,0 +1,89 @@
+import gc
+import multiprocessing
+import os
+
+"""
+
+Gunicorn configuration, used by entrypoint.sh:
+
+    gunicorn -c python:config.gunicorn
+
+GUNICORN_WORKER_CLASS picks the worker model:
+    gthread  (default) threads per worker, for views that wait on the database
+    sync     one request at a time per worker
+    uvicorn  ASGI with the async read views (SERVER_MODE=asgi selects it too)
+
+With GUNICORN_PRELOAD=1 (default) Django is imported and warmed up once in the
+master and the workers share that memory after fork; gc.freeze() keeps the
+collector from touching (and so copying) those shared pages. Workers restart
+after GUNICORN_MAX_REQUESTS requests, plus a random jitter so they do not all
+restart at once, which bounds any slow leak.
+
+"""
+
+worker_model = os.getenv(
+    "GUNICORN_WORKER_CLASS",
+    "uvicorn" if os.getenv("SERVER_MODE") == "asgi" else "gthread",
+)
+
+if worker_model == "uvicorn":
+    wsgi_app = "config.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    # Each async request uses its own thread for the ORM, so persistent connections would pile up
+    os.environ.setdefault("ASYNC_READ_VIEWS", "1")
+    os.environ.setdefault("DB_CONN_MAX_AGE", "0")
+else:
+    wsgi_app = "config.wsgi:application"
+    worker_class = worker_model
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Only used by gthread; every thread keeps its own database connection
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+# Master, after the app is loaded and before the first fork
+def when_ready(server):
+    if not preload_app:
+        return
+    from django.db import connections
+
+    from config.warmup import warm_up_application
+
+    warm_up_application()
+    # Connections must not be shared between processes
+    connections.close_all()
+    gc.freeze()
+    server.log.info("Application preloaded and warmed up")
+
+
+# Each worker, before it accepts requests
+def post_worker_init(worker):
+    from config.warmup import warm_up_application, warm_up_connections
+
+    if not preload_app:
+        warm_up_application()
+    # Sync workers serve requests on this thread and keep the connection;
+    # with threads only a pool benefits, so the connection is handed back
+    warm_up_connections(keep=worker_class == "sync")
+
+
+# Each worker, when it exits: views not written yet would be lost
+def worker_exit(server, worker):
+    from blogs.viewcounts import flush_views
+
+    try:
+        flush_views()
+    except Exception:
+        server.log.exception("Could not flush post views")
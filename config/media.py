@@ -0,0 +1,182 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from users.models import AvatarFile, Profile
+
+"""
+
+Media files served by the application.
+
+The view only serves files a profile uses: an avatar with a live AvatarFile
+record, one of its resized variants, or the default avatar. Anything else
+under MEDIA_ROOT is a 404, so files are no longer public just because they
+exist on disk.
+
+How the bytes leave the server depends on settings.MEDIA_SENDFILE:
+    "x-accel-redirect"  nginx serves the file from MEDIA_ACCEL_REDIRECT_PREFIX
+                        (an `internal` location aliased to MEDIA_ROOT)
+    "x-sendfile"        Apache / lighttpd serve the absolute path
+    ""                  a FileResponse; gunicorn hands the open file to
+                        os.sendfile(), so the bytes are never read into Python
+
+In every mode ETag / Last-Modified are answered here (304 without touching
+the file body). With FileResponse a single "bytes=" range is served as a 206,
+through a reader that stops at the end of the range; gunicorn sends it with
+sendfile() from the current file offset for Content-Length bytes.
+
+"""
+
+# avatars/ab/variants/<stem>_128.webp -> avatars/ab/<stem>
+VARIANT = re.compile(r"^(?P<directory>.+)/variants/(?P<stem>[^/]+)_\d+\.[a-z]+$")
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+# Storage name of the avatar that the media path belongs to, without extension
+def _avatar_stem(path):
+    match = VARIANT.match(path)
+    if match:
+        return f"{match['directory']}/{match['stem']}"
+    return os.path.splitext(path)[0]
+
+
+# Is the file an avatar (or avatar variant) that some profile uses?
+def is_served(path):
+    if not path.startswith("avatars/"):
+        return False
+    stem = _avatar_stem(path)
+    default = Profile._meta.get_field("avatar").default
+    if stem == os.path.splitext(default)[0]:
+        return True
+    # The unique index on AvatarFile.name also serves prefix lookups
+    return AvatarFile.objects.filter(
+        name__startswith=f"{stem}.", ref_count__gt=0
+    ).exists()
+
+
+def resolve(path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid media path")
+    if not is_served(path):
+        raise Http404("Unknown media file")
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("Media file not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Media file not found")
+    return full_path, stat
+
+
+# Strong validator, like nginx: modification time and size
+def file_etag(stat):
+    return quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+# (start, end) inclusive for a single satisfiable range, "unsatisfiable", or None
+def parse_range(header, size):
+    match = RANGE.match(header.replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        # Multiple or malformed ranges: the whole file is sent instead
+        return None
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return "unsatisfiable"
+    if end < start:
+        return None
+    return start, end
+
+
+# If-Range carries either the ETag or the Last-Modified date of the version wanted
+def _range_applies(request, etag, last_modified):
+    condition = request.META.get("HTTP_IF_RANGE")
+    return condition is None or condition in (etag, http_date(last_modified))
+
+
+# File object that ends after `length` bytes, keeping fileno() for sendfile
+class FileRange:
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def media_response(request, path):
+    full_path, stat = resolve(path)
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response.headers["ETag"] = etag
+        return response
+
+    mode = settings.MEDIA_SENDFILE
+    if mode == "x-accel-redirect":
+        # nginx handles ranges and the body; Content-Type is kept from here
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+    elif mode == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = full_path
+    elif request.method == "HEAD":
+        response = HttpResponse(content_type=content_type)
+        response["Content-Length"] = stat.st_size
+    else:
+        byte_range = None
+        if "HTTP_RANGE" in request.META and _range_applies(
+            request, etag, last_modified
+        ):
+            byte_range = parse_range(request.META["HTTP_RANGE"], stat.st_size)
+        if byte_range == "unsatisfiable":
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+
+        file = open(full_path, "rb")
+        if byte_range is None:
+            response = FileResponse(file, content_type=content_type)
+        else:
+            start, end = byte_range
+            response = FileResponse(
+                FileRange(file, start, end - start + 1),
+                content_type=content_type,
+                status=206,
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            response["Content-Length"] = end - start + 1
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
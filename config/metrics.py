@@ -0,0 +1,255 @@
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+"""
+
+Request metrics in the Prometheus text format.
+
+RequestMetricsMiddleware records, per URL name, method and status class:
+latency and DB query count histograms, DB time and response bytes.
+Queries are timed with connection.execute_wrapper, so nothing extra is sent
+to the database. Under ASGI the wrapper goes on the connections of the
+request's thread-sensitive thread, where its queries run.
+
+/metrics is served to requests with "Authorization: Bearer <METRICS_TOKEN>"
+only; without METRICS_TOKEN it answers 404.
+
+Every worker keeps its numbers in memory. When METRICS_DIR is set, each worker
+writes them to METRICS_DIR/metrics-<pid>.json at most every
+METRICS_FLUSH_INTERVAL seconds, and /metrics adds up the files of all workers.
+Files of workers that have exited stay, so the counters never go backwards;
+the directory is emptied when the server starts (see entrypoint.sh).
+
+"""
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _new_entry():
+    return {
+        "count": 0,
+        "duration_sum": 0.0,
+        # One slot per bucket plus +Inf, not cumulative
+        "duration_buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+        "queries_sum": 0,
+        "queries_buckets": [0] * (len(QUERY_BUCKETS) + 1),
+        "db_seconds": 0.0,
+        "response_bytes": 0,
+    }
+
+
+def _merge(target, entry):
+    for key, value in entry.items():
+        if isinstance(value, list):
+            target[key] = [a + b for a, b in zip(target[key], value)]
+        else:
+            target[key] += value
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.last_flush = 0.0
+
+    def observe(self, labels, duration, queries, db_seconds, size):
+        with self.lock:
+            entry = self.series.get(labels)
+            if entry is None:
+                entry = self.series[labels] = _new_entry()
+            entry["count"] += 1
+            entry["duration_sum"] += duration
+            entry["duration_buckets"][bisect_left(LATENCY_BUCKETS, duration)] += 1
+            entry["queries_sum"] += queries
+            entry["queries_buckets"][bisect_left(QUERY_BUCKETS, queries)] += 1
+            entry["db_seconds"] += db_seconds
+            entry["response_bytes"] += size
+
+            directory = settings.METRICS_DIR
+            now = time.monotonic()
+            due = directory and now - self.last_flush >= settings.METRICS_FLUSH_INTERVAL
+            if due:
+                self.last_flush = now
+        if due:
+            self.flush(directory)
+
+    def snapshot(self):
+        with self.lock:
+            return [
+                [
+                    list(labels),
+                    {
+                        key: (list(value) if isinstance(value, list) else value)
+                        for key, value in entry.items()
+                    },
+                ]
+                for labels, entry in self.series.items()
+            ]
+
+    # Write this worker's numbers; the rename makes readers see whole files only
+    def flush(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temporary, path)
+
+    # All series, added up over the workers when METRICS_DIR is set
+    def collect(self):
+        directory = settings.METRICS_DIR
+        if not directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush(directory)
+            snapshots = []
+            for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+                try:
+                    with open(path) as file:
+                        snapshots.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+
+        series = {}
+        for snapshot in snapshots:
+            for labels, entry in snapshot:
+                target = series.setdefault(tuple(labels), _new_entry())
+                _merge(target, entry)
+        return series
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+registry = Registry()
+
+
+def _labels(view, method, status):
+    return f'view="{view}",method="{method}",status="{status}"'
+
+
+def _histogram(lines, name, series, key, buckets):
+    for labels, entry in series:
+        total = 0
+        for bound, count in zip(buckets + ("+Inf",), entry[f"{key}_buckets"]):
+            total += count
+            lines.append(f'{name}_bucket{{{_labels(*labels)},le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{_labels(*labels)}}} {entry[f'{key}_sum']}")
+        lines.append(f"{name}_count{{{_labels(*labels)}}} {entry['count']}")
+
+
+def render_metrics(series):
+    series = sorted(series.items())
+    lines = [
+        "# HELP http_request_duration_seconds Time spent answering the request.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    _histogram(
+        lines, "http_request_duration_seconds", series, "duration", LATENCY_BUCKETS
+    )
+    lines += [
+        "# HELP http_request_db_queries Database queries run by the request.",
+        "# TYPE http_request_db_queries histogram",
+    ]
+    _histogram(lines, "http_request_db_queries", series, "queries", QUERY_BUCKETS)
+    lines += [
+        "# HELP http_request_db_seconds_total Time spent in database queries.",
+        "# TYPE http_request_db_seconds_total counter",
+    ]
+    for labels, entry in series:
+        lines.append(
+            f"http_request_db_seconds_total{{{_labels(*labels)}}} {entry['db_seconds']}"
+        )
+    lines += [
+        "# HELP http_response_size_bytes_total Bytes sent in response bodies.",
+        "# TYPE http_response_size_bytes_total counter",
+    ]
+    for labels, entry in series:
+        lines.append(
+            f"http_response_size_bytes_total{{{_labels(*labels)}}} {entry['response_bytes']}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+# execute_wrapper callable counting and timing the queries of one request
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+    @contextmanager
+    def install(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with timer.install():
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    # Connections are per thread: the queries of an ASGI request run in its
+    # thread-sensitive thread (the ORM's sync_to_async, the sync views), so the
+    # wrapper is installed on the connections of that thread
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        installed = ExitStack()
+        started = time.perf_counter()
+        await sync_to_async(installed.enter_context)(timer.install())
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(installed.close)()
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    def record(self, request, response, duration, timer):
+        match = request.resolver_match
+        view = match.view_name if match else "<unmatched>"
+        if response.streaming:
+            size = int(response.get("Content-Length") or 0)
+        else:
+            size = len(response.content)
+        status = f"{response.status_code // 100}xx"
+        registry.observe(
+            (view, request.method, status), duration, timer.count, timer.seconds, size
+        )
@@ -0,0 +1,364 @@
+import base64
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connections
+
+"""
+
+On-demand profiling of single requests.
+
+A request is profiled when it carries a valid X-Profile-Request header (made
+with `manage.py request_profiles token`, signed with PROFILING_KEY; without the
+key the header is ignored) or when it is drawn by PROFILING_SAMPLE_RATE. The view runs under cProfile or, with
+PROFILING_MODE="sampling", under a sampler that records the stack of the
+request thread every PROFILING_SAMPLE_INTERVAL seconds. Every SQL statement is
+recorded with its time, and SELECTs slower than PROFILING_EXPLAIN_MS get their
+EXPLAIN plan once the view has returned.
+
+Each profile is one JSON file in PROFILING_DIR; only the newest
+PROFILING_MAX_FILES are kept. The response names it in X-Profile-Id. The
+directory is created readable by its owner only (0700, files 0600), and the
+SQL parameters are stored as their types unless PROFILING_SQL_PARAMS is set.
+`manage.py request_profiles` lists and renders them.
+
+"""
+
+HEADER = "HTTP_X_PROFILE_REQUEST"
+SALT = "config.profiling"
+
+
+def _signer():
+    return signing.TimestampSigner(key=settings.PROFILING_KEY, salt=SALT)
+
+
+def make_token():
+    if not settings.PROFILING_KEY:
+        raise ImproperlyConfigured("Set PROFILING_KEY to sign profiling tokens.")
+    return _signer().sign("profile")
+
+
+# Tokens are refused while PROFILING_KEY is unset
+def valid_token(value):
+    if not settings.PROFILING_KEY:
+        return False
+    try:
+        _signer().unsign(value, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+# execute_wrapper callable keeping every statement of the request
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "alias": context["connection"].alias,
+                    "sql": sql,
+                    "params": None if many else params,
+                    "ms": round((time.perf_counter() - started) * 1000, 3),
+                }
+            )
+
+    def explain_slow(self):
+        for query in self.queries:
+            slow = query["ms"] >= settings.PROFILING_EXPLAIN_MS
+            if not slow or not query["sql"].lstrip().upper().startswith("SELECT"):
+                continue
+            connection = connections[query["alias"]]
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"{connection.ops.explain_query_prefix()} {query['sql']}",
+                        query["params"],
+                    )
+                    query["explain"] = "\n".join(
+                        " ".join(str(column) for column in row)
+                        for row in cursor.fetchall()
+                    )
+            except DatabaseError as exc:
+                query["explain"] = f"EXPLAIN failed: {exc}"
+
+    # The parameters were only needed by EXPLAIN; unless PROFILING_SQL_PARAMS
+    # is set, the file keeps their types (e.g. "<str>") instead of the values
+    def serializable(self):
+        for query in self.queries:
+            if query["params"] is None:
+                continue
+            if settings.PROFILING_SQL_PARAMS:
+                query["params"] = [repr(value) for value in query["params"]]
+            else:
+                query["params"] = [
+                    f"<{type(value).__name__}>" for value in query["params"]
+                ]
+        return self.queries
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+# Records the stack of one thread at a fixed interval, as collapsed stacks
+class StackSampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def _private(path, flags):
+    return os.open(path, flags, 0o600)
+
+
+def save_profile(record):
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    path = os.path.join(directory, f"{record['id']}.json")
+    with open(f"{path}.tmp", "w", opener=_private) as file:
+        json.dump(record, file)
+    os.replace(f"{path}.tmp", path)
+
+    # Ring buffer: the ids sort by time, the oldest files go first
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    for name in names[: max(0, len(names) - settings.PROFILING_MAX_FILES)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def load_profiles():
+    directory = settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    profiles = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name)) as file:
+                profiles.append(json.load(file))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def load_stats(record):
+    return marshal.loads(base64.b64decode(record["stats"]))
+
+
+# Runs in the mode of the handler; under ASGI only the sync views it profiles
+# go to a thread (where Django runs them anyway), async views are not profiled
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def wants_profile(self, request):
+        header = request.META.get(HEADER)
+        if header:
+            return valid_token(header)
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    # Last middleware, so the other process_view hooks (CSRF) have already run
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if iscoroutinefunction(view_func) or not self.wants_profile(request):
+            return None
+        return self.profile(request, view_func, view_args, view_kwargs)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if iscoroutinefunction(view_func) or not self.wants_profile(request):
+            return None
+        return await sync_to_async(self.profile)(
+            request, view_func, view_args, view_kwargs
+        )
+
+    def profile(self, request, view_func, view_args, view_kwargs):
+
+        # Rendering is included, that is where DRF serializes the response
+        def call():
+            response = view_func(request, *view_args, **view_kwargs)
+            if callable(getattr(response, "render", None)):
+                response.render()
+            return response
+
+        recorder = QueryRecorder()
+        mode = settings.PROFILING_MODE
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            if mode == "sampling":
+                sampler = stack.enter_context(
+                    StackSampler(
+                        threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL
+                    )
+                )
+                response = call()
+            else:
+                profiler = cProfile.Profile()
+                response = profiler.runcall(call)
+        duration = time.perf_counter() - started
+        recorder.explain_slow()
+
+        record = {
+            "id": f"{time.time_ns()}-{uuid.uuid4().hex[:8]}",
+            "time": time.time(),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": request.resolver_match.view_name if request.resolver_match else "",
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "mode": mode,
+            "queries": recorder.serializable(),
+        }
+        if mode == "sampling":
+            record["interval"] = settings.PROFILING_SAMPLE_INTERVAL
+            record["samples"] = dict(sampler.samples)
+        else:
+            profiler.create_stats()
+            record["stats"] = base64.b64encode(marshal.dumps(profiler.stats)).decode()
+        save_profile(record)
+        response["X-Profile-Id"] = record["id"]
+        return response
+
+
+def _function_label(function):
+    filename, line, name = function
+    if filename == "~":
+        return name
+    return f"{name} ({filename}:{line})"
+
+
+"""
+Collapsed stacks ("a;b;c <microseconds>") from cProfile stats.
+cProfile keeps caller -> callee edges, not whole stacks, so the time of a
+function is split between its callers in proportion to the time each call
+edge took, the way flameprof and similar tools do it. Branches carrying less
+than min_fraction of the total are folded into their caller, otherwise the
+number of paths through the call graph explodes.
+"""
+
+
+def collapsed_from_stats(stats, max_depth=64, min_fraction=0.001):
+    callees = defaultdict(list)
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller].append((function, edge[3]))
+    roots = [function for function, row in stats.items() if not row[4]]
+    threshold = min_fraction * sum(stats[root][3] for root in roots)
+    lines = Counter()
+
+    def walk(function, path, share):
+        _, _, own, total, _ = stats[function]
+        path = path + (function,)
+        label = ";".join(map(_function_label, path))
+        if len(path) >= max_depth:
+            lines[label] += total * share
+            return
+        # Time of dropped branches stays with this frame
+        lines[label] += own * share
+        for callee, edge_total in callees[function]:
+            callee_total = stats[callee][3]
+            if callee in path or not callee_total:
+                continue
+            if share * edge_total < threshold:
+                lines[label] += share * edge_total
+                continue
+            walk(callee, path, share * edge_total / callee_total)
+
+    for root in roots:
+        walk(root, (), 1.0)
+    return {stack: int(seconds * 1e6) for stack, seconds in lines.items() if seconds}
+
+
+def render_top(record, limit, sort):
+    if "stats" in record:
+        stats = pstats.Stats()
+        stats.stats = load_stats(record)
+        stats.total_tt = sum(row[2] for row in stats.stats.values())
+        stats.total_calls = sum(row[1] for row in stats.stats.values())
+        stats.prim_calls = sum(row[0] for row in stats.stats.values())
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    # Sampling profiles: samples where the function is on top / anywhere on the stack
+    own, total = Counter(), Counter()
+    for stack, count in record["samples"].items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    ranking = own if sort == "tottime" else total
+    interval_ms = record["interval"] * 1000
+    lines = [f"{'own ms':>10} {'total ms':>10}  function"]
+    for frame, _ in ranking.most_common(limit):
+        lines.append(
+            f"{own[frame] * interval_ms:10.1f} {total[frame] * interval_ms:10.1f}  {frame}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def collapsed_stacks(record):
+    if "stats" in record:
+        return collapsed_from_stats(load_stats(record))
+    return record["samples"]
@@ -0,0 +1,202 @@
+import random
+import threading
+import time
+
+from asgiref.local import Local
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from users.throttling import get_counter_store
+
+"""
+
+Read replicas with read-your-writes.
+
+ReplicaRoutingMiddleware marks requests with a safe method (GET, HEAD,
+OPTIONS) as allowed to read from a replica, and ReplicaRouter then sends their
+reads to one of settings.DATABASE_REPLICAS (the same one for the whole
+request). Writes, and all reads of other requests, of management commands and
+of background jobs, go to the primary ("default").
+
+After a successful write the client is pinned to the primary for
+REPLICA_PIN_SECONDS, so it reads back what it wrote: the user id from the JWT
+is recorded in the shared counter store (see users/throttling.py), which every
+worker reads, and a cookie covers clients without a token (login, admin).
+
+Replicas whose replay lag is above REPLICA_MAX_LAG_SECONDS, or that cannot be
+reached, are left out until the next check (every REPLICA_CHECK_INTERVAL
+seconds per worker). With no usable replica everything reads the primary.
+
+"""
+
+PIN_COOKIE = "db_pin"
+
+_state = Local()
+
+# Seconds since the last replayed transaction, 0 while the replica is caught up
+LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+def replica_lag(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(LAG_QUERY)
+        return float(cursor.fetchone()[0])
+
+
+class ReplicaSet:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.healthy = []
+        self.checked_at = None
+
+    def check(self):
+        healthy = []
+        for alias in settings.DATABASE_REPLICAS:
+            try:
+                lag = replica_lag(alias)
+            except DatabaseError:
+                continue
+            if lag <= settings.REPLICA_MAX_LAG_SECONDS:
+                healthy.append(alias)
+        return healthy
+
+    # Replicas fit for reading, checked at most every REPLICA_CHECK_INTERVAL
+    def usable(self):
+        now = time.monotonic()
+        with self.lock:
+            stale = (
+                self.checked_at is None
+                or now - self.checked_at >= settings.REPLICA_CHECK_INTERVAL
+            )
+            if stale:
+                self.checked_at = now
+        if stale:
+            self.healthy = self.check()
+        return self.healthy
+
+    def invalidate(self):
+        with self.lock:
+            self.checked_at = None
+
+
+replicas = ReplicaSet()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not getattr(_state, "use_replica", False):
+            return None
+        # Reads inside a transaction on the primary must see its own changes
+        if connections["default"].in_atomic_block:
+            return None
+        if getattr(_state, "alias", None) is None:
+            usable = replicas.usable()
+            _state.alias = random.choice(usable) if usable else "default"
+        return _state.alias
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    # Replicas hold the same rows as the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+# User id of a valid access token, checked without touching the database
+def token_user_id(request):
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+    return token.get(jwt_settings.USER_ID_CLAIM)
+
+
+def _pin_key(user_id):
+    return f"db_pin:user:{user_id}"
+
+
+def is_pinned(request):
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    user_id = token_user_id(request)
+    if user_id is None:
+        return False
+    window = settings.REPLICA_PIN_SECONDS
+    return get_counter_store().get(_pin_key(user_id), window) > 0
+
+
+def pin(request, response):
+    window = settings.REPLICA_PIN_SECONDS
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        get_counter_store().incr(_pin_key(user.pk), window)
+    response.set_cookie(PIN_COOKIE, "1", max_age=window, httponly=True, samesite="Lax")
+
+
+# Runs in the mode of the handler, so the async views of ASGI workers are not
+# moved to a thread (the counter store is called from a thread under ASGI, as it
+# may be a network cache)
+class ReplicaRoutingMiddleware:
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        safe = request.method in self.SAFE_METHODS
+        _state.use_replica = safe and not is_pinned(request)
+        _state.alias = None
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.use_replica = False
+            _state.alias = None
+
+        if not safe and response.status_code < 400:
+            pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        safe = request.method in self.SAFE_METHODS
+        _state.use_replica = safe and not await sync_to_async(is_pinned)(request)
+        _state.alias = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.use_replica = False
+            _state.alias = None
+
+        # The user may still be the lazy session user, which runs a query
+        if not safe and response.status_code < 400:
+            await sync_to_async(pin)(request, response)
+        return response
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -34,6 +35,55 @@ AUTH_USER_MODEL = "users.User"
 # Set media file path (for storing avatars)
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+# How config/media.py hands files out: "x-accel-redirect" (nginx), "x-sendfile"
+# (Apache, lighttpd) or "" for a FileResponse sent with os.sendfile()
+MEDIA_SENDFILE = os.getenv("MEDIA_SENDFILE", "")
+# nginx `internal` location that aliases MEDIA_ROOT
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv(
+    "MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/"
+)
+
+# Resized avatar copies (square bounding boxes in pixels), made in the background
+AVATAR_VARIANT_SIZES = (40, 128, 256)
+AVATAR_PROCESSING = os.getenv("AVATAR_PROCESSING", "thread")  # "thread" or "inline"
+AVATAR_PROCESSING_WORKERS = int(os.getenv("AVATAR_PROCESSING_WORKERS", 2))
+
+# Home feeds (blogs/feed.py): new posts are copied to the followers' timelines
+# in the background, except for authors with FEED_FANOUT_LIMIT followers or
+# more, whose posts are read when the feed is built
+FEED_FANOUT = os.getenv("FEED_FANOUT", "thread")  # "thread" or "inline"
+FEED_FANOUT_WORKERS = int(os.getenv("FEED_FANOUT_WORKERS", 2))
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", 10000))
+FEED_FANOUT_BATCH = int(os.getenv("FEED_FANOUT_BATCH", 1000))
+# Posts of a newly followed author copied to the follower's timeline
+FEED_BACKFILL = int(os.getenv("FEED_BACKFILL", 50))
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", 20))
+# Page size of the post list when it is filtered by tag or paged with ?cursor=
+POSTS_PAGE_SIZE = int(os.getenv("POSTS_PAGE_SIZE", 20))
+TAG_CLOUD_SIZE = int(os.getenv("TAG_CLOUD_SIZE", 100))
+# Scheduled posts published per transaction by publish_scheduled (blogs/publishing.py)
+PUBLISH_BATCH_SIZE = int(os.getenv("PUBLISH_BATCH_SIZE", 500))
+# Seconds between runs of publish_scheduled --loop
+PUBLISH_INTERVAL = float(os.getenv("PUBLISH_INTERVAL", 30))
+# Every Nth post revision is stored whole, the others as deltas (blogs/revisions.py)
+REVISION_SNAPSHOT_INTERVAL = int(os.getenv("REVISION_SNAPSHOT_INTERVAL", 10))
+# Characters of plain text in a post's excerpt (at most 300, the column size)
+EXCERPT_LENGTH = int(os.getenv("EXCERPT_LENGTH", 200))
+READING_WORDS_PER_MINUTE = int(os.getenv("READING_WORDS_PER_MINUTE", 200))
+# Seconds between the writes of each worker's buffered post views (blogs/viewcounts.py)
+VIEW_FLUSH_INTERVAL = float(os.getenv("VIEW_FLUSH_INTERVAL", 10))
+# Related posts (blogs/related.py): neighbours kept per post, words kept per
+# post's signature, and how the index is updated after a change
+RELATED_POSTS = int(os.getenv("RELATED_POSTS", 10))
+RELATED_TERMS = int(os.getenv("RELATED_TERMS", 50))
+RELATED_INDEXING = os.getenv("RELATED_INDEXING", "thread")  # "thread" or "inline"
+
+# POST /api/batch/ (config/batch.py): sub-requests per batch, the statement timeout
+# (ms) and response size (bytes) of each, and the threads of "concurrent" batches
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", 20))
+BATCH_STATEMENT_TIMEOUT = int(os.getenv("BATCH_STATEMENT_TIMEOUT", 5000))
+BATCH_MAX_RESPONSE_BYTES = int(os.getenv("BATCH_MAX_RESPONSE_BYTES", 1024 * 1024))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 4))
 
 # Main domain address
 FRONTEND_URL = "http://localhost:8000"
@@ -75,6 +125,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "config.metrics.RequestMetricsMiddleware",
+    "config.replicas.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -82,6 +134,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "config.profiling.RequestProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -103,6 +156,34 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "config.wsgi.application"
 
+# Serve the public GET endpoints with async views (turn on when running under ASGI)
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "0") == "1"
+
+# Per-endpoint request metrics served on /metrics (see config/metrics.py).
+# With several workers set METRICS_DIR so their numbers can be added up.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 1))
+# Bearer token of the scraper; /metrics is a 404 without it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# On-demand request profiling (see config/profiling.py)
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_MODE = os.getenv("PROFILING_MODE", "cprofile")  # "cprofile" or "sampling"
+PROFILING_SAMPLE_INTERVAL = float(os.getenv("PROFILING_SAMPLE_INTERVAL", 0.005))
+PROFILING_EXPLAIN_MS = float(os.getenv("PROFILING_EXPLAIN_MS", 50))
+PROFILING_TOKEN_MAX_AGE = int(os.getenv("PROFILING_TOKEN_MAX_AGE", 3600))
+# Signs the X-Profile-Request tokens (not SECRET_KEY, which is in the source);
+# the header is ignored while it is unset
+PROFILING_KEY = os.getenv("PROFILING_KEY", "")
+PROFILING_DIR = os.getenv(
+    "PROFILING_DIR", os.path.join(tempfile.gettempdir(), "blog-profiles")
+)
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", 200))
+# Keep the values of the SQL parameters in the profiles; they hold emails,
+# password hashes and codes, so only their types are kept by default
+PROFILING_SQL_PARAMS = os.getenv("PROFILING_SQL_PARAMS", "0") == "1"
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -115,9 +196,58 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASS", "postgres"),
         "HOST": os.getenv("DB_HOST", "db"),
         "PORT": os.getenv("DB_PORT", 5432),
+        # Keep connections open between requests (seconds, 0 closes after each request)
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        # Check a reused connection before the request uses it
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "1") == "1",
+        "OPTIONS": {},
     }
 }
 
+"""
+NOTE:
+DB_POOL=1 switches to psycopg's in-process connection pool
+(needs `pip install "psycopg[binary,pool]"`, i.e. psycopg 3 instead of psycopg2).
+Each worker then keeps between DB_POOL_MIN_SIZE and DB_POOL_MAX_SIZE connections;
+Django does not allow persistent connections together with the pool.
+"""
+if os.getenv("DB_POOL", "0") == "1":
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+        "timeout": int(os.getenv("DB_POOL_TIMEOUT", 10)),
+    }
+
+"""
+NOTE:
+Read replicas (see config/replicas.py): DB_REPLICA_HOSTS="host1,host2" adds the
+aliases replica1, replica2, ... with the credentials of the primary.
+GET/HEAD/OPTIONS requests read from them; a client that wrote is pinned to the
+primary for REPLICA_PIN_SECONDS, and replicas lagging more than
+REPLICA_MAX_LAG_SECONDS are skipped.
+"""
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+    filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), 1
+):
+    alias = f"replica{number}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        # Tests run against the primary's test database
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["config.replicas.ReplicaRouter"]
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 5))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 2))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", 5))
+
+# Adds the "replica" database of the replica tests (see config/testing.py)
+TEST_RUNNER = "config.testing.TestRunner"
 
 
 # Password validation
@@ -157,8 +287,58 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
+    # Failed attempts allowed per client IP and per account (see users/throttling.py)
+    "DEFAULT_THROTTLE_RATES": {
+        "login": os.getenv("THROTTLE_LOGIN_RATE", "20/min"),
+        "login_account": os.getenv("THROTTLE_LOGIN_ACCOUNT_RATE", "5/min"),
+        "reset_code": os.getenv("THROTTLE_CODE_RATE", "20/min"),
+        "reset_code_account": os.getenv("THROTTLE_CODE_ACCOUNT_RATE", "5/min"),
+        "email_code": os.getenv("THROTTLE_CODE_RATE", "20/min"),
+        "email_code_account": os.getenv("THROTTLE_CODE_ACCOUNT_RATE", "5/min"),
+    },
+    # Proxies in front of the app that add to X-Forwarded-For. With 0 the client
+    # IP of the throttles and view counts is REMOTE_ADDR, since any client can
+    # send an X-Forwarded-For header; behind nginx or a load balancer set it to
+    # their number so the address they add is used
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 0)),
+}
+
+# Shared store for the brute-force counters.
+# The SQLite file is shared by all workers on one host,
+# use "users.throttling.CacheCounterStore" with a cache alias to share between hosts.
+THROTTLE_COUNTER_STORE = {
+    "BACKEND": os.getenv(
+        "THROTTLE_STORE_BACKEND", "users.throttling.SQLiteCounterStore"
+    ),
+    "LOCATION": os.getenv(
+        "THROTTLE_STORE_LOCATION",
+        os.path.join(tempfile.gettempdir(), "blog-throttle.sqlite3"),
+    ),
+}
+
+# Cache shared by all workers of the host through a memory-mapped file
+# (config/shmcache.py); entries larger than CACHE_MAX_ENTRY_SIZE are not cached
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "config.shmcache.SharedMemoryCache"),
+        "LOCATION": os.getenv(
+            "CACHE_LOCATION", os.path.join(tempfile.gettempdir(), "blog-cache.mmap")
+        ),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", 16384)),
+            "MAX_ENTRY_SIZE": int(os.getenv("CACHE_MAX_ENTRY_SIZE", 4096)),
+        },
+    }
 }
 
+# OpenAPI schema built ahead of time by `manage.py build_openapi_schema` (optional,
+# without the file it is generated on first use) and the URL the docs pages load it from
+OPENAPI_SCHEMA_FILE = os.getenv(
+    "OPENAPI_SCHEMA_FILE", os.path.join(BASE_DIR, "openapi-schema.json")
+)
+SWAGGER_SETTINGS = {"SPEC_URL": "schema-json"}
+REDOC_SETTINGS = {"SPEC_URL": "schema-json"}
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=3),
     "REFRESH_TOKEN_LIFETIME": timedelta(hours=3),
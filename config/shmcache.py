@@ -0,0 +1,335 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+"""
+
+Cache backend in a memory-mapped file, shared by every worker on the host.
+
+    CACHES = {
+        "default": {
+            "BACKEND": "config.shmcache.SharedMemoryCache",
+            "LOCATION": "/tmp/blog-cache.mmap",
+            "OPTIONS": {"MAX_ENTRIES": 16384, "MAX_ENTRY_SIZE": 4096},
+        }
+    }
+
+The file holds a fixed hash table: MAX_ENTRIES slots of MAX_ENTRY_SIZE bytes
+(key plus pickled value) in buckets of WAYS slots. A key can only live in its
+own bucket; when the bucket is full one of its slots is evicted with CLOCK
+(second chance: a read marks the slot, the hand skips and clears marked slots
+once), which approximates LRU without moving entries around. Expired entries
+are skipped by reads and reused by writes. Values too large for a slot are
+not cached.
+
+Writes take the lock of their stripe (bucket % LOCK_STRIPES): a thread lock
+inside the process and an fcntl lock on one byte of the file between
+processes. Reads take no lock: every slot has a sequence number that a writer
+makes odd while it changes the slot, and a read that sees it odd or changed
+starts again (a seqlock), falling back to the stripe lock after a few tries.
+
+The geometry is fixed when the file is created; processes that open an
+existing file use the geometry stored in it, whatever their OPTIONS say.
+
+"""
+
+MAGIC = b"BLOGSHM1"
+# magic, slots, slots per bucket, payload bytes per slot, lock stripes
+HEADER = struct.Struct("<8sQIII")
+HEADER_SIZE = 4096
+# sequence, key hash (0 = empty), expiry (0 = never), key length, value length, referenced
+SLOT = struct.Struct("<QQdIIB7x")
+SEQ = struct.Struct("<Q")
+REFERENCED = 32
+READ_RETRIES = 8
+
+_RETRY = object()
+
+
+class SharedTable:
+    def __init__(self, path, slots, ways, slot_size, stripes):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        # Only one process creates the file; the others read its geometry
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            magic, *geometry = HEADER.unpack(
+                os.pread(self.fd, HEADER.size, 0).ljust(HEADER.size, b"\0")
+            )
+            if magic == MAGIC:
+                slots, ways, slot_size, stripes = geometry
+            self._set_geometry(slots, ways, slot_size, stripes)
+            if magic != MAGIC or os.fstat(self.fd).st_size != self.size:
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+                os.pwrite(
+                    self.fd,
+                    HEADER.pack(MAGIC, self.slots, ways, slot_size, stripes),
+                    0,
+                )
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+        self.map = mmap.mmap(self.fd, self.size)
+        self.locks = [threading.Lock() for _ in range(self.stripes)]
+
+    def _set_geometry(self, slots, ways, slot_size, stripes):
+        self.ways = ways
+        self.buckets = max(1, -(-slots // ways))
+        self.slots = self.buckets * ways
+        self.slot_size = slot_size
+        self.stripes = stripes
+        self.stride = SLOT.size + -(-slot_size // 8) * 8
+        # One CLOCK hand (a byte) per bucket, then the slots
+        self.hands = HEADER_SIZE
+        self.table = HEADER_SIZE + -(-self.buckets // 8) * 8
+        self.size = self.table + self.slots * self.stride
+
+    @contextmanager
+    def locked(self, stripe):
+        with self.locks[stripe]:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, stripe)
+
+    def _offsets(self, bucket):
+        start = self.table + bucket * self.ways * self.stride
+        return range(start, start + self.ways * self.stride, self.stride)
+
+    def _payload(self, offset, key_length, value_length):
+        start = offset + SLOT.size
+        return self.map[start : start + min(key_length + value_length, self.slot_size)]
+
+    def _lookup(self, bucket, key_hash, key, now, locked=False):
+        for offset in self._offsets(bucket):
+            seq, slot_hash, expires, key_length, value_length, _ = SLOT.unpack_from(
+                self.map, offset
+            )
+            if seq & 1 and not locked:
+                return _RETRY
+            if slot_hash != key_hash:
+                continue
+            data = self._payload(offset, key_length, value_length)
+            if not locked and SEQ.unpack_from(self.map, offset)[0] != seq:
+                return _RETRY
+            if data[:key_length] != key:
+                continue
+            if expires and expires <= now:
+                return None
+            self.map[offset + REFERENCED] = 1
+            return data[key_length:]
+        return None
+
+    def get(self, key_hash, key, now):
+        bucket = key_hash % self.buckets
+        for _ in range(READ_RETRIES):
+            value = self._lookup(bucket, key_hash, key, now)
+            if value is not _RETRY:
+                return value
+        # Writers keep the bucket busy; under the lock nothing changes
+        with self.locked(bucket % self.stripes):
+            return self._lookup(bucket, key_hash, key, now, locked=True)
+
+    # Slot holding the key (expired or not) in a locked bucket
+    def _find(self, bucket, key_hash, key):
+        for offset in self._offsets(bucket):
+            _, slot_hash, expires, key_length, value_length, _ = SLOT.unpack_from(
+                self.map, offset
+            )
+            if slot_hash == key_hash:
+                data = self._payload(offset, key_length, value_length)
+                if data[:key_length] == key:
+                    return offset, expires, data[key_length:]
+        return None, None, None
+
+    def _write(self, offset, key_hash, expires, key=b"", value=b""):
+        seq = SEQ.unpack_from(self.map, offset)[0]
+        SEQ.pack_into(self.map, offset, seq + 1)
+        # Not referenced until read, so entries that are never read go first
+        SLOT.pack_into(
+            self.map, offset, seq + 1, key_hash, expires, len(key), len(value), 0
+        )
+        if key_hash:
+            start = offset + SLOT.size
+            self.map[start : start + len(key) + len(value)] = key + value
+        SEQ.pack_into(self.map, offset, seq + 2)
+
+    # A free or expired slot of the bucket, or the one picked by the CLOCK hand
+    def _victim(self, bucket, now):
+        for offset in self._offsets(bucket):
+            _, slot_hash, expires = SLOT.unpack_from(self.map, offset)[:3]
+            if not slot_hash or (expires and expires <= now):
+                return offset
+        offsets = self._offsets(bucket)
+        hand = self.map[self.hands + bucket] % self.ways
+        while self.map[offsets[hand] + REFERENCED]:
+            self.map[offsets[hand] + REFERENCED] = 0
+            hand = (hand + 1) % self.ways
+        self.map[self.hands + bucket] = (hand + 1) % self.ways
+        return offsets[hand]
+
+    # Store the value; with only_if_missing a live entry is kept and False returned
+    def set(self, key_hash, key, value, expires, now, only_if_missing=False):
+        bucket = key_hash % self.buckets
+        with self.locked(bucket % self.stripes):
+            offset, current_expires, _ = self._find(bucket, key_hash, key)
+            live = offset is not None and not (
+                current_expires and current_expires <= now
+            )
+            if only_if_missing and live:
+                return False
+            if len(key) + len(value) > self.slot_size:
+                # Too large to cache; an older value must not be served instead
+                if offset is not None:
+                    self._write(offset, 0, 0)
+                return False
+            if offset is None:
+                offset = self._victim(bucket, now)
+            self._write(offset, key_hash, expires, key, value)
+            return True
+
+    # Apply function(old value, old expiry) -> (value, expiry) to a live entry
+    def update(self, key_hash, key, function, now):
+        bucket = key_hash % self.buckets
+        with self.locked(bucket % self.stripes):
+            offset, expires, value = self._find(bucket, key_hash, key)
+            if offset is None or (expires and expires <= now):
+                return False
+            value, expires = function(value, expires)
+            if len(key) + len(value) > self.slot_size:
+                self._write(offset, 0, 0)
+            else:
+                self._write(offset, key_hash, expires, key, value)
+            return True
+
+    def delete(self, key_hash, key, now):
+        bucket = key_hash % self.buckets
+        with self.locked(bucket % self.stripes):
+            offset, expires, _ = self._find(bucket, key_hash, key)
+            if offset is None:
+                return False
+            self._write(offset, 0, 0)
+            return not (expires and expires <= now)
+
+    def clear(self):
+        for stripe in range(self.stripes):
+            with self.locked(stripe):
+                for bucket in range(stripe, self.buckets, self.stripes):
+                    for offset in self._offsets(bucket):
+                        if SLOT.unpack_from(self.map, offset)[1]:
+                            self._write(offset, 0, 0)
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+# One mapping per file and process; a forked worker opens its own
+def get_table(path, slots, ways, slot_size, stripes):
+    with _tables_lock:
+        pid, table = _tables.get(path, (None, None))
+        if pid != os.getpid():
+            table = SharedTable(path, slots, ways, slot_size, stripes)
+            _tables[path] = (os.getpid(), table)
+        return table
+
+
+class SharedMemoryCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._location = location
+        self._ways = int(options.get("WAYS", 8))
+        self._slot_size = int(options.get("MAX_ENTRY_SIZE", 4096))
+        self._stripes = int(options.get("LOCK_STRIPES", 64))
+
+    @property
+    def _table(self):
+        return get_table(
+            self._location,
+            self._max_entries,
+            self._ways,
+            self._slot_size,
+            self._stripes,
+        )
+
+    def _key(self, key, version):
+        key = self.make_and_validate_key(key, version=version).encode()
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        return int.from_bytes(digest, "little") or 1, key
+
+    def _expiry(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return 0.0 if expires is None else expires
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key_hash, key = self._key(key, version)
+        expires = self._expiry(timeout)
+        now = time.time()
+        if expires and expires <= now:
+            return False
+        value = pickle.dumps(value, self.pickle_protocol)
+        return self._table.set(key_hash, key, value, expires, now, only_if_missing=True)
+
+    def get(self, key, default=None, version=None):
+        key_hash, key = self._key(key, version)
+        value = self._table.get(key_hash, key, time.time())
+        if value is None:
+            return default
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key_hash, key = self._key(key, version)
+        expires = self._expiry(timeout)
+        now = time.time()
+        if expires and expires <= now:
+            self._table.delete(key_hash, key, now)
+            return
+        value = pickle.dumps(value, self.pickle_protocol)
+        self._table.set(key_hash, key, value, expires, now)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key_hash, key = self._key(key, version)
+        expires = self._expiry(timeout)
+        return self._table.update(
+            key_hash, key, lambda value, _: (value, expires), time.time()
+        )
+
+    # Atomic between processes, unlike the get() + set() of BaseCache
+    def incr(self, key, delta=1, version=None):
+        key_hash, key = self._key(key, version)
+        result = []
+
+        def add(value, expires):
+            result.append(pickle.loads(value) + delta)
+            return pickle.dumps(result[0], self.pickle_protocol), expires
+
+        if not self._table.update(key_hash, key, add, time.time()):
+            raise ValueError("Key '%s' not found" % key.decode())
+        return result[0]
+
+    def delete(self, key, version=None):
+        key_hash, key = self._key(key, version)
+        return self._table.delete(key_hash, key, time.time())
+
+    def has_key(self, key, version=None):
+        key_hash, key = self._key(key, version)
+        return self._table.get(key_hash, key, time.time()) is not None
+
+    def clear(self):
+        self._table.clear()
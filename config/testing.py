@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+"""
+
+Test runner of manage.py test (settings.TEST_RUNNER).
+
+It adds the "replica" database that the replica tests use as their replica: a
+second copy of the primary's settings whose test database is test_replica.
+The alias only exists while the tests run, so workers never connect to it.
+Requests only read from it when a test puts it in DATABASE_REPLICAS with
+override_settings.
+
+"""
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        settings.DATABASES["replica"] = {
+            **settings.DATABASES["default"],
+            "TEST": {"NAME": "test_replica"},
+        }
+        # connections.settings is cached; it is read again with the new alias
+        connections.__dict__.pop("settings", None)
+        super().setup_test_environment(**kwargs)
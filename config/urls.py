@@ -16,38 +16,28 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework import permissions
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Blog API",
-        default_version="v1",
-        description="Blog system API documentation",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="mohammad.hggl2016@gmail.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny],
-)
+from config.batch import BatchView
+from config.openapi import docs_page, schema_json
+from config.views import metrics, serve_media
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/auth/", include("users.urls")),
     path("api/blogs/", include("blogs.urls")),
     path("api/blogs/", include("comments.urls")),
-    path(
-        "swagger/",
-        schema_view.with_ui("swagger", cache_timeout=0),
-        name="schema-swagger-ui",
+    # Several API calls in one round trip (config/batch.py)
+    path("api/batch/", BatchView.as_view(), name="api-batch"),
+    # Docs pages import drf_yasg on first use; the schema is built once (config/openapi.py)
+    path("swagger.json", schema_json, name="schema-json"),
+    path("swagger/", docs_page("swagger"), name="schema-swagger-ui"),
+    path("redoc/", docs_page("redoc"), name="schema-redoc"),
+    path("metrics", metrics, name="metrics"),
+    # Avatars, checked against the profiles and handed to the proxy or sendfile
+    re_path(
+        r"^%s(?P<path>.*)$" % settings.MEDIA_URL.lstrip("/"),
+        serve_media,
+        name="media",
     ),
-    path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,38 @@
+import hmac
+import re
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_safe
+
+from config.media import media_response
+from config.metrics import registry, render_metrics
+
+# Content-addressed files (avatars and their variants) never change under the same URL
+IMMUTABLE_MEDIA = re.compile(r"^avatars/[0-9a-f]{2}/(variants/)?[0-9a-f]{64}[^/]*$")
+
+
+# Serve a media file (see config/media.py), with far-future caching for content-addressed names
+@require_safe
+def serve_media(request, path):
+    response = media_response(request, path)
+    if response.status_code in (200, 206, 304) and IMMUTABLE_MEDIA.match(path):
+        patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+# Request metrics of all workers in the Prometheus text format, for the
+# scraper holding METRICS_TOKEN (nobody else learns the endpoint exists)
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    if not token or not hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        raise Http404
+    return HttpResponse(
+        render_metrics(registry.collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,68 @@
+import logging
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+"""
+
+Warm-up run by the gunicorn hooks (config/gunicorn.py) before a worker takes
+traffic, so the first requests do not pay for it.
+
+warm_up_application() fills the lazy caches that are shared after fork when
+the app is preloaded: the URL resolver, the DRF settings (which import the
+authentication, renderer and parser classes) and the fields of every
+serializer used by a view. warm_up_connections() runs in each worker and opens
+the connections to the primary and the replicas, or fills the connection pool.
+
+"""
+
+
+def _views(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _views(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern.callback
+
+
+def warm_up_application():
+    resolver = get_resolver()
+    resolver.reverse_dict  # builds the reverse lookup tables
+
+    for name in (
+        "DEFAULT_AUTHENTICATION_CLASSES",
+        "DEFAULT_PERMISSION_CLASSES",
+        "DEFAULT_RENDERER_CLASSES",
+        "DEFAULT_PARSER_CLASSES",
+        "DEFAULT_CONTENT_NEGOTIATION_CLASS",
+    ):
+        getattr(api_settings, name)
+
+    serializers = 0
+    for view in _views(resolver.url_patterns):
+        view_class = getattr(view, "cls", None)
+        serializer_class = getattr(view_class, "serializer_class", None)
+        if serializer_class is None:
+            continue
+        # ModelSerializer introspects the model the first time fields are read
+        serializer_class(context={}).fields
+        serializers += 1
+    logger.info("Warmed up URL resolver and %d serializers", serializers)
+
+
+# keep=False hands the connection back (to the pool, or closes it); only the
+# databases requests use are opened
+def warm_up_connections(keep=True):
+    for alias in [DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS]:
+        connection = connections[alias]
+        try:
+            connection.ensure_connection()
+        except DatabaseError as exc:
+            logger.warning("Could not connect to database %r: %s", alias, exc)
+            continue
+        if not keep:
+            connection.close()
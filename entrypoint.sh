@@ -18,13 +18,15 @@ echo "✅  PostgreSQL is up."
 # Apply Django database migrations
 python manage.py migrate --noinput
 
+# Workers share their request metrics through files, start from an empty directory
+export METRICS_DIR="${METRICS_DIR:-/tmp/blog-metrics}"
+rm -rf "$METRICS_DIR" && mkdir -p "$METRICS_DIR"
+
 # If script arguments are provided, execute them directly
 if [[ $# -gt 0 ]]; then
   exec "$@"
 else
-  # Otherwise, start the Gunicorn server with default or provided settings
-  exec gunicorn project.wsgi:application \
-       -b 0.0.0.0:8000 \
-       --workers "${GUNICORN_WORKERS:-3}" \
-       --timeout "${GUNICORN_TIMEOUT:-60}"
+  # Otherwise, start Gunicorn with the server profile in config/gunicorn.py
+  # (SERVER_MODE=asgi for uvicorn workers, GUNICORN_* variables to tune it)
+  exec gunicorn -c python:config.gunicorn
 fi
@@ -0,0 +1,27 @@
+from config.async_api import async_read_view, not_found, render
+from config.conditional import async_conditional
+from config.fieldsets import requested_fields, select_fields
+from users.models import Profile
+from users.serializer import ProfileSerializer
+from users.views import ProfileDetailView
+
+"""
+
+Async version of the profile detail, used when ASYNC_READ_VIEWS is on.
+Updates still go through the DRF view.
+
+"""
+
+
+@async_conditional(lambda request, user_id: Profile.validators(user_id))
+@async_read_view(ProfileDetailView.as_view())
+async def profile_detail(request, user_id):
+    fields = requested_fields(request.GET, ProfileSerializer)
+    profiles = Profile.objects.filter(user__id=user_id)
+    profile = await select_fields(profiles, ProfileSerializer, fields).afirst()
+    if profile is None:
+        return not_found(Profile)
+    serializer = ProfileSerializer(
+        profile, context={"request": request, "fields": fields}
+    )
+    return render(serializer.data)
@@ -0,0 +1,205 @@
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from config import background
+from users.storage import get_avatar_storage
+
+logger = logging.getLogger(__name__)
+
+"""
+
+Resized copies of the profile avatars.
+
+After an upload the profile is saved as-is and the response goes back at once;
+the variants (one JPEG and one WebP per size in settings.AVATAR_VARIANT_SIZES)
+are made afterwards by a small thread pool. The source image is decoded only
+once, at reduced scale for JPEG (Image.draft), and then shrunk step by step
+from the largest size to the smallest, so memory use stays bounded even for
+large photos.
+
+Avatar files are content-addressed (see avatar_upload_path), so one file and
+its variants can be shared by several profiles; AvatarFile counts the users of
+each file and the files are deleted only when that count drops to zero.
+
+"""
+
+VARIANT_FORMATS = {
+    "jpeg": {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True},
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+}
+
+
+# Storage name of one variant, named after its original,
+# e.g. avatars/3f/variants/3f9a…c1_40.webp for avatars/3f/3f9a…c1.jpg
+def variant_name(avatar_name, size, extension):
+    directory, filename = os.path.split(avatar_name)
+    stem = os.path.splitext(filename)[0]
+    extension = "jpg" if extension == "jpeg" else extension
+    return f"{directory}/variants/{stem}_{size}.{extension}"
+
+
+# Decode the avatar once and yield (size, image) from the largest to the smallest
+def _resized_images(source, sizes):
+    sizes = sorted(sizes, reverse=True)
+    with Image.open(source) as image:
+        image.draft("RGB", (sizes[0], sizes[0]))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        for size in sizes:
+            image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            yield size, image
+
+
+# Make every variant of one avatar file and return {size: {format: name}};
+# with rebuild, existing files are overwritten (a variant's name does not
+# change with VARIANT_FORMATS, so a plain save would keep the old file)
+def build_variants(storage, avatar_name, sizes=None, rebuild=False):
+    sizes = sizes or settings.AVATAR_VARIANT_SIZES
+    save = storage.replace if rebuild else storage.save
+    variants = {}
+    with storage.open(avatar_name, "rb") as source:
+        for size, image in _resized_images(source, sizes):
+            variants[str(size)] = {}
+            for extension, options in VARIANT_FORMATS.items():
+                buffer = BytesIO()
+                image.save(buffer, **options)
+                variants[str(size)][extension] = save(
+                    variant_name(avatar_name, size, extension),
+                    ContentFile(buffer.getvalue()),
+                )
+    return variants
+
+
+# Names of every variant of an avatar, whether or not they have been made yet
+def all_variant_names(avatar_name):
+    return {
+        str(size): {
+            extension: variant_name(avatar_name, size, extension)
+            for extension in VARIANT_FORMATS
+        }
+        for size in settings.AVATAR_VARIANT_SIZES
+    }
+
+
+def delete_variants(storage, variants):
+    for formats in (variants or {}).values():
+        for name in formats.values():
+            if storage.exists(name):
+                storage.delete(name)
+
+
+# Build the variants of a profile's current avatar and store their names on it;
+# rebuild encodes them again even if they exist
+def generate_avatar_variants(profile_id, rebuild=False):
+    from users.models import Profile
+
+    profile = Profile.objects.filter(pk=profile_id).only("avatar").first()
+    if profile is None or not profile.avatar:
+        return None
+    avatar_name = profile.avatar.name
+    storage = profile.avatar.storage
+
+    # Another profile with the same avatar may have made the variants already
+    variants = all_variant_names(avatar_name)
+    names = [name for formats in variants.values() for name in formats.values()]
+    if rebuild or not all(storage.exists(name) for name in names):
+        variants = build_variants(storage, avatar_name, rebuild=rebuild)
+
+    # The avatar may have been replaced while we were working; its files are
+    # then cleaned up by release_avatar
+    Profile.objects.filter(pk=profile_id, avatar=avatar_name).update(
+        avatar_variants=variants, updated_at=timezone.now()
+    )
+    return variants
+
+
+def _is_default_avatar(name):
+    from users.models import Profile
+
+    return not name or name == Profile._meta.get_field("avatar").default
+
+
+# Record that `count` more profiles use the avatar file `name`. One statement:
+# a release_avatar that locked the row either commits first (the row is then
+# inserted again) or sees the new count, never a row deleted in between
+def acquire_avatar(name, count=1):
+    from users.models import AvatarFile
+
+    if _is_default_avatar(name):
+        return
+    table = AvatarFile._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (name, ref_count) VALUES (%s, %s) "
+            f"ON CONFLICT (name) DO UPDATE "
+            f"SET ref_count = {table}.ref_count + EXCLUDED.ref_count",
+            [name, count],
+        )
+
+
+def _delete_avatar_files(name):
+    from users.models import AvatarFile
+
+    # Someone may have uploaded the same content again in the meantime
+    if AvatarFile.objects.filter(name=name).exists():
+        return
+    storage = get_avatar_storage()
+    delete_variants(storage, all_variant_names(name))
+    if storage.exists(name):
+        storage.delete(name)
+
+
+# Record that one profile stopped using `name`; delete the files if it was the last
+def release_avatar(name):
+    from users.models import AvatarFile, Profile
+
+    if _is_default_avatar(name):
+        return
+    with transaction.atomic():
+        avatar_file = AvatarFile.objects.select_for_update().filter(name=name).first()
+        if avatar_file is None:
+            # Untracked file: keep it while any profile still points at it
+            if Profile.objects.filter(avatar=name).exists():
+                return
+        elif avatar_file.ref_count > 1:
+            avatar_file.ref_count -= 1
+            avatar_file.save(update_fields=["ref_count"])
+            return
+        else:
+            avatar_file.delete()
+        transaction.on_commit(lambda: _delete_avatar_files(name))
+
+
+def _run_in_background(profile_id):
+    try:
+        generate_avatar_variants(profile_id)
+    except Exception:
+        logger.exception("Could not build avatar variants for profile %s", profile_id)
+
+
+# Queue the variants for a profile once the current transaction commits
+def schedule_avatar_variants(profile):
+    if settings.AVATAR_PROCESSING == "inline":
+        transaction.on_commit(lambda: generate_avatar_variants(profile.pk))
+    else:
+        transaction.on_commit(
+            lambda: background.submit(
+                "avatar-variants",
+                _run_in_background,
+                profile.pk,
+                workers=settings.AVATAR_PROCESSING_WORKERS,
+            )
+        )
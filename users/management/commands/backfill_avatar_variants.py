@@ -0,0 +1,89 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from users.avatars import generate_avatar_variants
+from users.models import Profile
+
+"""
+
+Builds the resized avatar copies for profiles that do not have them yet,
+e.g. avatars uploaded before the variants existed.
+Use --force to rebuild every profile, for example after changing
+AVATAR_VARIANT_SIZES or the encoding options in users/avatars.py: the files
+of each avatar are encoded again once and overwritten in place, so every
+profile sharing the avatar gets the new ones.
+
+"""
+
+
+def _generate(profile_id, rebuild):
+    try:
+        return generate_avatar_variants(profile_id, rebuild)
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Generate resized avatar variants for existing profiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true", help="Rebuild existing variants too"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Threads used for resizing (0 works in this thread)",
+        )
+
+    def run_one(self, job):
+        profile_id, rebuild = job
+        try:
+            _generate(profile_id, rebuild)
+            return True
+        except Exception as error:
+            self.stderr.write(f"Profile {profile_id}: {error}")
+            return False
+
+    # (profile id, rebuild): with --force the files of an avatar shared by
+    # several profiles are rebuilt for the first of them only
+    def jobs(self, profiles, force):
+        rebuilt = set()
+        for profile_id, avatar in profiles:
+            yield profile_id, force and avatar not in rebuilt
+            rebuilt.add(avatar)
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(avatar="").exclude(avatar__isnull=True)
+        if not options["force"]:
+            profiles = profiles.filter(avatar_variants={})
+        profiles = profiles.order_by("pk").values_list("pk", "avatar")
+        jobs = self.jobs(profiles.iterator(), options["force"])
+
+        done = failed = 0
+        if options["workers"] > 0:
+            executor = ThreadPoolExecutor(max_workers=options["workers"])
+            results = executor.map(self.run_one, jobs)
+        else:
+            executor = None
+            results = map(self.run_one, jobs)
+        try:
+            for ok in results:
+                if ok:
+                    done += 1
+                else:
+                    failed += 1
+                if (done + failed) % 100 == 0:
+                    self.stdout.write(f"Processed {done + failed} profiles")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Done: {done} profiles updated, {failed} failed")
+        )
@@ -0,0 +1,215 @@
+import csv
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import MaxLengthValidator
+from django.db import transaction
+
+from users.avatars import acquire_avatar
+from users.models import Profile
+
+User = get_user_model()
+
+"""
+
+Bulk import of users from a CSV or JSONL file.
+
+Each row may contain: username, email, password (plain text) or password_hash
+(an already hashed value, e.g. from export_users), first_name, last_name, bio.
+Rows without a username or an email are skipped, as are rows that the model
+fields would reject (too long, a username with other characters than letters,
+digits and @/./+/-/_, an invalid email) and rows whose username or email is
+already taken. Rows are read as a stream and handled in chunks: the passwords of a chunk are
+hashed in a process pool, then the users and their profiles are created with
+bulk_create inside one transaction. bulk_create does not send post_save, so the
+Profile rows that the create_profile signal would make are created here.
+
+"""
+
+
+# Workers started with "spawn" must load Django before they can hash
+def _init_worker():
+    if not apps.ready:
+        django.setup()
+
+
+def _hash_password(password):
+    return make_password(password or None)
+
+
+# Raise ValidationError unless the row fits the fields it is written to
+def validate_row(row):
+    UnicodeUsernameValidator()(row["username"])
+    for name in ("username", "email", "first_name", "last_name"):
+        User._meta.get_field(name).clean(row.get(name) or "", None)
+    if row.get("avatar"):
+        MaxLengthValidator(Profile._meta.get_field("avatar").max_length)(row["avatar"])
+
+
+def _is_valid(row):
+    try:
+        validate_row(row)
+    except ValidationError:
+        return False
+    return True
+
+
+def read_rows(path, file_format):
+    with open(path, newline="", encoding="utf-8") as handle:
+        if file_format == "csv":
+            yield from csv.DictReader(handle)
+        else:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = "Import users and their profiles from a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="File format (guessed from the extension by default)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processes used for password hashing (0 hashes in this process)",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or (
+            "csv" if path.lower().endswith(".csv") else "jsonl"
+        )
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+
+        created = skipped = 0
+        pool = None
+        if options["workers"] > 0:
+            pool = ProcessPoolExecutor(
+                max_workers=options["workers"], initializer=_init_worker
+            )
+        try:
+            for chunk in chunked(read_rows(path, file_format), options["chunk_size"]):
+                rows = self.new_rows(chunk)
+                skipped += len(chunk) - len(rows)
+                hashes = self.hash_passwords(rows, pool)
+                created += self.create_chunk(rows, hashes)
+                self.stdout.write(f"Imported {created} users ({skipped} skipped)")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Done: {created} users created, {skipped} skipped")
+        )
+
+    # Drop rows without a username or an email, invalid rows, and rows whose
+    # username or email is already taken (one query per chunk)
+    def new_rows(self, chunk):
+        chunk = [
+            row
+            for row in chunk
+            if isinstance(row, dict)
+            and row.get("username")
+            and row.get("email")
+            and _is_valid(row)
+        ]
+        usernames = {row["username"] for row in chunk}
+        emails = {row["email"] for row in chunk}
+        taken = User.objects.filter(username__in=usernames).values_list(
+            "username", flat=True
+        )
+        taken_emails = User.objects.filter(email__in=emails).values_list(
+            "email", flat=True
+        )
+        seen_usernames, seen_emails = set(taken), set(taken_emails)
+        rows = []
+        for row in chunk:
+            if row["username"] in seen_usernames or row["email"] in seen_emails:
+                continue
+            seen_usernames.add(row["username"])
+            seen_emails.add(row["email"])
+            rows.append(row)
+        return rows
+
+    def hash_passwords(self, rows, pool):
+        hashes = [None] * len(rows)
+        plain = []
+        for index, row in enumerate(rows):
+            password_hash = row.get("password_hash")
+            if password_hash:
+                try:
+                    identify_hasher(password_hash)
+                except ValueError:
+                    raise CommandError(
+                        f"Unknown password hash for user {row['username']}"
+                    )
+                hashes[index] = password_hash
+            else:
+                plain.append(index)
+
+        passwords = [rows[index].get("password") for index in plain]
+        if pool is not None:
+            results = pool.map(
+                _hash_password, passwords, chunksize=max(1, len(passwords) // 32)
+            )
+        else:
+            results = map(_hash_password, passwords)
+        for index, password_hash in zip(plain, results):
+            hashes[index] = password_hash
+        return hashes
+
+    def create_chunk(self, rows, hashes):
+        if not rows:
+            return 0
+        users = [
+            User(
+                username=row["username"],
+                email=row["email"],
+                password=password_hash,
+                first_name=row.get("first_name") or "",
+                last_name=row.get("last_name") or "",
+            )
+            for row, password_hash in zip(rows, hashes)
+        ]
+        with transaction.atomic():
+            users = User.objects.bulk_create(users)
+            profiles = []
+            for user, row in zip(users, rows):
+                profile = Profile(user=user)
+                if row.get("bio"):
+                    profile.bio = row["bio"]
+                if row.get("avatar"):
+                    profile.avatar = row["avatar"]
+                profiles.append(profile)
+            Profile.objects.bulk_create(profiles)
+
+            # Shared avatar files are reference counted
+            avatars = Counter(row["avatar"] for row in rows if row.get("avatar"))
+            for name, count in avatars.items():
+                acquire_avatar(name, count)
+        return len(users)
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:07
+
+import users.models
+import users.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# Count the profiles that already point at each uploaded avatar
+def count_avatar_references(apps, schema_editor):
+    Profile = apps.get_model("users", "Profile")
+    AvatarFile = apps.get_model("users", "AvatarFile")
+    references = (
+        Profile.objects.exclude(avatar__in=["", "avatars/default.png"])
+        .exclude(avatar__isnull=True)
+        .values("avatar")
+        .annotate(count=Count("id"))
+    )
+    AvatarFile.objects.bulk_create(
+        AvatarFile(name=row["avatar"], ref_count=row["count"]) for row in references
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_profile_avatar_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AvatarFile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="profile",
+            name="avatar",
+            field=models.ImageField(
+                blank=True,
+                default="avatars/default.png",
+                null=True,
+                storage=users.storage.get_avatar_storage,
+                upload_to=users.models.avatar_upload_path,
+            ),
+        ),
+        migrations.RunPython(count_avatar_references, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,14 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+import hashlib
+import os
 import random
 from datetime import timedelta
 from django.utils import timezone
+from users.storage import get_avatar_storage
 
 
 # Create a model based on a Django class that has the main fields for the user
@@ -28,11 +31,17 @@ class User(AbstractUser):
     email = models.EmailField(blank=False, null=False, unique=True)
 
 
-# َAvatar path for profile
+# َAvatar path for profile, named after the SHA-256 of the uploaded bytes
 def avatar_upload_path(instance, filename):
-    if not instance.id:
-        instance.save()
-    return f"avatars/user_{instance.id}/{filename}"
+    digest = hashlib.sha256()
+    upload = instance.avatar.file
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    extension = os.path.splitext(filename)[1].lower()
+    extension = ".jpg" if extension == ".jpeg" else extension
+    name = digest.hexdigest()
+    return f"avatars/{name[:2]}/{name}{extension}"
 
 
 """
@@ -53,8 +62,83 @@ class Profile(models.Model):
         blank=True,
         null=True,
         upload_to=avatar_upload_path,
+        storage=get_avatar_storage,
         default="avatars/default.png",
     )
+    # Names of the resized copies of the avatar, filled in by users/avatars.py
+    avatar_variants = models.JSONField(default=dict, blank=True)
+    # Kept up to date by the follow endpoint; decides how the author's posts reach feeds
+    followers_count = models.PositiveIntegerField(default=0)
+    # Version stamp of everything the profile endpoint shows (user fields included)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Strong ETag and Last-Modified of one profile, from a single narrow query
+    @classmethod
+    def validators(cls, user_id):
+        row = (
+            cls.objects.filter(user_id=user_id).values_list("pk", "updated_at").first()
+        )
+        if row is None:
+            return None
+        pk, updated_at = row
+        return f"profile-{pk}-{int(updated_at.timestamp() * 1000000)}", updated_at
+
+    # Record a change made outside Profile.save() (e.g. to the user's email)
+    @classmethod
+    def touch(cls, **filters):
+        cls.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+"""
+
+Number of profiles that use each stored avatar file.
+Identical uploads share one file, so a file may only be deleted
+when the last profile using it lets go of it (see users/avatars.py).
+
+"""
+
+
+class AvatarFile(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+"""
+
+One user following another. The posts of the followed user are copied to the
+follower's home timeline (see blogs/feed.py). Both lookups, "who follows X"
+for the fan-out and "whom does X follow" for the feed, are covered by the two
+composite indexes.
+
+"""
+
+
+class Follow(models.Model):
+    follower = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="following", db_index=False
+    )
+    followee = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="followers", db_index=False
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["follower", "followee"], name="unique_follow"
+            ),
+            models.CheckConstraint(
+                condition=~models.Q(follower=models.F("followee")),
+                name="no_self_follow",
+            ),
+        ]
+        indexes = [models.Index(fields=["followee", "follower"], name="follow_fanout")]
+
+    def __str__(self):
+        return f"{self.follower_id} follows {self.followee_id}"
 
 
 # Signal for automatic profile creation after registration
@@ -64,6 +148,15 @@ def create_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 
+# A deleted profile no longer uses its avatar file
+@receiver(post_delete, sender=Profile)
+def release_profile_avatar(sender, instance, **kwargs):
+    from users.avatars import release_avatar
+
+    if instance.avatar:
+        release_avatar(instance.avatar.name)
+
+
 # This model is for email authentication and updating it with a random 6-digit code
 class EmailVerification(models.Model):
     user = models.ForeignKey(
@@ -4,6 +4,8 @@ from django.core.mail import send_mail
 from rest_framework import serializers
 from rest_framework.exceptions import PermissionDenied
 
+from config.fieldsets import FieldQuery, SparseFieldsetMixin
+from users.avatars import acquire_avatar, release_avatar, schedule_avatar_variants
 from users.models import Profile, EmailVerification, ForgetPasswordCode
 
 # Creating access to the model in this module
@@ -63,7 +65,7 @@ Fields that are read from the user model:
 """
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     # Fields that are read from the user model
     email = serializers.ReadOnlyField(
@@ -74,6 +76,15 @@ class ProfileSerializer(serializers.ModelSerializer):
     remove_avatar = serializers.BooleanField(
         write_only=True, required=False, default=False
     )
+    avatar_variants = serializers.SerializerMethodField()
+
+    # The user row is only joined for the fields read from it
+    field_queries = {
+        "email": FieldQuery(columns=["user__email"], related=["user"]),
+        "first_name": FieldQuery(columns=["user__first_name"], related=["user"]),
+        "last_name": FieldQuery(columns=["user__last_name"], related=["user"]),
+        "avatar_variants": FieldQuery(columns=["avatar", "avatar_variants"]),
+    }
 
     class Meta:
         model = Profile
@@ -84,8 +95,25 @@ class ProfileSerializer(serializers.ModelSerializer):
             "email",
             "bio",
             "avatar",
+            "avatar_variants",
+            "followers_count",
             "remove_avatar",
         ]
+        read_only_fields = ["followers_count"]
+
+    # URLs of the resized avatars, empty until the background step has made them
+    def get_avatar_variants(self, obj):
+        storage = obj.avatar.storage
+        request = self.context.get("request")
+        variants = {}
+        for size, formats in (obj.avatar_variants or {}).items():
+            variants[size] = {}
+            for extension, name in formats.items():
+                url = storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants[size][extension] = url
+        return variants
 
     def update(self, instance, validated_data):
 
@@ -99,32 +127,34 @@ class ProfileSerializer(serializers.ModelSerializer):
         instance.user.save()
 
         default_avatar_path = "avatars/default.png"  # Your default photo path
+        old_avatar_name = instance.avatar.name if instance.avatar else None
 
-        # Delete avatar
+        # Delete avatar (the file itself goes once no other profile uses it)
         if validated_data.get("remove_avatar", False):
-            if instance.avatar and instance.avatar.name != default_avatar_path:
-                instance.avatar.delete(save=False)
             instance.avatar = default_avatar_path
+            instance.avatar_variants = {}
             instance.save()
+            release_avatar(old_avatar_name)
             return instance
 
         # Update avatar
         new_avatar = validated_data.get("avatar", None)
         if new_avatar:
-            # If an avatar already exists for the user, it will delete it and replace it with the new avatar
-            old_avatar = instance.avatar
-            if (
-                old_avatar
-                and old_avatar.name != new_avatar.name
-                and old_avatar.name != default_avatar_path
-            ):
-                old_avatar.delete(save=False)
             instance.avatar = new_avatar
+            instance.avatar_variants = {}
 
         # Update your profile fields
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
+
+        # Identical uploads share one stored file, counted per profile
+        if new_avatar:
+            acquire_avatar(instance.avatar.name)
+            release_avatar(old_avatar_name)
+
+            # The resized copies are made after the response has been sent
+            schedule_avatar_variants(instance)
         return instance
 
 
@@ -248,6 +278,7 @@ class VerifyEmailChangeSerializer(serializers.Serializer):
         # Update user email
         user.email = self.validated_data["new_email"]
         user.save()
+        Profile.touch(user=user)
 
         return user
 
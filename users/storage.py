@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+"""
+
+Storage for content-addressed files (the name is derived from the bytes).
+Two files with the same name always have the same content, so saving a name
+that already exists keeps the stored copy instead of writing a second one.
+Files whose name does not cover everything that made them (the avatar
+variants, named after their original) are rewritten with replace().
+
+"""
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    # Never rename: an existing file with this name already holds these bytes
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # Another worker stored the same content at the same moment
+            return name
+
+    # Overwrite the file at this name; readers get the old bytes or the new
+    # ones, never a partly written file
+    def replace(self, name, content):
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(handle, "wb") as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        return name
+
+
+avatar_storage = ContentAddressedStorage()
+
+
+# Used as the storage of Profile.avatar (a callable keeps migrations stable)
+def get_avatar_storage():
+    return avatar_storage
@@ -1,4 +1,8 @@
-from io import BytesIO
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
 from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
@@ -6,14 +10,31 @@ from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils import timezone
 from datetime import timedelta
-from users.models import Profile, EmailVerification, ForgetPasswordCode
+from users.models import AvatarFile, Profile, EmailVerification, ForgetPasswordCode
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from django.conf import settings
+from django.core.management import call_command
+from django.test import RequestFactory, override_settings
+from config.views import serve_media
+from asgiref.sync import async_to_sync
+from users.async_views import profile_detail
+from users.avatars import VARIANT_FORMATS
+from users.throttling import FailedAttemptAccountThrottle, get_counter_store
+from users.views import LoginView
 
 
 User = get_user_model()
 
+# The failed-attempt counters of the tests, kept apart from those of a dev server
+TEST_COUNTER_STORE = {
+    "BACKEND": "users.throttling.SQLiteCounterStore",
+    "LOCATION": os.path.join(tempfile.gettempdir(), "blog-throttle-tests.sqlite3"),
+}
+
 
 # This class is for testing the (user app) and (authentication)
+@override_settings(THROTTLE_COUNTER_STORE=TEST_COUNTER_STORE)
 class UserAuthTests(APITestCase):
 
     # Registration test and saving it in the database
@@ -196,6 +217,48 @@ class ProfileTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("bio", response.data)
 
+    # Profile fields that are not asked for are not read, nor is the user row
+    def test_profile_fields(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f"{self.url}?fields=bio,followers_count")
+        self.assertEqual(
+            response.json(), {"bio": self.profile.bio, "followers_count": 0}
+        )
+
+        response = self.client.get(f"{self.url}?exclude=bio,avatar_variants")
+        self.assertEqual(response.data["first_name"], "User")
+        self.assertNotIn("bio", response.data)
+
+        response = self.client.get(f"{self.url}?fields=remove_avatar")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Profiles carry validators, and a matching If-None-Match gets 304
+    def test_profile_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertIn("Last-Modified", response)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    # The async profile view answers with the same data and validators
+    def test_async_profile_detail(self):
+        sync_response = self.client.get(self.url)
+        response = async_to_sync(profile_detail)(
+            RequestFactory().get(self.url), user_id=self.user.id
+        )
+        self.assertEqual(json.loads(response.content), sync_response.json())
+        self.assertEqual(response["ETag"], sync_response["ETag"])
+
+    # Changing a user field moves the profile's ETag
+    def test_profile_etag_changes_on_update(self):
+        etag = self.client.get(self.url)["ETag"]
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        self.client.patch(self.url, {"first_name": "Changed"}, format="json")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["first_name"], "Changed")
+
     # The profile owner should be able to update their information
     def test_update_own_profile(self):
         refresh = RefreshToken.for_user(self.user)
@@ -274,7 +337,9 @@ class ProfileTests(APITestCase):
         response = self.client.put(self.url, {"avatar": img}, format="multipart")
         self.assertEqual(response.status_code, 200)
         self.user.profile.refresh_from_db()
-        self.assertIn("avatars/user_", self.user.profile.avatar.url)
+        self.assertRegex(
+            self.user.profile.avatar.url, r"avatars/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$"
+        )
         self.assertNotIn("default.png", self.user.profile.avatar.url)
 
     # The user can replace their own avatar
@@ -292,7 +357,9 @@ class ProfileTests(APITestCase):
         self.user.profile.refresh_from_db()
 
         # The new path must be different from the previous one
-        self.assertIn("avatars/user_", self.user.profile.avatar.url)
+        self.assertRegex(
+            self.user.profile.avatar.url, r"avatars/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$"
+        )
         self.assertNotIn("avatar1.jpg", self.user.profile.avatar.url)
 
     # The user can delete the photo and the default will be displayed
@@ -323,6 +390,7 @@ class ProfileTests(APITestCase):
 
 
 # This class is for testing email changes by the user
+@override_settings(THROTTLE_COUNTER_STORE=TEST_COUNTER_STORE)
 class EmailChangeTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -424,6 +492,7 @@ class EmailChangeTests(APITestCase):
 
 
 # This class is for testing reset password by the user
+@override_settings(THROTTLE_COUNTER_STORE=TEST_COUNTER_STORE)
 class PasswordResetTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -490,3 +559,486 @@ class PasswordResetTests(APITestCase):
         }
         response = self.client.post("/api/auth/forget-password/change/", data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+THROTTLE_TEST_RATES = {
+    "login": "10/min",
+    "login_account": "3/min",
+    "reset_code": "10/min",
+    "reset_code_account": "3/min",
+    "email_code": "10/min",
+    "email_code_account": "3/min",
+}
+
+
+# This class is for testing the brute-force throttling of login and code checks
+@override_settings(
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": THROTTLE_TEST_RATES,
+    },
+    THROTTLE_COUNTER_STORE=TEST_COUNTER_STORE,
+)
+class BruteForceThrottleTests(APITestCase):
+    def setUp(self):
+        get_counter_store().clear()
+        # The counters read a fixed clock: a test running across the end of a
+        # real minute would see its count slide down
+        clock = mock.patch("users.throttling.time")
+        clock.start().time.return_value = 1_000_020.0
+        self.addCleanup(clock.stop)
+        self.user = User.objects.create_user(
+            username="Brute", password="OldPass123!", email="brute@example.com"
+        )
+
+    # After too many wrong passwords, even the right one is rejected without any query
+    def test_login_blocked_after_failed_attempts(self):
+        for _ in range(3):
+            response = self.client.post(
+                "/api/auth/login/", {"username": "Brute", "password": "Wrong123!"}
+            )
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                "/api/auth/login/", {"username": "Brute", "password": "OldPass123!"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    # Successful logins are not counted as failed attempts
+    def test_successful_logins_are_not_throttled(self):
+        for _ in range(5):
+            response = self.client.post(
+                "/api/auth/login/", {"username": "Brute", "password": "OldPass123!"}
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    # Guessing the reset code is blocked per account
+    def test_reset_code_guessing_blocked(self):
+        ForgetPasswordCode.objects.create(
+            user=self.user,
+            code="999999",
+            expires_at=timezone.now() + timedelta(minutes=5),
+        )
+        data = {
+            "email": "brute@example.com",
+            "code": "111111",
+            "new_password": "NewPass123!",
+            "confirm_password": "NewPass123!",
+        }
+        for _ in range(3):
+            response = self.client.post("/api/auth/forget-password/change/", data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        data["code"] = "999999"
+        with self.assertNumQueries(0):
+            response = self.client.post("/api/auth/forget-password/change/", data)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("OldPass123!"))
+
+    # The per-IP limit applies even when the account changes each time
+    def test_ip_limit_across_accounts(self):
+        for i in range(10):
+            self.client.post(
+                "/api/auth/login/", {"username": f"ghost{i}", "password": "Wrong123!"}
+            )
+        response = self.client.post(
+            "/api/auth/login/", {"username": "Brute", "password": "OldPass123!"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    # Attempts still being checked hold their place, so parallel guesses
+    # cannot all pass on the same count; a success gives its place back
+    def test_attempts_in_flight_are_counted(self):
+        view = LoginView()
+        request = view.initialize_request(
+            RequestFactory().post(
+                "/api/auth/login/",
+                {"username": "Brute", "password": "Wrong123!"},
+                content_type="application/json",
+            )
+        )
+        throttles = [FailedAttemptAccountThrottle() for _ in range(5)]
+        allowed = [throttle.allow_request(request, view) for throttle in throttles]
+        self.assertEqual(allowed, [True, True, True, False, False])
+
+        for throttle in throttles[1:]:
+            throttle.release()
+        response = self.client.post(
+            "/api/auth/login/", {"username": "Brute", "password": "OldPass123!"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(
+            "/api/auth/login/", {"username": "Brute", "password": "OldPass123!"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    # A released attempt leaves its window, also once that window has ended
+    def test_counter_store_decr(self):
+        store = get_counter_store()
+        store.incr("key", 60, now=1_000_000.0)
+        store.incr("key", 60, now=1_000_001.0)
+        store.decr("key", 60, now=1_000_002.0)
+        self.assertEqual(store.get("key", 60, now=1_000_002.0), 1)
+        store.decr("key", 60, now=1_000_070.0)
+        store.decr("key", 60, now=1_000_070.0)
+        self.assertEqual(store.get("key", 60, now=1_000_070.0), 0)
+
+    # A client cannot pick its own address with X-Forwarded-For (NUM_PROXIES is 0)
+    def test_forwarded_for_is_not_trusted(self):
+        for i in range(10):
+            self.client.post(
+                "/api/auth/login/",
+                {"username": f"ghost{i}", "password": "Wrong123!"},
+                HTTP_X_FORWARDED_FOR=f"203.0.113.{i}",
+            )
+        response = self.client.post(
+            "/api/auth/login/",
+            {"username": "Brute", "password": "OldPass123!"},
+            HTTP_X_FORWARDED_FOR="198.51.100.1",
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+# This class is for testing the bulk import and export commands
+class BulkUserImportExportTests(APITestCase):
+
+    def write_file(self, suffix, content):
+        handle = tempfile.NamedTemporaryFile(
+            "w", suffix=suffix, delete=False, encoding="utf-8"
+        )
+        handle.write(content)
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+    # Imported users get a profile and a usable password
+    def test_import_csv_creates_users_and_profiles(self):
+        path = self.write_file(
+            ".csv",
+            "username,email,password,first_name,last_name,bio\n"
+            "bulk1,bulk1@example.com,Bulk123!,Bulk,One,First bio\n"
+            "bulk2,bulk2@example.com,Bulk456!,Bulk,Two,\n",
+        )
+        call_command("import_users", path, workers=2, chunk_size=1, stdout=StringIO())
+
+        user = User.objects.get(username="bulk1")
+        self.assertTrue(user.check_password("Bulk123!"))
+        self.assertEqual(user.profile.bio, "First bio")
+        self.assertEqual(
+            User.objects.get(username="bulk2").profile.avatar.name,
+            "avatars/default.png",
+        )
+
+    # Existing usernames or emails are skipped instead of failing the chunk
+    def test_import_skips_existing_users(self):
+        User.objects.create_user(
+            username="bulk1", email="bulk1@example.com", password="Bulk123!"
+        )
+        path = self.write_file(
+            ".jsonl",
+            '{"username": "bulk1", "email": "other@example.com", "password": "x"}\n'
+            '{"username": "bulk3", "email": "bulk3@example.com", "password": "x"}\n',
+        )
+        call_command("import_users", path, workers=0, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith="bulk").count(), 2)
+        self.assertTrue(Profile.objects.filter(user__username="bulk3").exists())
+
+    # Rows without a username or an email are skipped, not fatal
+    def test_import_skips_incomplete_rows(self):
+        path = self.write_file(
+            ".csv",
+            "username,email,password\n"
+            "bulk1,,Bulk123!\n"
+            "bulk2\n"
+            "bulk3,bulk3@example.com,Bulk123!\n",
+        )
+        output = StringIO()
+        call_command("import_users", path, workers=0, stdout=output)
+        self.assertIn("1 users created, 2 skipped", output.getvalue())
+        self.assertEqual(
+            list(User.objects.values_list("username", flat=True)), ["bulk3"]
+        )
+
+        path = self.write_file(
+            ".jsonl",
+            '{"email": "bulk4@example.com", "password": "x"}\n'
+            '{"username": "bulk5", "email": "bulk5@example.com", "password": "x"}\n',
+        )
+        call_command("import_users", path, workers=0, stdout=StringIO())
+        self.assertTrue(User.objects.filter(username="bulk5").exists())
+
+    # Rows the model fields would reject are skipped instead of failing the chunk
+    def test_import_skips_invalid_rows(self):
+        path = self.write_file(
+            ".csv",
+            "username,email,password,first_name,avatar\n"
+            f"{'long' * 6},long@example.com,x,,\n"
+            "with space,space@example.com,x,,\n"
+            "bademail,not-an-email,x,,\n"
+            f"longname,longname@example.com,x,{'n' * 151},\n"
+            f"longavatar,longavatar@example.com,x,,{'a' * 101}\n"
+            "valid,valid@example.com,x,Valid,\n",
+        )
+        output = StringIO()
+        call_command("import_users", path, workers=0, chunk_size=10, stdout=output)
+        self.assertIn("1 users created, 5 skipped", output.getvalue())
+        self.assertEqual(
+            list(User.objects.values_list("username", flat=True)), ["valid"]
+        )
+
+    # The export keeps the hash, so the file can be imported again
+    def test_export_round_trip(self):
+        User.objects.create_user(
+            username="exported", email="exported@example.com", password="Bulk123!"
+        )
+        output = StringIO()
+        call_command("export_users", stdout=output, stderr=StringIO())
+        rows = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(rows[0]["username"], "exported")
+
+        User.objects.all().delete()
+        path = self.write_file(".jsonl", output.getvalue())
+        call_command("import_users", path, workers=0, stdout=StringIO())
+        self.assertTrue(
+            User.objects.get(username="exported").check_password("Bulk123!")
+        )
+
+
+# This class is for testing the resized avatar variants
+@override_settings(AVATAR_PROCESSING="inline", MEDIA_ROOT=tempfile.mkdtemp())
+class AvatarVariantTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="pic", email="pic@test.com", password="123456!Ab"
+        )
+        self.url = f"/api/auth/profile/{self.user.id}/"
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+    def generate_photo(self, name="photo.jpg", color=(200, 30, 30)):
+        file = BytesIO()
+        Image.new("RGB", (600, 400), color).save(file, "JPEG")
+        return SimpleUploadedFile(name, file.getvalue(), content_type="image/jpeg")
+
+    # After the upload commits, every size exists as JPEG and WebP
+    def test_upload_builds_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                self.url, {"avatar": self.generate_photo()}, format="multipart"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(set(profile.avatar_variants), {"40", "128", "256"})
+        storage = profile.avatar.storage
+        with storage.open(profile.avatar_variants["40"]["webp"]) as variant:
+            self.assertLessEqual(max(Image.open(variant).size), 40)
+
+        response = self.client.get(self.url)
+        self.assertTrue(
+            response.data["avatar_variants"]["128"]["jpeg"].endswith(".jpg")
+        )
+
+    # Replacing the avatar removes the variants of the old one
+    def test_replace_avatar_deletes_old_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                self.url, {"avatar": self.generate_photo("one.jpg")}, format="multipart"
+            )
+        profile = Profile.objects.get(user=self.user)
+        old_variant = profile.avatar_variants["40"]["jpeg"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                self.url,
+                {"avatar": self.generate_photo("two.jpg", (30, 30, 200))},
+                format="multipart",
+            )
+        self.assertFalse(profile.avatar.storage.exists(old_variant))
+
+    # The backfill command fills in profiles that have no variants yet
+    def test_backfill_command(self):
+        profile = Profile.objects.get(user=self.user)
+        profile.avatar = self.generate_photo("old.jpg")
+        profile.save()
+        self.assertEqual(profile.avatar_variants, {})
+
+        call_command("backfill_avatar_variants", workers=0, stdout=StringIO())
+        profile.refresh_from_db()
+        self.assertIn("256", profile.avatar_variants)
+
+    # --force encodes the variants again with the current options
+    def test_backfill_force_overwrites_variants(self):
+        profile = Profile.objects.get(user=self.user)
+        profile.avatar = self.generate_photo("old.jpg")
+        profile.save()
+        call_command("backfill_avatar_variants", workers=0, stdout=StringIO())
+        profile.refresh_from_db()
+        storage = profile.avatar.storage
+        name = profile.avatar_variants["256"]["jpeg"]
+        with storage.open(name) as variant:
+            before = variant.read()
+
+        jpeg = {**VARIANT_FORMATS["jpeg"], "quality": 20}
+        with mock.patch.dict(VARIANT_FORMATS, {"jpeg": jpeg}):
+            call_command("backfill_avatar_variants", workers=0, stdout=StringIO())
+            with storage.open(name) as variant:
+                self.assertEqual(variant.read(), before)
+            call_command(
+                "backfill_avatar_variants", force=True, workers=0, stdout=StringIO()
+            )
+        profile.refresh_from_db()
+        self.assertEqual(profile.avatar_variants["256"]["jpeg"], name)
+        with storage.open(name) as variant:
+            self.assertLess(len(variant.read()), len(before))
+
+
+# This class is for testing the content-addressed avatar files
+@override_settings(AVATAR_PROCESSING="inline", MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedAvatarTests(APITestCase):
+    def setUp(self):
+        self.first = User.objects.create_user(
+            username="first", email="first@test.com", password="123456!Ab"
+        )
+        self.second = User.objects.create_user(
+            username="second", email="second@test.com", password="123456!Ab"
+        )
+
+    def login(self, user):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+    def upload(self, user, content, name="photo.jpg"):
+        self.login(user)
+        file = SimpleUploadedFile(name, content, content_type="image/jpeg")
+        response = self.client.put(
+            f"/api/auth/profile/{user.id}/", {"avatar": file}, format="multipart"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return Profile.objects.get(user=user).avatar
+
+    def photo_bytes(self, color):
+        file = BytesIO()
+        Image.new("RGB", (8, 8), color).save(file, "JPEG")
+        return file.getvalue()
+
+    # Two identical uploads share one file, which outlives the first removal
+    def test_identical_uploads_are_deduplicated(self):
+        content = self.photo_bytes((0, 0, 255))
+        first = self.upload(self.first, content, "a.jpg")
+        second = self.upload(self.second, content, "b.jpg")
+        self.assertEqual(first.name, second.name)
+        self.assertEqual(AvatarFile.objects.get(name=first.name).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(self.first, self.photo_bytes((0, 255, 0)))
+        self.assertTrue(first.storage.exists(first.name))
+
+        self.login(self.second)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f"/api/auth/profile/{self.second.id}/",
+                {"remove_avatar": True},
+                format="json",
+            )
+        self.assertFalse(first.storage.exists(first.name))
+        self.assertFalse(AvatarFile.objects.filter(name=first.name).exists())
+
+    # Content-addressed media is served with a far-future immutable header
+    def test_media_cache_headers(self):
+        avatar = self.upload(self.first, self.photo_bytes((255, 0, 0)))
+        response = serve_media(RequestFactory().get(avatar.url), avatar.name)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+
+
+# This class is for testing the media view (authorization, sendfile, ranges, validators)
+@override_settings(AVATAR_PROCESSING="inline", MEDIA_ROOT=tempfile.mkdtemp())
+class MediaServingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="media", email="media@test.com", password="123456!Ab"
+        )
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        photo = BytesIO()
+        Image.new("RGB", (300, 300), (10, 20, 30)).save(photo, "JPEG")
+        self.content = photo.getvalue()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(
+                f"/api/auth/profile/{self.user.id}/",
+                {"avatar": SimpleUploadedFile("me.jpg", self.content, "image/jpeg")},
+                format="multipart",
+            )
+        self.profile = Profile.objects.get(user=self.user)
+        self.url = self.profile.avatar.url
+        self.client.credentials()
+
+    # Whole file with validators; a matching ETag answers 304
+    def test_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertIn("Last-Modified", response)
+
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn("immutable", cached["Cache-Control"])
+        cached = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_ranges(self):
+        size = len(self.content)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{size}")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(b"".join(response.streaming_content), self.content[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), self.content[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={size}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{size}")
+
+        # A range of another version of the file gets the whole current file
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"old"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_proxy_headers(self):
+        name = self.profile.avatar.name
+        with override_settings(MEDIA_SENDFILE="x-accel-redirect"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{name}")
+        self.assertEqual(response.content, b"")
+
+        with override_settings(MEDIA_SENDFILE="x-sendfile"):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response["X-Sendfile"], os.path.join(settings.MEDIA_ROOT, name)
+        )
+
+    # Only files used by a profile are served
+    def test_unknown_files(self):
+        variant = self.profile.avatar_variants["40"]["webp"]
+        response = self.client.get(f"{settings.MEDIA_URL}{variant}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        stray = os.path.join(settings.MEDIA_ROOT, "avatars", "stray.jpg")
+        with open(stray, "wb") as file:
+            file.write(self.content)
+        for path in ("avatars/stray.jpg", "../etc/passwd", "avatars/../../x"):
+            response = self.client.get(f"{settings.MEDIA_URL}{path}")
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
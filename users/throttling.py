@@ -0,0 +1,291 @@
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+"""
+
+Brute-force protection for the login and 6-digit code endpoints.
+
+Only failed attempts are counted. An attempt reserves its place with an
+atomic increment before the secret is checked and gives it back unless it
+fails, so parallel guesses cannot all pass on the same count. Each counter is a sliding window built from
+two fixed windows (the current one and the previous one, weighted by how much
+of it still overlaps the sliding window), so every key costs one small record
+instead of a list of timestamps.
+Checking the counters happens before authentication, serializers and password
+hashing, so a blocked request never touches the ORM or PBKDF2.
+
+"""
+
+
+# Work out the sliding-window estimate from the stored fixed-window counters
+def _sliding_count(window_index, current, previous, now, window):
+    now_index = int(now // window)
+    if now_index == window_index + 1:
+        current, previous = 0, current
+    elif now_index != window_index:
+        current, previous = 0, 0
+    overlap = 1 - (now % window) / window
+    return previous * overlap + current
+
+
+"""
+
+Counter store kept in a SQLite file, so that every gunicorn worker on the host
+sees the same counters without any external service.
+The counters are not precious, so the file runs in WAL mode without fsync.
+
+"""
+
+
+class SQLiteCounterStore:
+    def __init__(self, location):
+        self.location = location
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.location, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                " key TEXT PRIMARY KEY,"
+                " window_index INTEGER NOT NULL,"
+                " current INTEGER NOT NULL,"
+                " previous INTEGER NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def _read(self, connection, key):
+        return connection.execute(
+            "SELECT window_index, current, previous FROM counters WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+    def get(self, key, window, now=None):
+        now = time.time() if now is None else now
+        row = self._read(self._connection(), key)
+        if row is None:
+            return 0
+        return _sliding_count(*row, now, window)
+
+    def incr(self, key, window, now=None):
+        now = time.time() if now is None else now
+        now_index = int(now // window)
+        connection = self._connection()
+
+        # The write lock makes the read-modify-write atomic between workers
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._read(connection, key)
+            current, previous = 0, 0
+            if row is not None:
+                window_index, current, previous = row
+                if now_index == window_index + 1:
+                    current, previous = 0, current
+                elif now_index != window_index:
+                    current, previous = 0, 0
+            connection.execute(
+                "INSERT OR REPLACE INTO counters VALUES (?, ?, ?, ?)",
+                (key, now_index, current + 1, previous),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return _sliding_count(now_index, current + 1, previous, now, window)
+
+    # Take back one increment (in the window it went to, even if it just ended)
+    def decr(self, key, window, now=None):
+        now = time.time() if now is None else now
+        self._connection().execute(
+            "UPDATE counters SET current = current - 1"
+            " WHERE key = ? AND window_index >= ? AND current > 0",
+            (key, int(now // window) - 1),
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM counters")
+
+
+"""
+
+Counter store on top of a Django cache alias.
+With Redis or Memcached behind the alias the counters are shared between hosts,
+because add() and incr() are atomic there.
+
+"""
+
+
+class CacheCounterStore:
+    def __init__(self, location):
+        self.cache = caches[location or "default"]
+
+    def _keys(self, key, window, now):
+        now_index = int(now // window)
+        return f"{key}:{now_index}", f"{key}:{now_index - 1}"
+
+    def get(self, key, window, now=None):
+        now = time.time() if now is None else now
+        current_key, previous_key = self._keys(key, window, now)
+        values = self.cache.get_many([current_key, previous_key])
+        overlap = 1 - (now % window) / window
+        return values.get(previous_key, 0) * overlap + values.get(current_key, 0)
+
+    def incr(self, key, window, now=None):
+        now = time.time() if now is None else now
+        current_key, _ = self._keys(key, window, now)
+        if not self.cache.add(current_key, 1, timeout=window * 2):
+            self.cache.incr(current_key)
+        return self.get(key, window, now)
+
+    def decr(self, key, window, now=None):
+        now = time.time() if now is None else now
+        for cache_key in self._keys(key, window, now):
+            try:
+                if self.cache.decr(cache_key) < 0:
+                    self.cache.incr(cache_key)
+                    continue
+                return
+            except ValueError:
+                continue
+
+    def clear(self):
+        self.cache.clear()
+
+
+@lru_cache(maxsize=None)
+def _build_counter_store(backend, location):
+    return import_string(backend)(location)
+
+
+# Return the counter store configured in settings.THROTTLE_COUNTER_STORE
+def get_counter_store():
+    config = settings.THROTTLE_COUNTER_STORE
+    return _build_counter_store(config["BACKEND"], config.get("LOCATION"))
+
+
+"""
+
+Throttles that count failed attempts per client IP and per targeted account.
+The view sets `throttle_scope`; the IP throttle reads the rate of that scope
+and the account throttle reads the rate of `<scope>_account`, keyed on the
+request field named by `throttle_account_field`.
+
+"""
+
+
+class FailedAttemptThrottle(SimpleRateThrottle):
+    cache_format = "throttle_%(scope)s_%(ident)s"
+    scope_suffix = ""
+
+    def __init__(self):
+        # The rate depends on the view, so it is resolved in allow_request
+        pass
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_ident_for(self, request, view):
+        raise NotImplementedError(".get_ident_for() must be overridden")
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_for(request, view)
+        if not ident:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+    def _prepare(self, request, view):
+        base_scope = getattr(view, "throttle_scope", None)
+        if not base_scope:
+            return None
+        self.scope = base_scope + self.scope_suffix
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.rate is None:
+            return None
+        return self.get_cache_key(request, view)
+
+    # The attempt is counted first, so concurrent requests see each other
+    def allow_request(self, request, view):
+        self.key = self._prepare(request, view)
+        if self.key is None:
+            return True
+        self.count = get_counter_store().incr(self.key, self.duration)
+        return self.count <= self.num_requests
+
+    # Give the reserved attempt back (it did not fail)
+    def release(self):
+        if getattr(self, "key", None) is not None:
+            get_counter_store().decr(self.key, self.duration)
+            self.key = None
+
+    def wait(self):
+        return self.duration
+
+
+class FailedAttemptIPThrottle(FailedAttemptThrottle):
+    def get_ident_for(self, request, view):
+        return self.get_ident(request)
+
+
+class FailedAttemptAccountThrottle(FailedAttemptThrottle):
+    scope_suffix = "_account"
+
+    def get_ident_for(self, request, view):
+        field = getattr(view, "throttle_account_field", None)
+        value = request.data.get(field) if field else None
+        if not isinstance(value, str) or not value.strip():
+            return None
+        return value.strip().lower()
+
+
+"""
+
+Mixin for views that verify a secret (password or 6-digit code).
+The throttles run before authentication and permission checks and reserve the
+attempt; every response with a 400 or 401 status keeps it as a failed
+attempt, any other response (a success, a 429) gives it back.
+
+"""
+
+
+class BruteForceProtectedMixin:
+    throttle_classes = [FailedAttemptIPThrottle, FailedAttemptAccountThrottle]
+    failure_status_codes = (400, 401)
+
+    def initial(self, request, *args, **kwargs):
+        self._throttles_checked = False
+        self.check_throttles(request)
+        self._throttles_checked = True
+        super().initial(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        if not getattr(self, "_throttles_checked", False):
+            super().check_throttles(request)
+
+    # The same instances from the check to the response, they hold the keys
+    def get_throttles(self):
+        if not hasattr(self, "_throttles"):
+            self._throttles = super().get_throttles()
+        return self._throttles
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if response.status_code not in self.failure_status_codes:
+            for throttle in self.get_throttles():
+                throttle.release()
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -1,22 +1,32 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     RegisterView,
+    LoginView,
     LogoutView,
     ProfileDetailView,
+    FollowView,
     ChangePasswordView,
     RequestEmailChangeView,
     VerifyEmailChangeView,
     RequestPasswordResetView,
     ConfirmPasswordResetView,
 )
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
+
+# Under ASGI the profile detail is served by an async view (see users/async_views.py)
+if settings.ASYNC_READ_VIEWS:
+    from .async_views import profile_detail as profile_view
+else:
+    profile_view = ProfileDetailView.as_view()
 
 urlpatterns = [
     path("register/", RegisterView.as_view(), name="register"),
-    path("login/", TokenObtainPairView.as_view(), name="login"),
+    path("login/", LoginView.as_view(), name="login"),
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("logout/", LogoutView.as_view(), name="logout"),
-    path("profile/<int:user_id>/", ProfileDetailView.as_view(), name="user-profile"),
+    path("profile/<int:user_id>/", profile_view, name="user-profile"),
+    path("profile/<int:user_id>/follow/", FollowView.as_view(), name="user-follow"),
     path("change-password/", ChangePasswordView.as_view(), name="change-password"),
     path(
         "email/change/", RequestEmailChangeView.as_view(), name="request-email-change"
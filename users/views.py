@@ -1,9 +1,11 @@
 from django.contrib.auth import get_user_model
 from rest_framework import generics, status, permissions
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
 from users.serializer import (
     RegisterSerializer,
     ProfileSerializer,
@@ -13,8 +15,12 @@ from users.serializer import (
     RequestPasswordResetSerializer,
     ConfirmPasswordResetSerializer,
 )
+from blogs.feed import follow, unfollow
 from .models import Profile
 from .permissions import IsOwnerOrReadOnly
+from .throttling import BruteForceProtectedMixin
+from config.conditional import conditional_resource
+from config.fieldsets import SparseFieldsetViewMixin
 
 # Creating access to the model in this module
 User = get_user_model()
@@ -26,8 +32,16 @@ class RegisterView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
 
 
+# Login view that rejects brute-force attempts before the password is hashed
+class LoginView(BruteForceProtectedMixin, TokenObtainPairView):
+    throttle_scope = "login"
+    throttle_account_field = "username"
+
+
 # This view class is for displaying profile information and allowing the owner to modify it
-class ProfileDetailView(generics.RetrieveUpdateAPIView):
+# (answers If-None-Match / If-Modified-Since with 304 and checks If-Match on PUT/PATCH)
+@conditional_resource(lambda request, user_id: Profile.validators(user_id))
+class ProfileDetailView(SparseFieldsetViewMixin, generics.RetrieveUpdateAPIView):
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
     permission_classes = [IsOwnerOrReadOnly]
@@ -36,6 +50,26 @@ class ProfileDetailView(generics.RetrieveUpdateAPIView):
     lookup_field = "user__id"
     lookup_url_kwarg = "user_id"
 
+    def get_queryset(self):
+        return self.select_fields(super().get_queryset())
+
+
+# This class is for following and unfollowing another user (a second call unfollows)
+class FollowView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, user_id):
+        followee = get_object_or_404(User, pk=user_id)
+        if followee.pk == request.user.pk:
+            return Response(
+                {"message": "You cannot follow yourself"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if follow(request.user, followee):
+            return Response({"message": "Followed"}, status=status.HTTP_200_OK)
+        unfollow(request.user, followee)
+        return Response({"message": "Unfollowed"}, status=status.HTTP_200_OK)
+
 
 """
 
@@ -97,9 +131,11 @@ class RequestEmailChangeView(generics.GenericAPIView):
 
 
 # Key view for verifying the 6-digit code sent to the new email and saving the new email
-class VerifyEmailChangeView(generics.GenericAPIView):
+class VerifyEmailChangeView(BruteForceProtectedMixin, generics.GenericAPIView):
     serializer_class = VerifyEmailChangeSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = "email_code"
+    throttle_account_field = "new_email"
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(
@@ -138,9 +174,11 @@ class RequestPasswordResetView(generics.GenericAPIView):
 
 
 # Key view for verifying the 6-digit code sent to the user email and saving the new pass
-class ConfirmPasswordResetView(generics.GenericAPIView):
+class ConfirmPasswordResetView(BruteForceProtectedMixin, generics.GenericAPIView):
     serializer_class = ConfirmPasswordResetSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_scope = "reset_code"
+    throttle_account_field = "email"
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)